@@ -65,6 +65,9 @@ sudo -u "$REAL_USER" env PATH="$REAL_PATH" bash -c "\"$REAL_HOME/.local/bin/uv\"
 
 sudo -u "$REAL_USER" env PATH="$REAL_PATH" bash -c "source \"$VENV_DIR/bin/activate\" && \"$REAL_HOME/.local/bin/uv\" pip install \"git+https://github.com/OnisOris/scientia\""
 
+echo "Загружаем NLP модель..."
+sudo -u "$REAL_USER" env PATH="$REAL_PATH" bash -c "source \"$VENV_DIR/bin/activate\" && \"$REAL_HOME/.local/bin/uv\" pip install pip && python -m spacy download ru_core_news_md"
+
 echo "Создаём systemd unit файл /etc/systemd/system/scientia.service..."
 
 cat > /etc/systemd/system/scientia.service << EOF
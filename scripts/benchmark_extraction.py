@@ -0,0 +1,144 @@
+"""Сравнение стоимости извлечения концептов на одно предложение.
+
+Прежняя реализация (spaCy + повторная токенизация razdel и словарь
+POS-тегов) сравнивается с однопроходным Matcher из
+app.services.concept_extractor.
+
+Запуск: PYTHONPATH=src python scripts/benchmark_extraction.py [файл.txt]
+"""
+
+import argparse
+import statistics
+from time import perf_counter
+
+from razdel import sentenize, tokenize
+
+from app.services.concept_extractor import ALLOWED_ENT_TYPES, get_extractor
+from app.services.nlp_loader import NLP_MODEL, load_nlp_model
+from app.utils.text import normalize_text
+
+SAMPLE_TEXT = (
+    "Искусственная нейронная сеть состоит из связанных искусственных "
+    "нейронов. Глубокое обучение использует многослойные нейронные сети "
+    "для выделения признаков. Московский государственный университет "
+    "проводит исследования в области машинного обучения. Сверточные "
+    "нейронные сети применяются для распознавания изображений, а "
+    "рекуррентные сети обрабатывают последовательности. "
+) * 20
+
+
+def legacy_concepts(nlp, sentence: str) -> set:
+    """Прежний алгоритм _extract_concepts для одного предложения"""
+    concepts = set()
+    doc = nlp(sentence)
+
+    for ent in doc.ents:
+        if ent.label_ in ALLOWED_ENT_TYPES and len(ent.text) > 3:
+            concepts.add(normalize_text(ent.text))
+
+    tokens = [token.text for token in tokenize(sentence)]
+    pos_tags = {token.text: token.pos_ for token in doc}
+
+    for i in range(len(tokens)):
+        token = tokens[i]
+        if len(token) < 4:
+            continue
+
+        pos_tag = pos_tags.get(token, "")
+        if pos_tag in {"NOUN", "PROPN"}:
+            concepts.add(normalize_text(token))
+        if i < len(tokens) - 1:
+            next_token = tokens[i + 1]
+            next_pos = pos_tags.get(next_token, "")
+            if pos_tag == "ADJ" and next_pos in {"NOUN", "PROPN"}:
+                phrase = f"{token} {next_token}"
+                if len(phrase) > 7:
+                    concepts.add(normalize_text(phrase))
+        if i < len(tokens) - 2:
+            next_pos1 = pos_tags.get(tokens[i + 1], "")
+            next_pos2 = pos_tags.get(tokens[i + 2], "")
+            if (
+                pos_tag == "ADJ"
+                and next_pos1 == "ADJ"
+                and next_pos2 in {"NOUN", "PROPN"}
+            ):
+                phrase = f"{token} {tokens[i + 1]} {tokens[i + 2]}"
+                if len(phrase) > 10:
+                    concepts.add(normalize_text(phrase))
+
+    return concepts
+
+
+def run_legacy(nlp, sentences):
+    return [legacy_concepts(nlp, sentence) for sentence in sentences]
+
+
+def run_matcher(nlp, sentences, batch_size):
+    extractor = get_extractor(nlp)
+    return [
+        extractor.extract(doc)
+        for doc in nlp.pipe(sentences, batch_size=batch_size)
+    ]
+
+
+def measure(func, repeats):
+    timings = []
+    result = None
+    for _ in range(repeats):
+        started = perf_counter()
+        result = func()
+        timings.append(perf_counter() - started)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", help="Текстовый файл для замера")
+    parser.add_argument("--model", default=NLP_MODEL)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.path:
+        with open(args.path, encoding="utf-8") as file:
+            text = file.read()
+    else:
+        text = SAMPLE_TEXT
+
+    nlp = load_nlp_model(args.model)
+    sentences = [s.text for s in sentenize(text)]
+    count = len(sentences)
+
+    legacy_time, legacy = measure(
+        lambda: run_legacy(nlp, sentences), args.repeats
+    )
+    matcher_time, matched = measure(
+        lambda: run_matcher(nlp, sentences, args.batch_size), args.repeats
+    )
+
+    docs = list(nlp.pipe(sentences, batch_size=args.batch_size))
+    extractor = get_extractor(nlp)
+    match_only, _ = measure(
+        lambda: [extractor.extract(doc) for doc in docs], args.repeats
+    )
+
+    differences = sum(
+        1 for a, b in zip(legacy, matched) if a != set(b.values())
+    )
+
+    print(f"Предложений: {count}")
+    print(
+        f"legacy  (nlp + razdel): {legacy_time / count * 1e6:9.1f} мкс/предл."
+    )
+    print(
+        f"matcher (nlp.pipe):     {matcher_time / count * 1e6:9.1f} мкс/предл."
+    )
+    print(
+        f"matcher без разбора:    {match_only / count * 1e6:9.1f} мкс/предл."
+    )
+    print(f"Ускорение: x{legacy_time / matcher_time:.2f}")
+    print(f"Предложений с отличающимся результатом: {differences}")
+
+
+if __name__ == "__main__":
+    main()
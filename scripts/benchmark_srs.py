@@ -0,0 +1,130 @@
+"""Моделирование и замер планировщика интервальных повторений.
+
+Синтетические пользователи отвечают на карточки по модели памяти из
+app.services.srs_simulation, планировщик пересчитывает состояние тем же
+векторным движком, что и пакетные команды. Выводятся нагрузка
+повторений по дням, распределение удержания и скорость движка.
+
+С --save-baseline результат записывается в файл базовой линии. Без
+него результат сравнивается с базовой линией той же конфигурации:
+отличие в поведении (число повторений, среднее удержание) завершает
+скрипт с кодом 1. Скорость в базовой линии измерена на одной машине,
+поэтому падение скорости проверяется только с явным --tolerance, на
+той же машине, где базовая линия сохранена.
+
+Запуск: PYTHONPATH=src python scripts/benchmark_srs.py
+Масштаб: ... --users 100000 --days 730
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from app.services.srs_simulation import (
+    SimulationConfig,
+    benchmark_update_knowledge,
+    simulate,
+)
+
+BASELINE = Path(__file__).with_name("srs_baseline.json")
+
+
+def compare(
+    result: dict, baseline: dict, tolerance: float | None = None
+) -> list:
+    """Список расхождений с базовой линией, скорость - при tolerance"""
+    problems = []
+    if result["reviews"] != baseline["reviews"]:
+        problems.append(
+            f"число повторений {result['reviews']} "
+            f"вместо {baseline['reviews']}"
+        )
+    mean = result["retention"]["mean"]
+    expected = baseline["retention"]["mean"]
+    if abs(mean - expected) > 1e-6:
+        problems.append(f"среднее удержание {mean:.4f} вместо {expected:.4f}")
+    if tolerance is None:
+        return problems
+    for key in ("reviews_per_second", "update_knowledge_per_second"):
+        if result[key] < baseline[key] * (1 - tolerance):
+            problems.append(
+                f"{key}: {result[key]:.0f} против {baseline[key]:.0f}"
+            )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--cards", type=int, default=20)
+    parser.add_argument("--new-per-day", type=int, default=5)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="допустимое падение скорости, например 0.25",
+    )
+    args = parser.parse_args()
+
+    config = SimulationConfig(
+        users=args.users,
+        cards_per_user=args.cards,
+        new_cards_per_day=args.new_per_day,
+        days=args.days,
+        seed=args.seed,
+    )
+    report = simulate(config)
+    result = report.as_dict()
+    result["update_knowledge_per_second"] = benchmark_update_knowledge(
+        args.calls
+    )
+
+    load = result["daily_load"]
+    print(f"Пользователей: {config.users}, дней: {config.days}")
+    print(
+        f"Повторений: {report.reviews}, в день: среднее {load['mean']:.0f}, "
+        f"p95 {load['p95']:.0f}, максимум {load['max']}"
+    )
+    for name in ("retention", "recall"):
+        values = result[name]
+        print(
+            f"{name:9}: среднее {values['mean']:.3f}, p10 {values['p10']:.3f}"
+            f", p50 {values['p50']:.3f}, p90 {values['p90']:.3f}"
+        )
+    print(f"Движок: {report.reviews_per_second:,.0f} повторений/с")
+    print(
+        "update_knowledge: "
+        f"{result['update_knowledge_per_second']:,.0f} вызовов/с"
+    )
+
+    if args.save_baseline:
+        args.baseline.write_text(
+            json.dumps(result, indent=2, ensure_ascii=False) + "\n",
+            encoding="utf-8",
+        )
+        print(f"Базовая линия сохранена в {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline["config"] != result["config"]:
+        print("Конфигурация отличается от базовой линии, сравнения нет")
+        return
+
+    problems = compare(result, baseline, args.tolerance)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ Совпадает с базовой линией")
+
+
+if __name__ == "__main__":
+    main()
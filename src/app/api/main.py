@@ -1,16 +1,21 @@
+import asyncio
+import json
 import logging
 import os
 import uuid
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
 from uuid import UUID
 from typing import List, Dict
 
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
 
-from app.db import Session
+from app.db import Session, configure_engine, engine_metrics
+from app.db.query_stats import observe, track_queries
 from app.models.domains import Domain
 from app.models.user_domains import UserDomain
 from app.models.user_knowledge import UserKnowledge
@@ -20,17 +25,39 @@ from app.repositories.domain_repository import DomainRepository
 from app.repositories.profile_repository import ProfileRepository
 from app.repositories.retention_log_repository import RetentionLogRepository
 from app.repositories.user_domain_repository import UserDomainRepository
-from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+from app.repositories.user_knowledge_repository import (
+    UserKnowledgeRepository,
+    decode_cursor,
+    encode_cursor,
+)
 from app.repositories.concept_repository import ConceptRepository
+from app.repositories.job_repository import JobRepository
+from app.repositories.unit_of_work import UnitOfWork
 from app.repositories.user_repository import UserRepository
+from app.repositories.user_stats_repository import (
+    UserStatsRepository,
+    review_delta,
+    stats_delta,
+)
 from app.services.auth import (
     create_confirmation_token,
     verify_confirmation_token,
 )
+from app.services.due_queue import DueQueueService
+from app.services.knowledge_transfer import (
+    FORMATS as TRANSFER_FORMATS,
+    ImportFormatError,
+    export_knowledge,
+    import_knowledge,
+    parse_records,
+)
 from app.services.email import send_confirmation_email
+from app.services.nlp_loader import model_manager
+from app.services.review_forecast import ReviewForecastService
 from app.services.spaced_repetition import SpacedRepetitionService
 from app.models.retention_log import RetentionLog
 from app.services.text_processor import TextProcessorService
+from app.utils.metrics import CONTENT_TYPE, render
 
 
 class RegisterRequest(BaseModel):
@@ -53,7 +80,45 @@ logging.basicConfig(
 
 load_dotenv()
 
-app = FastAPI(title="Scientia API")
+NLP_WARMUP = os.getenv("NLP_WARMUP", "true").lower() in {"1", "true", "yes"}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_engine("api")
+    if NLP_WARMUP:
+        model_manager.start_warmup()
+    forecast_task = asyncio.create_task(review_forecast.run())
+    yield
+    review_forecast.stop()
+    await forecast_task
+
+
+class QueryCountMiddleware:
+    """Число запросов к БД и время в них по маршрутам для /metrics.
+
+    ASGI-приложение завершается после отправки последнего куска тела,
+    поэтому запросы потоковых ответов (NDJSON, выгрузка) тоже
+    учитываются.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track_queries() as stats:
+            await self.app(scope, receive, send)
+        route = getattr(scope.get("route"), "path", "unmatched")
+        observe(f"{scope['method']} {route}", stats)
+
+
+app = FastAPI(title="Scientia API", lifespan=lifespan)
+app.add_middleware(QueryCountMiddleware)
+due_queue = DueQueueService()
+review_forecast = ReviewForecastService()
 
 
 class AddRequest(BaseModel):
@@ -70,7 +135,8 @@ class CardResponse(BaseModel):
 class KnowledgeItemResponse(BaseModel):
     concept: str
     retention: float
-    next_review: datetime
+    next_review: datetime | None
+    concept_id: int | None = None
 
 
 class UserStatsResponse(BaseModel):
@@ -83,11 +149,81 @@ class UserStatsResponse(BaseModel):
     avg_reviews_per_concept: float
 
 
+class ForecastDay(BaseModel):
+    date: date
+    reviews: int
+
+
+class ForecastResponse(BaseModel):
+    generated_at: datetime
+    total: int
+    days: List[ForecastDay]
+
+
 class KnowledgeMapResponse(BaseModel):
     concepts: List[str]
     connections: Dict[str, List[str]]
     retention_levels: Dict[str, float]
-    next_reviews: Dict[str, datetime]
+    next_reviews: Dict[str, datetime | None]
+    next_cursor: str | None = None
+
+
+KNOWLEDGE_ORDERS = "^(due|next_review)$"
+KNOWLEDGE_STREAM_CHUNK = int(os.getenv("KNOWLEDGE_STREAM_CHUNK", "1000"))
+
+
+def parse_cursor(cursor: str | None):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+
+
+async def knowledge_page(knowledge_repo, user_id, cursor, limit):
+    """Страница карточек после cursor и курсор следующей страницы"""
+    rows = await knowledge_repo.knowledge_page(
+        user_id, parse_cursor(cursor), limit + 1
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].next_review, rows[-1].concept_id)
+    return rows, next_cursor
+
+
+async def knowledge_lines(user_id: UUID, after):
+    """Карточки пользователя построчно в NDJSON.
+
+    Сессия открывается здесь, а не в get_repos: ответ отправляется уже
+    после выхода из зависимостей.
+    """
+    async with Session() as session:
+        repo = UserKnowledgeRepository(session)
+        async for rows in repo.stream_knowledge(
+            user_id, after, KNOWLEDGE_STREAM_CHUNK
+        ):
+            yield "".join(
+                json.dumps(
+                    {
+                        "concept_id": row.concept_id,
+                        "concept": row.name,
+                        "retention": row.retention,
+                        "next_review": (
+                            row.next_review.isoformat()
+                            if row.next_review is not None
+                            else None
+                        ),
+                        "cursor": encode_cursor(
+                            row.next_review, row.concept_id
+                        ),
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+                for row in rows
+            )
 
 
 async def get_repos():
@@ -100,9 +236,57 @@ async def get_repos():
             "user_knowledge": UserKnowledgeRepository(session),
             "retention_logs": RetentionLogRepository(session),
             "concepts": ConceptRepository(session),
+            "user_stats": UserStatsRepository(session),
         }
 
 
+@app.get("/health/ready")
+async def health_ready():
+    nlp_status = model_manager.status()
+    ready = nlp_status["ready"] or not NLP_WARMUP
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "nlp": nlp_status},
+    )
+
+
+@app.get("/metrics/jobs")
+async def jobs_metrics():
+    """Глубина очереди фоновых задач и задержка по видам задач"""
+    async with Session() as session:
+        return await JobRepository(session).metrics()
+
+
+@app.get("/metrics/due_queue")
+async def due_queue_metrics():
+    """Размер и попадания очередей карточек в памяти"""
+    return due_queue.metrics()
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Гистограммы запросов к БД на обработчик в формате Prometheus"""
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/metrics/db")
+async def db_metrics():
+    """Пул соединений процесса API: ожидание, занятые, медленные запросы"""
+    return engine_metrics()
+
+
+@app.get("/forecast/reviews", response_model=ForecastResponse)
+async def system_review_forecast():
+    """Число повторений по дням у всех пользователей, считается в фоне"""
+    return await review_forecast.system()
+
+
+@app.get("/users/{user_id}/forecast", response_model=ForecastResponse)
+async def user_review_forecast(user_id: UUID):
+    """Число повторений пользователя по дням на ближайшие дни"""
+    return await review_forecast.for_user(user_id)
+
+
 @app.post("/sync")
 async def sync_all(repos=Depends(get_repos)):
     return {"detail": "Synchronization complete"}
@@ -145,37 +329,38 @@ async def add_to_buffer(req: AddRequest, repos=Depends(get_repos)):
         domain_repo = repos["domains"]
         user_domain_repo = repos["user_domains"]
 
-        user = await user_repo.get_by_telegram_id(req.telegram_id)
-        if not user:
-            user = await user_repo.add(
-                User(
-                    telegram_id=req.telegram_id,
-                    email=f"user_{req.telegram_id}@example.com",
-                    hashed_password="default",
-                    lambda_coef=0.5,
+        async with UnitOfWork(user_repo.session):
+            user = await user_repo.get_by_telegram_id(req.telegram_id)
+            if not user:
+                user = await user_repo.add(
+                    User(
+                        telegram_id=req.telegram_id,
+                        email=f"user_{req.telegram_id}@example.com",
+                        hashed_password="default",
+                        lambda_coef=0.5,
+                    )
                 )
-            )
 
-        if not await profile_repo.get_one(user_id=user.id):
-            await profile_repo.add(
-                UserProfile(
-                    user_id=user.id,
-                    username=f"user_{user.id}",
-                    email=f"user_{user.id}@example.com",
+            if not await profile_repo.get_one(user_id=user.id):
+                await profile_repo.add(
+                    UserProfile(
+                        user_id=user.id,
+                        username=f"user_{user.id}",
+                        email=f"user_{user.id}@example.com",
+                    )
                 )
-            )
-
-        domain = await domain_repo.add(
-            Domain(name=req.text, description="added via bot")
-        )
 
-        if not await user_domain_repo.get_first(
-            user_id=user.id, domain_id=domain.id
-        ):
-            await user_domain_repo.add(
-                UserDomain(user_id=user.id, domain_id=domain.id, level=1)
+            domain = await domain_repo.add(
+                Domain(name=req.text, description="added via bot")
             )
 
+            if not await user_domain_repo.get_first(
+                user_id=user.id, domain_id=domain.id
+            ):
+                await user_domain_repo.add(
+                    UserDomain(user_id=user.id, domain_id=domain.id, level=1)
+                )
+
         return {"detail": "Added"}
 
     except HTTPException as e:
@@ -186,27 +371,15 @@ async def add_to_buffer(req: AddRequest, repos=Depends(get_repos)):
 
 
 @app.get("/next_card", response_model=CardResponse)
-async def next_card(user: int, repos=Depends(get_repos)):
-    user_repo = repos["users"]
-    db_user = await user_repo.get_by_telegram_id(user)
-    if not db_user:
+async def next_card(user: int):
+    try:
+        card = await due_queue.next_card(user)
+    except LookupError:
         raise HTTPException(status_code=404, detail="User not found")
 
-    knowledge_repo = repos["user_knowledge"]
-    items = await knowledge_repo.get_by_user_with_concepts(db_user.id, limit=1)
-
-    if not items:
+    if card is None:
         raise HTTPException(status_code=404, detail="No cards")
-
-    item, concept_name = items[0]
-    concept_repo = repos["concepts"]
-    concept = await concept_repo.get_by_id(item.concept_id)
-
-    return {
-        "concept_id": item.concept_id,
-        "word": concept_name,
-        "definition": concept.description or "Без определения",
-    }
+    return card
 
 
 @app.post("/register")
@@ -267,16 +440,55 @@ async def grant_premium(
 @app.get("/knowledge/{user_id}", response_model=List[KnowledgeItemResponse])
 async def get_user_knowledge(
     user_id: UUID,
+    response: Response,
     limit: int = Query(20, description="Количество возвращаемых элементов"),
+    order: str = Query(
+        "due",
+        pattern=KNOWLEDGE_ORDERS,
+        description="due - очередь повторений, next_review - все карточки "
+        "по сроку с курсором следующей страницы в X-Next-Cursor",
+    ),
+    cursor: str | None = Query(
+        None, description="X-Next-Cursor предыдущей страницы"
+    ),
+    output: str = Query(
+        "json",
+        alias="format",
+        pattern="^(json|ndjson)$",
+        description="ndjson - все карточки после cursor потоком, без limit",
+    ),
     repos=Depends(get_repos),
 ):
+    if output == "ndjson":
+        return StreamingResponse(
+            knowledge_lines(user_id, parse_cursor(cursor)),
+            media_type="application/x-ndjson",
+        )
+
     knowledge_repo = repos["user_knowledge"]
+    if order == "next_review" or cursor is not None:
+        rows, next_cursor = await knowledge_page(
+            knowledge_repo, user_id, cursor, limit
+        )
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return [
+            {
+                "concept_id": row.concept_id,
+                "concept": row.name,
+                "retention": row.retention,
+                "next_review": row.next_review,
+            }
+            for row in rows
+        ]
+
     items = await knowledge_repo.get_by_user_with_concepts(
         user_id, limit=limit
     )
 
     return [
         {
+            "concept_id": item.concept_id,
             "concept": concept_name,
             "retention": item.retention,
             "next_review": item.next_review,
@@ -285,31 +497,80 @@ async def get_user_knowledge(
     ]
 
 
-@app.get("/users/{user_id}/stats", response_model=UserStatsResponse)
-async def get_user_stats(user_id: UUID, repos=Depends(get_repos)):
-    knowledge_repo = repos["user_knowledge"]
-    logs_repo = repos["retention_logs"]
+TRANSFER_FORMAT = "^(csv|jsonl|anki)$"
 
-    total = await knowledge_repo.count_by_user(user_id)
-    weak = await knowledge_repo.count_by_user(user_id, max_retention=0.5)
-    strong = await knowledge_repo.count_by_user(user_id, min_retention=0.7)
 
-    now = datetime.utcnow()
-    week_ago = now - timedelta(days=7)
+@app.get("/knowledge/{user_id}/export")
+async def export_user_knowledge(
+    user_id: UUID,
+    output: str = Query("csv", alias="format", pattern=TRANSFER_FORMAT),
+):
+    """Все карточки пользователя файлом csv, jsonl или для импорта в Anki"""
+    media_type, extension = TRANSFER_FORMATS[output]
+    return StreamingResponse(
+        export_knowledge(Session, user_id, output),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="scientia-{user_id}.{extension}"'
+            )
+        },
+    )
+
+
+@app.post("/knowledge/{user_id}/import")
+async def import_user_knowledge(
+    user_id: UUID,
+    request: Request,
+    output: str = Query("csv", alias="format", pattern=TRANSFER_FORMAT),
+    repos=Depends(get_repos),
+):
+    """Загружает карточки из тела запроса в формате выгрузки.
+
+    Файл передается телом запроса как есть и разбирается по мере
+    получения. Ошибка в любой строке отменяет весь импорт.
+    """
+    user = await repos["users"].get_by_id(user_id)
+    if not user:
+        raise HTTPException(404, "User not found")
+
+    try:
+        async with UnitOfWork(repos["users"].session) as uow:
+            imported = await import_knowledge(
+                uow.session,
+                user_id,
+                parse_records(request.stream(), output),
+            )
+    except ImportFormatError as e:
+        raise HTTPException(400, str(e))
+
+    if user.telegram_id is not None:
+        due_queue.invalidate(user.telegram_id)
+    review_forecast.invalidate(user_id)
+    return {"imported": imported}
+
 
-    reviews = await logs_repo.count_by_user_and_period(user_id, week_ago, now)
-    avg_retention = await knowledge_repo.avg_retention_by_user(user_id)
-    added = await knowledge_repo.count_added_in_period(user_id, week_ago, now)
+@app.get("/users/{user_id}/stats", response_model=UserStatsResponse)
+async def get_user_stats(user_id: UUID, repos=Depends(get_repos)):
+    now = datetime.utcnow()
+    # Счетчики user_stats, а до первого пересчета - агрегат по карточкам
+    stats = await repos["user_stats"].summary(user_id, now.date())
+    if stats is None:
+        stats = await repos["user_knowledge"].stats_by_user(
+            user_id, now - timedelta(days=7), now
+        )
 
+    total = stats["total"]
+    reviews = stats["reviews"]
     avg_reviews = reviews / total if total > 0 else 0
 
     return UserStatsResponse(
         total_concepts=total,
-        weak_concepts=weak,
-        strong_concepts=strong,
+        weak_concepts=stats["weak"],
+        strong_concepts=stats["strong"],
         reviews_last_7_days=reviews,
-        avg_retention=avg_retention,
-        concepts_added_last_7_days=added,
+        avg_retention=stats["avg_retention"],
+        concepts_added_last_7_days=stats["added"],
         avg_reviews_per_concept=avg_reviews,
     )
 
@@ -345,19 +606,28 @@ async def review(req: ReviewRequest, repos=Depends(get_repos)):
     knowledge.next_review = updated_knowledge.next_review
     user.lambda_coef = updated_user.lambda_coef
 
-    log_repo = repos["retention_logs"]
-    await log_repo.add(
-        RetentionLog(
-            user_id=log_data.user_id,
-            concept_id=log_data.concept_id,
-            old_lambda=log_data.old_lambda,
-            new_lambda=log_data.new_lambda,
-            retention_before=log_data.retention_before,
-            retention_after=log_data.retention_after,
+    async with UnitOfWork(knowledge_repo.session):
+        await repos["retention_logs"].add(
+            RetentionLog(
+                user_id=log_data.user_id,
+                concept_id=log_data.concept_id,
+                old_lambda=log_data.old_lambda,
+                new_lambda=log_data.new_lambda,
+                retention_before=log_data.retention_before,
+                retention_after=log_data.retention_after,
+            )
+        )
+        await repos["user_stats"].apply(
+            [
+                review_delta(
+                    user.id, log_data.retention_before, knowledge.retention
+                )
+            ],
+            knowledge.last_reviewed.date(),
         )
-    )
 
-    await repos["user_knowledge"].session.commit()
+    due_queue.invalidate(req.user, req.concept_id)
+    review_forecast.invalidate(user.id)
 
     return {
         "next_review": knowledge.next_review.isoformat(),
@@ -365,6 +635,28 @@ async def review(req: ReviewRequest, repos=Depends(get_repos)):
     }
 
 
+@app.delete("/knowledge/{user_id}/{concept_id}")
+async def delete_knowledge(
+    user_id: UUID, concept_id: int, repos=Depends(get_repos)
+):
+    removed = await repos["user_knowledge"].remove(user_id, [concept_id])
+    if not removed:
+        raise HTTPException(404, "Knowledge record not found")
+
+    await repos["user_stats"].apply(
+        [stats_delta(user_id, retention, count=-1) for retention in removed],
+        datetime.utcnow().date(),
+    )
+    await repos["user_knowledge"].session.commit()
+
+    # Иначе /next_card выдавал бы удаленную карточку из очереди в памяти
+    user = await repos["users"].get_by_id(user_id)
+    if user is not None and user.telegram_id is not None:
+        due_queue.invalidate(user.telegram_id, concept_id)
+    review_forecast.invalidate(user_id)
+    return {"detail": "Deleted"}
+
+
 @app.get("/concept/{concept_id}")
 async def get_concept(concept_id: int, repos=Depends(get_repos)):
     concept_repo = repos["concepts"]
@@ -379,15 +671,24 @@ async def get_concept(concept_id: int, repos=Depends(get_repos)):
 
 @app.get("/knowledge_map/{user_id}", response_model=KnowledgeMapResponse)
 async def get_knowledge_map(
-        user_id: UUID,
-        limit: int = 20,
-        repos=Depends(get_repos)
+    user_id: UUID,
+    limit: int = 20,
+    order: str = Query("due", pattern=KNOWLEDGE_ORDERS),
+    cursor: str | None = None,
+    repos=Depends(get_repos),
 ):
     knowledge_repo = repos["user_knowledge"]
 
-    knowledge_items = await knowledge_repo.get_by_user_with_concepts(
-        user_id, limit=limit
-    )
+    next_cursor = None
+    if order == "next_review" or cursor is not None:
+        rows, next_cursor = await knowledge_page(
+            knowledge_repo, user_id, cursor, limit
+        )
+        knowledge_items = [(row, row.name) for row in rows]
+    else:
+        knowledge_items = await knowledge_repo.get_by_user_with_concepts(
+            user_id, limit=limit
+        )
 
     if not knowledge_items:
         return KnowledgeMapResponse(
@@ -415,5 +716,6 @@ async def get_knowledge_map(
         concepts=concepts,
         connections=connections,
         retention_levels=retention_levels,
-        next_reviews=next_reviews
+        next_reviews=next_reviews,
+        next_cursor=next_cursor,
     )
\ No newline at end of file
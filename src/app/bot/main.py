@@ -1,6 +1,8 @@
 import logging
 import os
+import tempfile
 import uuid
+from pathlib import Path
 
 import httpx
 import spacy
@@ -21,7 +23,9 @@ from dotenv import load_dotenv
 from fastapi import HTTPException
 from sqlalchemy.orm import Mapped
 
-from app.db import Session
+from app.db import Session, configure_engine
+from app.db.query_stats import observe, track_queries
+from app.utils.metrics import serve as serve_metrics
 from app.models.users import User
 from app.repositories.user_repository import UserRepository
 from app.repositories.domain_repository import DomainRepository
@@ -29,16 +33,29 @@ from app.repositories.registration_request_repository import (
     RegistrationRequestRepository,
 )
 from app.repositories.concept_repository import ConceptRepository
+from app.repositories.job_repository import JobRepository
 from app.repositories.profile_repository import ProfileRepository
+from app.repositories.unit_of_work import UnitOfWork
+from app.services.document_ingestor import (
+    DOCUMENT_EXTENSIONS,
+    DOCUMENT_MAX_BYTES,
+    DocumentIngestor,
+)
 from app.services.email import send_confirmation_email
-from app.services.prompt_generator import PromptService
+from app.services.extraction_cache import ExtractionCache
+from app.services.nlp_executor import NLPExecutor, NLPQueueFull
+from app.services.nlp_loader import model_manager
+from app.services.prompt_generator import (
+    PromptService,
+    close_http_client,
+)
 from app.services.text_processor import TextProcessorService
 from app.models.registration_requests import RegistrationRequest
 from app.models.user_profile import UserProfile
 from datetime import datetime
-from app.services.nlp_loader import load_nlp_model
 
-nlp = load_nlp_model()
+nlp_executor = NLPExecutor()
+extraction_cache = ExtractionCache(model_manager.fingerprint())
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +64,8 @@ os.environ["GRPC_DNS_RESOLVER"] = "native"
 load_dotenv()
 API_URL = os.getenv("API_URL")
 TOKEN = os.getenv("TG_BOT_TOKEN")
+# Порт HTTP-сервера с гистограммами запросов к БД, пусто - не запускать
+BOT_METRICS_PORT = os.getenv("BOT_METRICS_PORT")
 
 session = AiohttpSession()
 bot = Bot(
@@ -57,6 +76,18 @@ bot = Bot(
 dp = Dispatcher()
 
 
+class QueryMetricsMiddleware(BaseMiddleware):
+    """Число запросов к БД и время в них по обработчикам для /metrics"""
+
+    async def __call__(self, handler, event: Update, data):
+        with track_queries() as stats:
+            try:
+                return await handler(event, data)
+            finally:
+                name = getattr(data.get("handler"), "callback", None)
+                observe(getattr(name, "__name__", "unknown"), stats)
+
+
 class AuthMiddleware(BaseMiddleware):
     async def __call__(self, handler, event: Update, data):
         if isinstance(event, Message) and event.text:
@@ -91,6 +122,8 @@ class AuthMiddleware(BaseMiddleware):
             return await handler(event, data)
 
 
+dp.message.middleware(QueryMetricsMiddleware())
+dp.callback_query.middleware(QueryMetricsMiddleware())
 dp.message.middleware(AuthMiddleware())
 
 
@@ -211,6 +244,37 @@ async def cmd_grant_premium(message: Message):
             await message.answer(f"Ошибка: {e.response.text}")
 
 
+@dp.message(Command("nlp_stats"))
+async def cmd_nlp_stats(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    metrics = nlp_executor.metrics()
+    cache = extraction_cache.metrics()
+    async with Session() as session:
+        jobs = await JobRepository(session).metrics()
+    await message.answer(
+        "🧠 NLP-пул:\n"
+        f"Готов: {'да' if metrics['ready'] else 'прогревается'}\n"
+        f"Процессов: {metrics['workers']}\n"
+        f"В очереди: {metrics['queue_depth']}/{metrics['queue_limit']}\n"
+        f"В работе: {metrics['in_flight']}\n"
+        f"Выполнено: {metrics['completed']} "
+        f"(ошибок {metrics['failed']}, отклонено {metrics['rejected']})\n"
+        f"Загрузка: {metrics['utilisation']:.0%}\n"
+        f"Предложений/с: {metrics['sentences_per_second']:.1f}\n"
+        f"Кэш: {cache['hit_rate']:.0%} попаданий "
+        f"(память {cache['memory_hits']}, БД {cache['db_hits']}, "
+        f"промахов {cache['misses']})\n"
+        + "".join(
+            f"\nЗадачи {kind}: в очереди {m['pending']}, "
+            f"в работе {m['running']}, ошибок {m['failed']}, "
+            f"задержка {m['lag_seconds']:.0f} с"
+            for kind, m in jobs.items()
+        )
+    )
+
+
 @dp.message(Command("register"))
 async def cmd_register(message: Message):
     if message.from_user.id in ADMIN_IDS:
@@ -225,29 +289,26 @@ async def cmd_register(message: Message):
                     "✅ Вы уже зарегистрированы как администратор!"
                 )
                 return
-            user = await user_repo.add(
-                User(
-                    telegram_id=message.from_user.id,
-                    email=f"user_{uuid.uuid4()}@example.com",
-                    hashed_password="default",
-                    confirmed=True,
-                    is_premium=True,
+            async with UnitOfWork(session):
+                user = await user_repo.add(
+                    User(
+                        telegram_id=message.from_user.id,
+                        email=f"user_{uuid.uuid4()}@example.com",
+                        hashed_password="default",
+                        confirmed=True,
+                        is_premium=True,
+                    )
                 )
-            )
-
-            profile_repo = ProfileRepository(session)
-            await profile_repo.add(
-                UserProfile(
-                    user_id=user.id,
-                    username=message.from_user.username
-                    or f"admin_{message.from_user.id}",
-                    email=f"admin_{message.from_user.id}@example.com",
-                    first_name=message.from_user.first_name,
-                    last_name=message.from_user.last_name,
+                await ProfileRepository(session).add(
+                    UserProfile(
+                        user_id=user.id,
+                        username=message.from_user.username
+                        or f"admin_{message.from_user.id}",
+                        email=f"admin_{message.from_user.id}@example.com",
+                        first_name=message.from_user.first_name,
+                        last_name=message.from_user.last_name,
+                    )
                 )
-            )
-
-            await session.commit()
 
         await message.answer(
             "🎉 Вы зарегистрированы как администратор! Теперь вы можете пользоваться ботом."
@@ -342,29 +403,27 @@ async def approve_registration(callback: CallbackQuery):
             await callback.answer("❌ Заявка не найдена")
             return
 
-        request.status = "approved"
+        async with UnitOfWork(session):
+            request.status = "approved"
 
-        user = await user_repo.add(
-            User(
-                telegram_id=telegram_id,
-                email=f"user_{telegram_id}@example.com",
-                hashed_password="default",
-                confirmed=True,
+            user = await user_repo.add(
+                User(
+                    telegram_id=telegram_id,
+                    email=f"user_{telegram_id}@example.com",
+                    hashed_password="default",
+                    confirmed=True,
+                )
             )
-        )
-
-        profile_repo = ProfileRepository(session)
-        await profile_repo.add(
-            UserProfile(
-                user_id=user.id,
-                username=request.username or f"user_{telegram_id}",
-                email=f"user_{telegram_id}@example.com",
-                first_name=request.first_name,
-                last_name=request.last_name,
+            await ProfileRepository(session).add(
+                UserProfile(
+                    user_id=user.id,
+                    username=request.username or f"user_{telegram_id}",
+                    email=f"user_{telegram_id}@example.com",
+                    first_name=request.first_name,
+                    last_name=request.last_name,
+                )
             )
-        )
 
-        await session.commit()
         try:
             await bot.send_message(
                 telegram_id,
@@ -525,8 +584,11 @@ async def handle_text(message: Message, **kwargs):
         await message.answer("❌ Пользователь не найден.")
         return
 
-    prompt_service = PromptService()
-    processor = TextProcessorService(prompt_service)
+    processor = TextProcessorService(
+        executor=nlp_executor,
+        cache=extraction_cache,
+        defer_definitions=True,
+    )
 
     async with Session() as session:
         try:
@@ -556,7 +618,8 @@ async def handle_text(message: Message, **kwargs):
                     await message.answer(
                         f"✅ Из текста извлечены концепты:\n{concepts_list}\n\n"
                         "Они добавлены в вашу карту знаний и будут использоваться "
-                        "в повторениях!"
+                        "в повторениях! Определения появятся в течение "
+                        "нескольких минут."
                     )
                 else:
                     await message.answer(
@@ -564,6 +627,11 @@ async def handle_text(message: Message, **kwargs):
                         "но существующие знания обновлены."
                     )
 
+        except NLPQueueFull:
+            await message.answer(
+                "⏳ Сейчас обрабатывается слишком много текстов. "
+                "Попробуйте отправить сообщение чуть позже."
+            )
         except Exception as e:
             logger.error(f"Text processing error: {str(e)}", exc_info=True)
             await message.answer(
@@ -571,6 +639,82 @@ async def handle_text(message: Message, **kwargs):
             )
 
 
+@dp.message(F.document)
+async def handle_document(message: Message, **kwargs):
+    user = kwargs.get("user")
+    if not user:
+        await message.answer("❌ Пользователь не найден.")
+        return
+
+    document = message.document
+    suffix = Path(document.file_name or "").suffix.lower()
+    if suffix not in DOCUMENT_EXTENSIONS:
+        await message.answer(
+            "❌ Поддерживаются только текстовые файлы .txt и .md"
+        )
+        return
+    if document.file_size and document.file_size > DOCUMENT_MAX_BYTES:
+        await message.answer(
+            f"❌ Файл слишком большой. Максимальный размер: "
+            f"{DOCUMENT_MAX_BYTES // 1024**2} МБ"
+        )
+        return
+
+    status = await message.answer(f"📄 Загружаю {document.file_name}...")
+
+    async def report(progress):
+        if progress.done:
+            text = (
+                f"✅ Файл {document.file_name} обработан\n"
+                f"Предложений: {progress.sentences}\n"
+                f"Новых концептов: {progress.concepts_added}\n"
+                f"Время: {progress.seconds:.0f} с"
+            )
+        else:
+            text = (
+                f"⏳ Обработка {document.file_name}: "
+                f"{progress.percent:.0%}\n"
+                f"Предложений: {progress.sentences}\n"
+                f"Новых концептов: {progress.concepts_added}"
+            )
+        try:
+            await status.edit_text(text)
+        except Exception as e:
+            logger.warning(f"Failed to update progress message: {str(e)}")
+
+    processor = TextProcessorService(
+        executor=nlp_executor,
+        cache=extraction_cache,
+        defer_definitions=True,
+    )
+    ingestor = DocumentIngestor(processor)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"document{suffix}")
+        try:
+            await bot.download(document, destination=path)
+
+            async with Session() as session:
+                profile = await ProfileRepository(session).get_one(
+                    user_id=user.id
+                )
+            domain_id = (
+                profile.domain_id if profile and profile.domain_id else 1
+            )
+
+            await ingestor.ingest(path, user.id, domain_id, on_progress=report)
+        except NLPQueueFull:
+            await status.edit_text(
+                "⏳ Сейчас обрабатывается слишком много текстов. "
+                "Попробуйте отправить файл чуть позже."
+            )
+        except Exception as e:
+            logger.error(f"Document processing error: {str(e)}", exc_info=True)
+            await status.edit_text(
+                "⚠️ Произошла ошибка при обработке файла. Попробуйте позже."
+            )
+
+
 async def update_concept_definition(message: Message, user: User):
     try:
         parts = message.text.split("::", 1)
@@ -759,6 +903,8 @@ async def handle_analysis(message: Message):
 def start_bot():
     import asyncio
 
+    configure_engine("bot")
+
     async def set_bot_commands():
         commands = [
             types.BotCommand(command="/start", description="Начать работу"),
@@ -782,6 +928,9 @@ def start_bot():
             types.BotCommand(
                 command="/sync", description="Синхронизация данных"
             ),
+            types.BotCommand(
+                command="/nlp_stats", description="Состояние NLP-пула"
+            ),
         ]
 
         await bot.set_my_commands(commands)
@@ -814,12 +963,24 @@ def start_bot():
             "• /sync - Синхронизация данных\n\n"
             "💡 Вы также можете просто отправлять мне тексты - "
             "я автоматически извлеку из них ключевые концепты!\n"
+            "💡 Большие конспекты можно прислать файлом .txt или .md\n"
             "💡 Чтобы добавить определение, используйте формат: <code>Концепт :: Определение</code>"
         )
         await message.answer(text, parse_mode="HTML")
 
     async def main():
-        await set_bot_commands()
-        await dp.start_polling(bot)
+        warmup = asyncio.create_task(nlp_executor.warm_up())
+        metrics_server = None
+        if BOT_METRICS_PORT:
+            metrics_server = await serve_metrics(int(BOT_METRICS_PORT))
+        try:
+            await set_bot_commands()
+            await dp.start_polling(bot)
+        finally:
+            warmup.cancel()
+            if metrics_server is not None:
+                metrics_server.close()
+            nlp_executor.shutdown()
+            await close_http_client()
 
     asyncio.run(main())
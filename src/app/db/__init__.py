@@ -1,9 +1,53 @@
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+import logging
+import os
+
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
 
 from app.db.config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from app.db.engine import EngineSettings, create_engine, metrics
+
+logger = logging.getLogger(__name__)
 
 DB_URL = (
     f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
-engine = create_async_engine(DB_URL, echo=True)
-Session = async_sessionmaker(engine, expire_on_commit=False)
+
+_role = os.getenv("DB_ROLE", "cli")
+_engine = None
+
+
+def configure_engine(role: str):
+    """Задает роль процесса до первого обращения к базе.
+
+    Роль выбирает настройки пула из EngineSettings.from_env.
+    """
+    global _role
+    if _engine is not None and role != _role:
+        logger.warning(
+            f"Database engine already created for {_role}, role {role} ignored"
+        )
+        return
+    _role = role
+
+
+def get_engine() -> AsyncEngine:
+    """Движок процесса, создается при первом обращении"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DB_URL, EngineSettings.from_env(_role))
+    return _engine
+
+
+def engine_metrics() -> dict:
+    pool = _engine.sync_engine.pool if _engine is not None else None
+    return {"role": _role, **metrics.snapshot(pool)}
+
+
+class _Sessionmaker(async_sessionmaker):
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+Session = _Sessionmaker(expire_on_commit=False)
@@ -0,0 +1,175 @@
+import logging
+import os
+import random
+from dataclasses import asdict, dataclass
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.db.query_stats import record_query
+
+logger = logging.getLogger(__name__)
+
+# Процессы приложения, у каждого свой пул соединений
+ROLES = ("api", "bot", "worker", "cli")
+
+# Значения по умолчанию по ролям, переопределяются переменными
+# окружения DB_<ROLE>_<ПАРАМЕТР> или общими DB_<ПАРАМЕТР>
+ROLE_DEFAULTS = {
+    "api": {"pool_size": 10, "max_overflow": 20},
+    "bot": {"pool_size": 5, "max_overflow": 5},
+    "worker": {"pool_size": 4, "max_overflow": 2},
+    "cli": {"pool_size": 2, "max_overflow": 2},
+}
+
+
+def _env(role: str, name: str, default):
+    value = os.getenv(f"DB_{role.upper()}_{name.upper()}")
+    if value is None:
+        value = os.getenv(f"DB_{name.upper()}")
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in {"1", "true", "yes"}
+    return type(default)(value)
+
+
+@dataclass
+class EngineSettings:
+    """Параметры движка одного процесса.
+
+    Attributes:
+        pool_size: Постоянные соединения пула.
+        max_overflow: Дополнительные соединения сверх pool_size.
+        pool_timeout: Сколько секунд ждать свободного соединения.
+        pool_recycle: Пересоздавать соединения старше стольких секунд.
+        pool_pre_ping: Проверять соединение перед выдачей из пула.
+        statement_cache_size: Размер кэша подготовленных запросов
+            asyncpg на соединение, 0 отключает кэш (нужно за
+            pgbouncer в режиме transaction).
+        slow_query_ms: Порог медленного запроса, 0 отключает журнал.
+        slow_query_sample: Доля медленных запросов, попадающих в журнал.
+        echo: Писать в журнал каждый запрос.
+    """
+
+    role: str = "cli"
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 100
+    slow_query_ms: float = 200.0
+    slow_query_sample: float = 1.0
+    echo: bool = False
+
+    @classmethod
+    def from_env(cls, role: str) -> "EngineSettings":
+        defaults = {**asdict(cls(role=role)), **ROLE_DEFAULTS.get(role, {})}
+        return cls(
+            **{
+                name: value if name == "role" else _env(role, name, value)
+                for name, value in defaults.items()
+            }
+        )
+
+
+class DatabaseMetrics:
+    """Ожидание соединений пула и медленные запросы одного процесса"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.queries = 0
+        self.slow_queries = 0
+
+    def record_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def snapshot(self, pool=None) -> dict:
+        data = {
+            "checkouts": self.checkouts,
+            "avg_wait_ms": (
+                self.wait_seconds / self.checkouts * 1000
+                if self.checkouts
+                else 0.0
+            ),
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "queries": self.queries,
+            "slow_queries": self.slow_queries,
+        }
+        if pool is not None:
+            data.update(
+                pool_size=pool.size(),
+                in_use=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return data
+
+
+metrics = DatabaseMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет время ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.record_wait(perf_counter() - started)
+
+
+def _install_query_hooks(engine: AsyncEngine, settings: EngineSettings):
+    threshold = settings.slow_query_ms / 1000
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = perf_counter() - conn.info["query_started"].pop()
+        metrics.queries += 1
+        record_query(statement, elapsed)
+        if not threshold or elapsed < threshold:
+            return
+        metrics.slow_queries += 1
+        if random.random() < settings.slow_query_sample:
+            logger.warning(
+                f"Slow query {elapsed * 1000:.0f}ms "
+                f"[{settings.role}]: {' '.join(statement.split())[:500]}"
+            )
+
+
+def create_engine(url: str, settings: EngineSettings) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        echo=settings.echo,
+        poolclass=InstrumentedPool,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+        connect_args={
+            "prepared_statement_cache_size": settings.statement_cache_size
+        },
+    )
+    _install_query_hooks(engine, settings)
+    logger.info(
+        f"Database engine for {settings.role}: pool {settings.pool_size}"
+        f"+{settings.max_overflow}, statement cache "
+        f"{settings.statement_cache_size}"
+    )
+    return engine
@@ -1,5 +1,8 @@
-from app.db import engine
+from sqlalchemy import text
+
+from app.db import get_engine
 from app.db.base import Base
+from app.db.partitions import ensure_partitions
 
 from app.models import (
     users,
@@ -10,10 +13,34 @@ from app.models import (
     concepts,
     user_knowledge,
     retention_log,
+    retention_daily,
     registration_requests,
+    extraction_cache,
+    definition_cache,
+    jobs,
+    user_stats,
 )
 
+# create_all не меняет существующие таблицы, поэтому новые колонки
+# добавляются здесь идемпотентными командами
+SCHEMA_UPGRADES = [
+    "ALTER TABLE public.concepts "
+    "ADD COLUMN IF NOT EXISTS canonical_name VARCHAR(255)",
+    # заменен покрывающим idx_user_knowledge_review_keyset
+    "DROP INDEX IF EXISTS public.idx_user_knowledge_user_review",
+]
+
+
+def _create_missing_indexes(connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
 
 async def create_tables():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await conn.execute(text(statement))
+        await conn.run_sync(_create_missing_indexes)
+        await ensure_partitions(conn)
@@ -0,0 +1,255 @@
+import logging
+import os
+import re
+from datetime import UTC, date, datetime
+
+from sqlalchemy import text
+
+from app.models.retention_log import RetentionLog
+
+logger = logging.getLogger(__name__)
+
+PARENT = "retention_logs"
+DEFAULT_PARTITION = f"{PARENT}_default"
+# Секции создаются на столько месяцев вперед
+PARTITION_MONTHS_AHEAD = int(
+    os.getenv("RETENTION_PARTITION_MONTHS_AHEAD", "3")
+)
+UNPARTITIONED = f"{PARENT}_unpartitioned"
+
+_PARTITION_NAME = re.compile(rf"^{PARENT}_p(\d{{4}})_(\d{{2}})$")
+_COLUMNS = (
+    "id, user_id, concept_id, old_lambda, new_lambda, "
+    "retention_before, retention_after"
+)
+# Индексы старой таблицы, имена которых займет секционированная
+_LEGACY_INDEXES = (
+    "retention_logs_pkey",
+    "uq_user_concept_date",
+    "idx_retention_log_concept",
+    "idx_retention_log_user_time",
+)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> date | None:
+    """Месяц секции по ее имени, None для секции по умолчанию"""
+    match = _PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return date(int(match[1]), int(match[2]), 1)
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def create_partition_sql(month: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS public.{partition_name(month)} "
+        f"PARTITION OF public.{PARENT} FOR VALUES FROM ({_bound(month)}) "
+        f"TO ({_bound(add_months(month, 1))})"
+    )
+
+
+async def is_partitioned(conn) -> bool:
+    result = await conn.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(:name))"
+        ),
+        {"name": f"public.{PARENT}"},
+    )
+    return bool(result.scalar())
+
+
+async def list_partitions(conn) -> list[str]:
+    """Имена секций retention_logs в порядке месяцев"""
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:name) "
+            "ORDER BY child.relname"
+        ),
+        {"name": f"public.{PARENT}"},
+    )
+    return list(result.scalars().all())
+
+
+async def _stranded_months(conn) -> list[date]:
+    """Месяцы строк, попавших в секцию по умолчанию"""
+    result = await conn.execute(
+        text(
+            "SELECT DISTINCT date_trunc('month', timestamp AT TIME ZONE "
+            f"'UTC')::date FROM public.{DEFAULT_PARTITION}"
+        )
+    )
+    return list(result.scalars().all())
+
+
+async def _move_from_default(conn, month: date):
+    """Создает секцию месяца и переносит в нее строки из DEFAULT.
+
+    С такими строками CREATE TABLE ... PARTITION OF падает, поэтому
+    секция по умолчанию на время переноса отсоединяется.
+    """
+    period = (
+        f"timestamp >= {_bound(month)} "
+        f"AND timestamp < {_bound(add_months(month, 1))}"
+    )
+    statements = [
+        (
+            f"ALTER TABLE public.{PARENT} "
+            f"DETACH PARTITION public.{DEFAULT_PARTITION}"
+        ),
+        create_partition_sql(month),
+        (
+            f"INSERT INTO public.{PARENT} ({_COLUMNS}, timestamp) "
+            f"SELECT {_COLUMNS}, timestamp FROM public.{DEFAULT_PARTITION} "
+            f"WHERE {period}"
+        ),
+        f"DELETE FROM public.{DEFAULT_PARTITION} WHERE {period}",
+        (
+            f"ALTER TABLE public.{PARENT} "
+            f"ATTACH PARTITION public.{DEFAULT_PARTITION} DEFAULT"
+        ),
+    ]
+    for statement in statements:
+        result = await conn.execute(text(statement))
+        if statement.startswith("DELETE"):
+            logger.warning(
+                f"Moved {result.rowcount} rows from {DEFAULT_PARTITION} "
+                f"to {partition_name(month)}"
+            )
+
+
+async def ensure_partitions(
+    conn,
+    today: date | None = None,
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+    since: date | None = None,
+) -> list[str]:
+    """Создает месячные секции от since до today + months_ahead.
+
+    Секция по умолчанию принимает строки вне созданных месяцев, чтобы
+    запись ответа не падала, если обслуживание давно не запускалось.
+    Для месяцев, строки которых в нее попали, секции создаются с
+    переносом строк (_move_from_default). Таблица, еще не переведенная
+    на секции, пропускается.
+
+    Returns:
+        Имена секций, которые должны существовать.
+    """
+    if not await is_partitioned(conn):
+        logger.warning(
+            f"{PARENT} is not partitioned, run scientia-retention-logs "
+            "partition"
+        )
+        return []
+    today = today or datetime.now(UTC).date()
+    existing = set(await list_partitions(conn))
+    stranded = (
+        set(await _stranded_months(conn))
+        if DEFAULT_PARTITION in existing
+        else set()
+    )
+
+    months = set(stranded)
+    month = month_start(since or today)
+    last = add_months(month_start(today), months_ahead)
+    while month <= last:
+        months.add(month)
+        month = add_months(month, 1)
+
+    names = []
+    for month in sorted(months):
+        name = partition_name(month)
+        names.append(name)
+        if name in existing:
+            continue
+        if month in stranded:
+            await _move_from_default(conn, month)
+        else:
+            await conn.execute(text(create_partition_sql(month)))
+    await conn.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS public.{DEFAULT_PARTITION} "
+            f"PARTITION OF public.{PARENT} DEFAULT"
+        )
+    )
+    return names
+
+
+async def convert_to_partitioned(conn, today: date | None = None) -> int:
+    """Переводит обычную таблицу retention_logs на секции.
+
+    conn - AsyncConnection. Старая таблица переименовывается,
+    секционированная создается по модели, строки копируются одним
+    INSERT ... SELECT, старая таблица удаляется. Все в транзакции
+    conn: на больших журналах это долгая блокировка, запускать в окно
+    обслуживания.
+
+    Returns:
+        Число перенесенных строк, 0 если таблица уже секционирована.
+    """
+    if await is_partitioned(conn):
+        return 0
+    statements = [f"ALTER TABLE public.{PARENT} RENAME TO {UNPARTITIONED}"]
+    statements += [
+        f"ALTER INDEX IF EXISTS public.{name} RENAME TO {name}_old"
+        for name in _LEGACY_INDEXES
+    ]
+    statements.append(
+        f"ALTER SEQUENCE IF EXISTS public.{PARENT}_id_seq "
+        f"RENAME TO {PARENT}_id_seq_old"
+    )
+    for statement in statements:
+        await conn.execute(text(statement))
+    await conn.run_sync(RetentionLog.__table__.create)
+
+    first = (
+        await conn.execute(
+            text(f"SELECT min(timestamp) FROM public.{UNPARTITIONED}")
+        )
+    ).scalar()
+    await ensure_partitions(
+        conn, today, since=first.date() if first is not None else None
+    )
+    result = await conn.execute(
+        text(
+            f"INSERT INTO public.{PARENT} ({_COLUMNS}, timestamp) "
+            f"SELECT {_COLUMNS}, coalesce(timestamp, now()) "
+            f"FROM public.{UNPARTITIONED}"
+        )
+    )
+    await conn.execute(
+        text(
+            f"SELECT setval(pg_get_serial_sequence('public.{PARENT}', 'id'), "
+            f"coalesce(max(id), 0) + 1, false) FROM public.{PARENT}"
+        )
+    )
+    await conn.execute(text(f"DROP TABLE public.{UNPARTITIONED}"))
+    logger.info(f"Moved {result.rowcount} rows into partitioned {PARENT}")
+    return result.rowcount
+
+
+async def detach_partition(conn, name: str, drop: bool = False):
+    """Отсоединяет секцию от retention_logs, с drop удаляет ее"""
+    await conn.execute(
+        text(f"ALTER TABLE public.{PARENT} DETACH PARTITION public.{name}")
+    )
+    if drop:
+        await conn.execute(text(f"DROP TABLE public.{name}"))
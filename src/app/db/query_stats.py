@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.utils.metrics import histogram
+
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+queries_per_handler = histogram(
+    "scientia_db_queries",
+    "SQL statements per API request or bot handler",
+    QUERY_BUCKETS,
+)
+seconds_per_handler = histogram(
+    "scientia_db_seconds",
+    "Time in SQL statements per API request or bot handler",
+    SECONDS_BUCKETS,
+)
+
+_current = ContextVar("query_stats", default=None)
+
+
+class QueryStats:
+    """Запросы, выполненные внутри track_queries"""
+
+    def __init__(self, keep_statements: bool = False, parent=None):
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements = [] if keep_statements else None
+        self.parent = parent
+
+    def add(self, statement: str, seconds: float):
+        self.queries += 1
+        self.seconds += seconds
+        if self.statements is not None:
+            self.statements.append(" ".join(statement.split()))
+        if self.parent is not None:
+            self.parent.add(statement, seconds)
+
+
+def record_query(statement: str, seconds: float):
+    """Вызывается из обработчика событий движка после каждого запроса"""
+    stats = _current.get()
+    if stats is not None:
+        stats.add(statement, seconds)
+
+
+@contextmanager
+def track_queries(keep_statements: bool = False):
+    """Считает запросы текущей задачи и задач, созданных внутри.
+
+    Вложенные счетчики передают свои запросы внешнему.
+    """
+    stats = QueryStats(keep_statements, parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def observe(handler: str, stats: QueryStats):
+    queries_per_handler.observe(stats.queries, handler=handler)
+    seconds_per_handler.observe(stats.seconds, handler=handler)
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """Падает с AssertionError, если внутри выполнено больше запросов.
+
+    Для тестов, ловит N+1 до продакшена:
+
+        with query_budget(3):
+            await client.get("/knowledge/...")
+    """
+    with track_queries(keep_statements=True) as stats:
+        yield stats
+    if stats.queries > max_queries:
+        listing = "\n".join(
+            f"{i}. {statement[:200]}"
+            for i, statement in enumerate(stats.statements, 1)
+        )
+        raise AssertionError(
+            f"{stats.queries} queries, budget {max_queries}:\n{listing}"
+        )
@@ -5,6 +5,7 @@ import uvicorn
 
 from app.bot.main import start_bot
 from app.db.init_db import create_tables
+from app.worker.main import start_worker
 
 
 async def init_models():
@@ -19,18 +20,25 @@ def run_bot():
     start_bot()
 
 
+def run_worker():
+    start_worker()
+
+
 def main():
     asyncio.run(init_models())
     multiprocessing.set_start_method("spawn")
 
     api_process = multiprocessing.Process(target=run_api)
     bot_process = multiprocessing.Process(target=run_bot)
+    worker_process = multiprocessing.Process(target=run_worker)
 
     api_process.start()
     bot_process.start()
+    worker_process.start()
 
     api_process.join()
     bot_process.join()
+    worker_process.join()
 
 
 if __name__ == "__main__":
@@ -6,4 +6,9 @@ from .auth_methods import AuthMethod
 from .concepts import Concept
 from .user_knowledge import UserKnowledge
 from .retention_log import RetentionLog
+from .retention_daily import RetentionDaily
 from .registration_requests import RegistrationRequest
+from .extraction_cache import ExtractionCacheEntry
+from .definition_cache import DefinitionCacheEntry
+from .jobs import Job
+from .user_stats import UserStats
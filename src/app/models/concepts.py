@@ -11,12 +11,16 @@ from sqlalchemy.orm import relationship
 
 from app.db.base import Base
 
+# Описание концепта, для которого еще не сгенерировано определение
+PLACEHOLDER_DESCRIPTION = "Автоматически извлеченный термин"
+
 
 class Concept(Base):
     __tablename__ = "concepts"
 
     id = Column(Integer, primary_key=True)
     name = Column(String(255), unique=True, nullable=False)
+    canonical_name = Column(String(255), nullable=True, index=True)
     domain_id = Column(Integer, ForeignKey("public.domains.id"), nullable=True)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, func
+
+from app.db.base import Base
+
+
+class DefinitionCacheEntry(Base):
+    __tablename__ = "concept_definition_cache"
+
+    concept = Column(String(255), primary_key=True)
+    model = Column(String(100), primary_key=True)
+    prompt_version = Column(Integer, primary_key=True)
+    # NULL означает неудачную генерацию, повтор после expires_at
+    definition = Column(Text, nullable=True)
+    failures = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("idx_definition_cache_expires", "expires_at"),)
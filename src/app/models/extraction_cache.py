@@ -0,0 +1,16 @@
+from sqlalchemy import Column, DateTime, Index, String, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.base import Base
+
+
+class ExtractionCacheEntry(Base):
+    __tablename__ = "concept_extraction_cache"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(100), nullable=False)
+    concepts = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("idx_extraction_cache_last_used", "last_used_at"),)
@@ -0,0 +1,55 @@
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    Text,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.base import Base
+
+# Условие частичного уникального индекса по dedupe_key, в том же виде
+# используется в INSERT ... ON CONFLICT
+ACTIVE_JOB_CONDITION = "status IN ('pending', 'running')"
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+    # pending -> running -> done; после max_attempts неудач - failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    dedupe_key = Column(String(255), nullable=True)
+    last_error = Column(Text, nullable=True)
+    run_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    locked_by = Column(String(100), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "idx_jobs_pending",
+            "kind",
+            "run_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+        # Одна и та же задача не ставится повторно, пока не выполнена
+        Index(
+            "uq_jobs_active_dedupe_key",
+            "dedupe_key",
+            unique=True,
+            postgresql_where=text(ACTIVE_JOB_CONDITION),
+        ),
+    )
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Date, Float, ForeignKey, Index, Integer
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.base import Base
+
+
+class RetentionDaily(Base):
+    """Ответы пользователя за день (UTC), свертка retention_logs.
+
+    Строки пересчитываются целиком за прошедшие дни, последний
+    свернутый день - max(day). Дни позже него считаются по журналу.
+    """
+
+    __tablename__ = "retention_daily"
+
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("public.users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    day = Column(Date, primary_key=True)
+    reviews = Column(Integer, nullable=False, default=0)
+    retention_before_sum = Column(Float, nullable=False, default=0.0)
+    retention_after_sum = Column(Float, nullable=False, default=0.0)
+    __table_args__ = (
+        # max(day) - граница свертки
+        Index("idx_retention_daily_day", "day"),
+    )
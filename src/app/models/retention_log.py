@@ -17,16 +17,27 @@ from app.db.base import Base
 
 
 class RetentionLog(Base):
+    """Журнал ответов, секционированный по месяцам timestamp.
+
+    Секции retention_logs_pYYYY_MM создаются заранее (app.db.partitions),
+    ключ секционирования входит в первичный ключ и уникальные индексы.
+    """
+
     __tablename__ = "retention_logs"
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(UUID(as_uuid=True), ForeignKey("public.users.id"))
     concept_id = Column(Integer, ForeignKey("public.concepts.id"))
     old_lambda = Column(Float)
     new_lambda = Column(Float)
     retention_before = Column(Float)
     retention_after = Column(Float)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    timestamp = Column(
+        DateTime(timezone=True),
+        primary_key=True,
+        nullable=False,
+        server_default=func.now(),
+    )
     concept = relationship("Concept")
     user = relationship("User")
     __table_args__ = (
@@ -34,4 +45,7 @@ class RetentionLog(Base):
             "user_id", "concept_id", "timestamp", name="uq_user_concept_date"
         ),
         Index("idx_retention_log_concept", "concept_id"),
+        # Ответы пользователя за период считаются только по индексу
+        Index("idx_retention_log_user_time", "user_id", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
     )
@@ -21,7 +21,16 @@ class UserKnowledge(Base):
     user = relationship("User")
 
     __table_args__ = (
-        Index("idx_user_knowledge_user_review", "user_id", "next_review"),
+        # Покрывающий индекс очереди повторений: выборка наступивших
+        # карточек и расчет ожидаемого удержания идут без чтения таблицы.
+        # concept_id в ключе дает порядок постраничного списка карточек
+        Index(
+            "idx_user_knowledge_review_keyset",
+            "user_id",
+            "next_review",
+            "concept_id",
+            postgresql_include=["retention", "last_reviewed"],
+        ),
         Index("idx_user_knowledge_retention", "retention"),
         Index("idx_user_knowledge_concept", "concept_id"),
     )
@@ -0,0 +1,41 @@
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    func,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+
+from app.db.base import Base
+
+STATS_BUCKET_DAYS = 7
+
+
+class UserStats(Base):
+    """Счетчики знаний пользователя, обновляемые вместе с карточками.
+
+    review_buckets и added_buckets - число ответов и добавленных
+    карточек по дням: первый элемент относится к buckets_day, следующие
+    к предыдущим дням.
+    """
+
+    __tablename__ = "user_stats"
+
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("public.users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    total_cards = Column(Integer, nullable=False, default=0)
+    weak_cards = Column(Integer, nullable=False, default=0)
+    strong_cards = Column(Integer, nullable=False, default=0)
+    retention_sum = Column(Float, nullable=False, default=0.0)
+    review_buckets = Column(ARRAY(Integer), nullable=False)
+    added_buckets = Column(ARRAY(Integer), nullable=False)
+    buckets_day = Column(Date, nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
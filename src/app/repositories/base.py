@@ -1,6 +1,13 @@
+from sqlalchemy import column, update, values
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+# Не больше параметров в одном запросе, чем допускает PostgreSQL (32767)
+MAX_QUERY_PARAMS = 30000
+# Ключ session.info: фиксацией управляет UnitOfWork, репозитории
+# только сбрасывают изменения в БД
+DEFERRED_COMMIT = "deferred_commit"
+
 
 class GenericRepository:
     def __init__(self, session: AsyncSession, model):
@@ -13,12 +20,33 @@ class GenericRepository:
         )
         return result.scalars().first()
 
+    @property
+    def deferred(self) -> bool:
+        """Сессия открыта в UnitOfWork и фиксируется при выходе из него"""
+        return self.session.info.get(DEFERRED_COMMIT, False)
+
     async def add(self, entity):
         self.session.add(entity)
+        if self.deferred:
+            # flush присваивает первичный ключ для следующих записей
+            await self.session.flush()
+            return entity
         await self.session.commit()
         await self.session.refresh(entity)
         return entity
 
+    async def add_many(self, entities: list) -> list:
+        """Добавляет сущности одним сбросом в БД.
+
+        Вне UnitOfWork изменения фиксируются одним commit, без refresh
+        каждой сущности.
+        """
+        self.session.add_all(entities)
+        await self.session.flush()
+        if not self.deferred:
+            await self.session.commit()
+        return entities
+
     async def get_all(self):
         result = await self.session.execute(select(self.model))
         return result.scalars().all()
@@ -41,7 +69,10 @@ class GenericRepository:
 
     async def delete(self, entity):
         await self.session.delete(entity)
-        await self.session.commit()
+        if self.deferred:
+            await self.session.flush()
+        else:
+            await self.session.commit()
 
     async def get_by(self, **kwargs):
         result = await self.session.execute(
@@ -54,3 +85,50 @@ class GenericRepository:
             select(self.model).filter_by(**kwargs).limit(1)
         )
         return result.scalars().first()
+
+    async def update_from_values(
+        self, columns: list, rows: list, keys=("id",), set_=None
+    ) -> int:
+        """Обновляет много строк запросами UPDATE ... FROM (VALUES ...).
+
+        Транзакция не фиксируется.
+
+        Args:
+            columns: Колонки VALUES: имя колонки модели или column() с
+                типом для вычисляемых значений.
+            rows: Кортежи значений в порядке columns.
+            keys: Колонки, по которым строки VALUES сопоставляются с
+                таблицей.
+            set_: Функция, которая по VALUES-конструкции возвращает
+                словарь присваиваний. По умолчанию все колонки, кроме
+                ключевых, копируются как есть.
+
+        Returns:
+            Число обновленных строк.
+        """
+        table = self.model.__table__
+        value_columns = [
+            column(c, table.c[c].type) if isinstance(c, str) else c
+            for c in columns
+        ]
+        chunk_size = max(1, MAX_QUERY_PARAMS // len(value_columns))
+        updated = 0
+        for start in range(0, len(rows), chunk_size):
+            data = values(*value_columns, name="v").data(
+                rows[start : start + chunk_size]
+            )
+            if set_ is not None:
+                assignments = set_(data)
+            else:
+                assignments = {
+                    c.name: data.c[c.name]
+                    for c in value_columns
+                    if c.name not in keys
+                }
+            result = await self.session.execute(
+                update(table)
+                .where(*(table.c[key] == data.c[key] for key in keys))
+                .values(assignments)
+            )
+            updated += result.rowcount
+        return updated
@@ -1,23 +1,163 @@
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.concepts import Concept
+from app.models.concepts import PLACEHOLDER_DESCRIPTION, Concept
 from .base import GenericRepository
 
+# Ограничение на число строк в одном INSERT, чтобы не упереться в
+# лимит параметров запроса PostgreSQL
+BULK_CHUNK_SIZE = 1000
+
 
 class ConceptRepository(GenericRepository):
     def __init__(self, session: AsyncSession):
         super().__init__(session, Concept)
 
+    async def get_by_canonical(self, canonical_name: str, name: str = None):
+        """Ищет концепт по каноническому ключу, затем по исходному имени.
+
+        Концептам, созданным до появления ключа, он проставляется при
+        первом совпадении по имени.
+        """
+        condition = Concept.canonical_name == canonical_name
+        if name:
+            condition = or_(condition, Concept.name == name)
+        result = await self.session.execute(
+            select(Concept)
+            .where(condition)
+            .order_by(Concept.canonical_name.is_(None), Concept.id)
+            .limit(1)
+        )
+        concept = result.scalars().first()
+        if concept and concept.canonical_name is None:
+            concept.canonical_name = canonical_name
+        return concept
+
     async def get_or_create(
-        self, name: str, domain_id: int, description: str = None
+        self,
+        name: str,
+        domain_id: int,
+        description: str = None,
+        canonical_name: str = None,
     ):
-        concept = await self.get_first(name=name)
+        if canonical_name:
+            concept = await self.get_by_canonical(canonical_name, name=name)
+        else:
+            concept = await self.get_first(name=name)
         if concept:
             return concept
 
         return await self.add(
             Concept(
                 name=name,
+                canonical_name=canonical_name,
                 domain_id=domain_id,
-                description=description or "Автоматически извлеченный термин",
+                description=description or PLACEHOLDER_DESCRIPTION,
+            )
+        )
+
+    async def get_by_canonicals(self, names: dict) -> dict:
+        """Находит существующие концепты для набора ключей одним запросом.
+
+        Args:
+            names: Словарь {канонический ключ: исходное имя}.
+
+        Returns:
+            Словарь {канонический ключ: Concept} для найденных концептов.
+            Совпадение по ключу важнее совпадения по имени, концептам без
+            ключа он проставляется, как в get_by_canonical.
+        """
+        if not names:
+            return {}
+        result = await self.session.execute(
+            select(Concept)
+            .where(
+                or_(
+                    Concept.canonical_name.in_(list(names)),
+                    Concept.name.in_(list(names.values())),
+                )
             )
+            .order_by(Concept.id)
         )
+
+        by_canonical = {}
+        by_name = {}
+        for concept in result.scalars().all():
+            if concept.canonical_name:
+                by_canonical.setdefault(concept.canonical_name, concept)
+            by_name[concept.name] = concept
+
+        found = {}
+        for canonical, name in names.items():
+            concept = by_canonical.get(canonical) or by_name.get(name)
+            if concept:
+                if concept.canonical_name is None:
+                    concept.canonical_name = canonical
+                found[canonical] = concept
+        return found
+
+    async def bulk_upsert(self, rows: list[dict]) -> list:
+        """Вставляет концепты пачкой без фиксации транзакции.
+
+        Конфликт по уникальному имени (в том числе со строкой, которую
+        параллельно вставил другой запрос) не приводит к ошибке: такая
+        строка возвращается вместе с новыми, а ее пустой canonical_name
+        заполняется.
+
+        Args:
+            rows: Словари со значениями колонок name, canonical_name,
+                domain_id и description.
+
+        Returns:
+            Список Concept для всех переданных имен.
+        """
+        # Одно имя дважды в одном INSERT ... ON CONFLICT DO UPDATE
+        # вызывает ошибку, поэтому строки дедуплицируются заранее
+        rows = list({row["name"]: row for row in rows}.values())
+        concepts = []
+        for start in range(0, len(rows), BULK_CHUNK_SIZE):
+            stmt = insert(Concept).values(
+                rows[start : start + BULK_CHUNK_SIZE]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Concept.name],
+                set_={
+                    "canonical_name": func.coalesce(
+                        Concept.canonical_name,
+                        stmt.excluded.canonical_name,
+                    )
+                },
+            ).returning(Concept)
+            result = await self.session.scalars(
+                stmt, execution_options={"populate_existing": True}
+            )
+            concepts.extend(result.all())
+        return concepts
+
+    async def get_undefined(self, concept_ids: list[int]) -> list:
+        """Концепты из списка, у которых еще нет определения"""
+        if not concept_ids:
+            return []
+        result = await self.session.execute(
+            select(Concept)
+            .where(Concept.id.in_(concept_ids), _undefined())
+            .order_by(Concept.id)
+        )
+        return result.scalars().all()
+
+    async def undefined_ids(self, after_id: int = 0, limit: int = 1000):
+        """Id концептов без определения, следующие за after_id"""
+        result = await self.session.execute(
+            select(Concept.id)
+            .where(Concept.id > after_id, _undefined())
+            .order_by(Concept.id)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+
+def _undefined():
+    return or_(
+        Concept.description.is_(None),
+        Concept.description == PLACEHOLDER_DESCRIPTION,
+    )
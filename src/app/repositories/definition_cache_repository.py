@@ -0,0 +1,128 @@
+from datetime import datetime
+
+from sqlalchemy import Float, case, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.definition_cache import DefinitionCacheEntry
+
+from .base import GenericRepository
+
+
+class DefinitionCacheRepository(GenericRepository):
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, DefinitionCacheEntry)
+
+    async def get_many(
+        self, concepts: list[str], model: str, prompt_version: int
+    ) -> dict:
+        """Возвращает {концепт: (определение, expires_at)} для живых записей"""
+        if not concepts:
+            return {}
+        result = await self.session.execute(
+            select(
+                DefinitionCacheEntry.concept,
+                DefinitionCacheEntry.definition,
+                DefinitionCacheEntry.expires_at,
+            ).where(
+                DefinitionCacheEntry.concept.in_(concepts),
+                DefinitionCacheEntry.model == model,
+                DefinitionCacheEntry.prompt_version == prompt_version,
+                DefinitionCacheEntry.expires_at > func.now(),
+            )
+        )
+        return {
+            concept: (definition, expires_at)
+            for concept, definition, expires_at in result.all()
+        }
+
+    async def put_many(
+        self,
+        entries: dict,
+        model: str,
+        prompt_version: int,
+        expires_at: datetime,
+        retry_base: float,
+        retry_max: float,
+    ) -> dict:
+        """Сохраняет определения и неудачи генерации.
+
+        Успешное определение живет до expires_at. Для неудачи (None)
+        счетчик failures увеличивается, а повтор откладывается на
+        retry_base * 2^(failures - 1) секунд, но не больше retry_max;
+        прежнее определение при этом сохраняется.
+
+        Returns:
+            {концепт: (определение, expires_at)} в том виде, в котором
+            записи сохранены.
+        """
+        if not entries:
+            return {}
+        table = DefinitionCacheEntry.__table__
+        stmt = insert(DefinitionCacheEntry).values(
+            [
+                {
+                    "concept": concept,
+                    "model": model,
+                    "prompt_version": prompt_version,
+                    "definition": definition,
+                    "failures": 0 if definition is not None else 1,
+                    "expires_at": (
+                        expires_at
+                        if definition is not None
+                        else func.now() + _seconds(retry_base)
+                    ),
+                }
+                for concept, definition in entries.items()
+            ]
+        )
+        failed = stmt.excluded.definition.is_(None)
+        failures = table.c.failures + 1
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["concept", "model", "prompt_version"],
+            set_={
+                # Устаревшее определение отдается до следующей попытки
+                "definition": func.coalesce(
+                    stmt.excluded.definition, table.c.definition
+                ),
+                "failures": case((failed, failures), else_=0),
+                "expires_at": case(
+                    (
+                        failed,
+                        func.now()
+                        + _seconds(
+                            func.least(
+                                retry_base * func.power(2, failures - 1),
+                                retry_max,
+                            )
+                        ),
+                    ),
+                    else_=stmt.excluded.expires_at,
+                ),
+                "updated_at": func.now(),
+            },
+        ).returning(
+            DefinitionCacheEntry.concept,
+            DefinitionCacheEntry.definition,
+            DefinitionCacheEntry.expires_at,
+        )
+        result = await self.session.execute(stmt)
+        stored = {
+            concept: (definition, expires)
+            for concept, definition, expires in result.all()
+        }
+        await self.session.commit()
+        return stored
+
+    async def purge_expired(self) -> int:
+        result = await self.session.execute(
+            delete(DefinitionCacheEntry).where(
+                DefinitionCacheEntry.expires_at <= func.now()
+            )
+        )
+        await self.session.commit()
+        return result.rowcount
+
+
+def _seconds(value):
+    return func.make_interval(0, 0, 0, 0, 0, 0, cast(value, Float))
@@ -0,0 +1,79 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.extraction_cache import ExtractionCacheEntry
+
+from .base import GenericRepository
+
+
+class ExtractionCacheRepository(GenericRepository):
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, ExtractionCacheEntry)
+
+    async def get_many(
+        self, keys: list[str], touch_after: timedelta = timedelta(days=1)
+    ) -> dict:
+        """Возвращает концепты по ключам.
+
+        Время использования обновляется только у записей, которых не
+        касались дольше touch_after: для вытеснения хватает точности до
+        этого интервала, а чтение почти всегда обходится без записи и
+        блокировок строк.
+        """
+        if not keys:
+            return {}
+        result = await self.session.execute(
+            select(
+                ExtractionCacheEntry.key,
+                ExtractionCacheEntry.concepts,
+                ExtractionCacheEntry.last_used_at,
+            ).where(ExtractionCacheEntry.key.in_(keys))
+        )
+        found = {}
+        stale = []
+        threshold = datetime.now(UTC) - touch_after
+        for key, concepts, last_used_at in result.all():
+            found[key] = concepts
+            if last_used_at is None or last_used_at < threshold:
+                stale.append(key)
+        if stale:
+            await self.session.execute(
+                update(ExtractionCacheEntry)
+                .where(ExtractionCacheEntry.key.in_(stale))
+                .values(last_used_at=func.now())
+            )
+            await self.session.commit()
+        return found
+
+    async def put_many(self, model: str, entries: dict):
+        if not entries:
+            return
+        await self.session.execute(
+            insert(ExtractionCacheEntry)
+            .values(
+                [
+                    {"key": key, "model": model, "concepts": concepts}
+                    for key, concepts in entries.items()
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=["key"])
+        )
+        await self.session.commit()
+
+    async def evict(self, max_rows: int) -> int:
+        """Удаляет давно не использованные записи сверх max_rows"""
+        stale = (
+            select(ExtractionCacheEntry.key)
+            .order_by(ExtractionCacheEntry.last_used_at.desc())
+            .offset(max_rows)
+        )
+        result = await self.session.execute(
+            delete(ExtractionCacheEntry).where(
+                ExtractionCacheEntry.key.in_(stale)
+            )
+        )
+        await self.session.commit()
+        return result.rowcount
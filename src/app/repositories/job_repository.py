@@ -0,0 +1,173 @@
+from sqlalchemy import Float, case, cast, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.jobs import ACTIVE_JOB_CONDITION, Job
+
+from .base import GenericRepository
+
+
+class JobRepository(GenericRepository):
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, Job)
+
+    async def enqueue_many(self, jobs: list[dict]) -> int:
+        """Ставит задачи в очередь без фиксации транзакции.
+
+        Задачи ставятся в той же транзакции, что и данные, для которых
+        они нужны, поэтому вызывающий код сам делает commit. Задача с
+        dedupe_key, совпадающим с еще не выполненной, пропускается.
+
+        Args:
+            jobs: Словари с полями kind, payload и необязательными
+                dedupe_key, run_at, max_attempts.
+
+        Returns:
+            Число поставленных задач.
+        """
+        if not jobs:
+            return 0
+        result = await self.session.execute(
+            insert(Job)
+            .values(
+                [
+                    {
+                        "kind": job["kind"],
+                        "payload": job.get("payload", {}),
+                        "dedupe_key": job.get("dedupe_key"),
+                        "run_at": job.get("run_at", func.now()),
+                        "max_attempts": job.get("max_attempts", 5),
+                        "status": "pending",
+                        "attempts": 0,
+                    }
+                    for job in jobs
+                ]
+            )
+            .on_conflict_do_nothing(
+                index_elements=["dedupe_key"],
+                index_where=text(ACTIVE_JOB_CONDITION),
+            )
+        )
+        return result.rowcount
+
+    async def claim(self, kinds: list[str], worker: str, limit: int = 1):
+        """Забирает готовые к выполнению задачи и помечает их running.
+
+        SELECT ... FOR UPDATE SKIP LOCKED позволяет нескольким
+        воркерам разбирать очередь параллельно, не блокируя друг друга
+        и не получая одну задачу дважды.
+        """
+        ready = (
+            select(Job.id)
+            .where(
+                Job.status == "pending",
+                Job.kind.in_(kinds),
+                Job.run_at <= func.now(),
+            )
+            .order_by(Job.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.session.scalars(
+            update(Job)
+            .where(Job.id.in_(ready.scalar_subquery()))
+            .values(
+                status="running",
+                attempts=Job.attempts + 1,
+                locked_at=func.now(),
+                locked_by=worker,
+            )
+            .returning(Job),
+            execution_options={"synchronize_session": False},
+        )
+        jobs = result.all()
+        await self.session.commit()
+        return jobs
+
+    async def complete(self, job_id: int):
+        await self.session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(
+                status="done",
+                last_error=None,
+                locked_at=None,
+                locked_by=None,
+                finished_at=func.now(),
+            )
+        )
+        await self.session.commit()
+
+    async def fail(self, job_id: int, error: str, retry_in: float):
+        """Откладывает задачу на retry_in секунд или помечает ее failed"""
+        exhausted = Job.attempts >= Job.max_attempts
+        await self.session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(
+                status=case((exhausted, "failed"), else_="pending"),
+                last_error=error[:2000],
+                run_at=func.now() + _seconds(retry_in),
+                locked_at=None,
+                locked_by=None,
+                finished_at=case((exhausted, func.now()), else_=None),
+            )
+        )
+        await self.session.commit()
+
+    async def requeue_stale(self, timeout: float) -> int:
+        """Возвращает в очередь задачи упавших воркеров"""
+        result = await self.session.execute(
+            update(Job)
+            .where(
+                Job.status == "running",
+                Job.locked_at < func.now() - _seconds(timeout),
+            )
+            .values(status="pending", locked_at=None, locked_by=None)
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def delete_finished(self, older_than: float) -> int:
+        """Удаляет выполненные задачи старше older_than секунд"""
+        result = await self.session.execute(
+            delete(Job).where(
+                Job.status == "done",
+                Job.finished_at < func.now() - _seconds(older_than),
+            )
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def metrics(self) -> dict:
+        """Размер очереди по статусам и задержка самой старой задачи"""
+        result = await self.session.execute(
+            select(
+                Job.kind,
+                func.count().filter(Job.status == "pending"),
+                func.count().filter(
+                    Job.status == "pending", Job.run_at <= func.now()
+                ),
+                func.count().filter(Job.status == "running"),
+                func.count().filter(Job.status == "failed"),
+                func.max(
+                    func.extract("epoch", func.now() - Job.run_at)
+                ).filter(Job.status == "pending", Job.run_at <= func.now()),
+            )
+            .where(Job.status != "done")
+            .group_by(Job.kind)
+        )
+        return {
+            kind: {
+                "pending": pending,
+                "ready": ready,
+                "running": running,
+                "failed": failed,
+                "lag_seconds": float(lag or 0.0),
+            }
+            for kind, pending, ready, running, failed, lag in result.all()
+        }
+
+
+def _seconds(value):
+    return func.make_interval(0, 0, 0, 0, 0, 0, cast(value, Float))
@@ -0,0 +1,79 @@
+from datetime import UTC, date, datetime, time, timedelta
+
+from sqlalchemy import Date, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.retention_daily import RetentionDaily
+from app.models.retention_log import RetentionLog
+
+from .base import GenericRepository
+
+
+def midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, UTC)
+
+
+class RetentionDailyRepository(GenericRepository):
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, RetentionDaily)
+
+    async def rolled_through(self) -> date | None:
+        """Последний свернутый день"""
+        result = await self.session.execute(
+            select(func.max(RetentionDaily.day))
+        )
+        return result.scalar()
+
+    async def first_log_day(self) -> date | None:
+        result = await self.session.execute(
+            select(func.min(RetentionLog.timestamp))
+        )
+        first = result.scalar()
+        return first.astimezone(UTC).date() if first is not None else None
+
+    async def rollup(self, day: date) -> int:
+        """Пересчитывает строки дня по журналу без фиксации транзакции.
+
+        Повторный запуск за тот же день перезаписывает строки, поэтому
+        ответы, записанные задним числом, учитываются при пересчете.
+
+        Returns:
+            Число пользователей с ответами за день.
+        """
+        logs = (
+            select(
+                RetentionLog.user_id,
+                literal(day, Date).label("day"),
+                func.count().label("reviews"),
+                func.coalesce(func.sum(RetentionLog.retention_before), 0.0),
+                func.coalesce(func.sum(RetentionLog.retention_after), 0.0),
+            )
+            .where(
+                RetentionLog.user_id.is_not(None),
+                RetentionLog.timestamp >= midnight(day),
+                RetentionLog.timestamp < midnight(day + timedelta(days=1)),
+            )
+            .group_by(RetentionLog.user_id)
+        )
+        stmt = insert(RetentionDaily).from_select(
+            [
+                "user_id",
+                "day",
+                "reviews",
+                "retention_before_sum",
+                "retention_after_sum",
+            ],
+            logs,
+        )
+        result = await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["user_id", "day"],
+                set_={
+                    "reviews": stmt.excluded.reviews,
+                    "retention_before_sum": stmt.excluded.retention_before_sum,
+                    "retention_after_sum": stmt.excluded.retention_after_sum,
+                },
+            )
+        )
+        return result.rowcount
@@ -1,11 +1,75 @@
-from datetime import datetime
+from datetime import UTC, datetime, timedelta
+from sqlalchemy import Date, DateTime, cast, func, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from app.models.retention_daily import RetentionDaily
 from app.models.retention_log import RetentionLog
-from .base import GenericRepository
+from .base import MAX_QUERY_PARAMS, GenericRepository
+from .retention_daily_repository import midnight
 import uuid
 
 
+def _log_count(user_id: uuid.UUID, *conditions):
+    return (
+        select(func.count())
+        .where(RetentionLog.user_id == user_id, *conditions)
+        .scalar_subquery()
+    )
+
+
+def review_count(user_id: uuid.UUID, start: datetime, end: datetime):
+    """Число ответов пользователя за [start, end] одним выражением.
+
+    Целые дни UTC до последнего свернутого берутся из retention_daily,
+    края периода и дни после свертки считаются по журналу через индекс
+    (user_id, timestamp), так что время не зависит от длины периода.
+    Время без зоны считается UTC.
+    """
+    start, end = (
+        moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+        for moment in (start, end)
+    )
+    first_day = start.astimezone(UTC).date()
+    if midnight(first_day) < start:
+        first_day += timedelta(days=1)
+    last_day = end.astimezone(UTC).date() - timedelta(days=1)
+    if last_day < first_day:
+        return _log_count(
+            user_id,
+            RetentionLog.timestamp >= start,
+            RetentionLog.timestamp <= end,
+        )
+
+    rolled = select(func.max(RetentionDaily.day)).scalar_subquery()
+    rolled_day = func.least(
+        last_day,
+        func.coalesce(rolled, first_day - timedelta(days=1)),
+        type_=Date,
+    )
+    daily = (
+        select(func.coalesce(func.sum(RetentionDaily.reviews), 0))
+        .where(
+            RetentionDaily.user_id == user_id,
+            RetentionDaily.day >= first_day,
+            RetentionDaily.day <= rolled_day,
+        )
+        .scalar_subquery()
+    )
+    rolled_end = func.timezone("UTC", cast(rolled_day + 1, DateTime))
+    head = _log_count(
+        user_id,
+        RetentionLog.timestamp >= start,
+        RetentionLog.timestamp < midnight(first_day),
+    )
+    tail = _log_count(
+        user_id,
+        RetentionLog.timestamp
+        >= func.greatest(midnight(first_day), rolled_end),
+        RetentionLog.timestamp <= end,
+    )
+    return head + daily + tail
+
+
 class RetentionLogRepository(GenericRepository):
     def __init__(self, session: AsyncSession):
         super().__init__(session, RetentionLog)
@@ -14,9 +78,52 @@ class RetentionLogRepository(GenericRepository):
         self, user_id: uuid.UUID, start: datetime, end: datetime
     ):
         result = await self.session.execute(
-            select(RetentionLog)
-            .where(RetentionLog.user_id == user_id)
-            .where(RetentionLog.timestamp >= start)
-            .where(RetentionLog.timestamp <= end)
+            select(review_count(user_id, start, end))
         )
-        return len(result.scalars().all())
+        return result.scalar()
+
+    async def add_many(self, rows: list[dict]) -> int:
+        """Добавляет записи журнала пачками без фиксации транзакции"""
+        if not rows:
+            return 0
+        chunk_size = MAX_QUERY_PARAMS // len(rows[0])
+        for start in range(0, len(rows), chunk_size):
+            await self.session.execute(
+                insert(RetentionLog).values(rows[start : start + chunk_size])
+            )
+        return len(rows)
+
+    async def stream_history(
+        self, chunk_size: int, after_user: uuid.UUID | None = None
+    ):
+        """Журнал всех пользователей через серверный курсор.
+
+        Строки (user_id, concept_id, timestamp, retention_before,
+        retention_after) идут в порядке уникального индекса
+        (user_id, concept_id, timestamp) пачками по chunk_size, так что
+        в памяти одновременно не больше одной пачки.
+
+        Args:
+            after_user: Начать с пользователей с id больше указанного.
+        """
+        query = (
+            select(
+                RetentionLog.user_id,
+                RetentionLog.concept_id,
+                RetentionLog.timestamp,
+                RetentionLog.retention_before,
+                RetentionLog.retention_after,
+            )
+            .order_by(
+                RetentionLog.user_id,
+                RetentionLog.concept_id,
+                RetentionLog.timestamp,
+            )
+            .execution_options(yield_per=chunk_size)
+        )
+        if after_user is not None:
+            query = query.where(RetentionLog.user_id > after_user)
+
+        result = await self.session.stream(query)
+        async for rows in result.partitions():
+            yield rows
@@ -0,0 +1,63 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import Session
+
+from .base import DEFERRED_COMMIT
+
+
+class UnitOfWork:
+    """Одна транзакция для записей через несколько репозиториев.
+
+    Внутри ``async with`` репозитории на этой сессии не фиксируют
+    изменения, а только сбрасывают их в БД в порядке вызовов, так что
+    ключи уже записанных сущностей доступны следующим. При выходе
+    транзакция фиксируется одним commit, при исключении откатывается.
+
+    Example:
+        async with UnitOfWork() as uow:
+            user = await uow.repository(UserRepository).add(User(...))
+            await uow.repository(ProfileRepository).add(
+                UserProfile(user_id=user.id)
+            )
+    """
+
+    def __init__(
+        self, session: AsyncSession | None = None, session_factory=Session
+    ):
+        self.session = session
+        self.session_factory = session_factory
+        self._owns_session = session is None
+        self._repositories = {}
+        self._previous = False
+
+    async def __aenter__(self):
+        if self.session is None:
+            self.session = self.session_factory()
+        self._previous = self.session.info.get(DEFERRED_COMMIT, False)
+        self.session.info[DEFERRED_COMMIT] = True
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and not self._previous:
+                await self.session.commit()
+            elif exc_type is not None:
+                await self.session.rollback()
+        finally:
+            self.session.info[DEFERRED_COMMIT] = self._previous
+            if self._owns_session:
+                await self.session.close()
+                self.session = None
+            self._repositories = {}
+        return False
+
+    def repository(self, repository_class):
+        """Репозиторий на сессии этой единицы работы"""
+        repository = self._repositories.get(repository_class)
+        if repository is None:
+            repository = repository_class(self.session)
+            self._repositories[repository_class] = repository
+        return repository
+
+    async def flush(self):
+        await self.session.flush()
@@ -3,6 +3,7 @@ import uuid
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.models.domains import Domain
 from app.models.user_domains import UserDomain
 
 from .base import GenericRepository
@@ -17,3 +18,12 @@ class UserDomainRepository(GenericRepository):
             select(UserDomain).where(UserDomain.user_id == user_id)
         )
         return result.scalars().all()
+
+    async def domain_names(self, user_id: uuid.UUID) -> list[str]:
+        """Названия доменов пользователя одним запросом"""
+        result = await self.session.execute(
+            select(Domain.name)
+            .join(UserDomain, UserDomain.domain_id == Domain.id)
+            .where(UserDomain.user_id == user_id)
+        )
+        return list(result.scalars().all())
@@ -1,33 +1,417 @@
+import base64
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from sqlalchemy import func
+from sqlalchemy import Float, and_, cast, delete, func, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.models.concepts import Concept
 from app.models.user_knowledge import UserKnowledge
+from app.models.users import User
 
-from .base import GenericRepository
+from .base import MAX_QUERY_PARAMS, GenericRepository
+from .concept_repository import BULK_CHUNK_SIZE
+from .retention_log_repository import review_count
+
+SECONDS_PER_DAY = 86400.0
+WEAK_RETENTION = 0.5
+STRONG_RETENTION = 0.7
+
+
+def days_since_review(now=None):
+    """Дни с последнего повторения карточки, не меньше нуля"""
+    now = func.now() if now is None else now
+    seconds = func.extract("epoch", now - UserKnowledge.last_reviewed)
+    days = cast(seconds, Float) / SECONDS_PER_DAY
+    return func.greatest(func.coalesce(days, 0.0), 0.0)
+
+
+def predicted_retention(now=None, lambda_coef=User.lambda_coef):
+    """SQL-выражение SpacedRepetitionService.predicted_retention.
+
+    Запрос должен содержать users (lambda_coef владельца карточки),
+    если lambda_coef не передан значением.
+    """
+    return func.coalesce(UserKnowledge.retention, 0.0) * func.exp(
+        -func.coalesce(lambda_coef, 0.5) * days_since_review(now)
+    )
+
+
+def encode_cursor(next_review: datetime | None, concept_id: int) -> str:
+    """Непрозрачный курсор страницы после карточки (next_review, id)"""
+    moment = next_review.isoformat() if next_review is not None else ""
+    raw = f"{moment}|{concept_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, int]:
+    """Обратное encode_cursor, ValueError для испорченного курсора"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        moment, concept_id = raw.rsplit("|", 1)
+        if not moment:
+            return None, int(concept_id)
+        return datetime.fromisoformat(moment), int(concept_id)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+# Колонки постраничного списка карточек и выгрузки
+LISTING_COLUMNS = (
+    UserKnowledge.concept_id,
+    Concept.name,
+    UserKnowledge.retention,
+    UserKnowledge.next_review,
+)
+EXPORT_COLUMNS = (
+    Concept.name,
+    Concept.description,
+    UserKnowledge.retention,
+    UserKnowledge.last_reviewed,
+    UserKnowledge.next_review,
+)
 
 
 class UserKnowledgeRepository(GenericRepository):
     def __init__(self, session: AsyncSession):
         super().__init__(session, UserKnowledge)
 
+    async def bulk_add(
+        self,
+        user_id: uuid.UUID,
+        concept_ids: list[int],
+        retention: float,
+        last_reviewed: datetime,
+        next_review: datetime,
+    ) -> int:
+        """Добавляет пользователю концепты, которых у него еще нет.
+
+        Уже существующие пары (user_id, concept_id) не изменяются.
+        Транзакция не фиксируется.
+
+        Returns:
+            Число добавленных записей.
+        """
+        concept_ids = list(dict.fromkeys(concept_ids))
+        added = 0
+        for start in range(0, len(concept_ids), BULK_CHUNK_SIZE):
+            rows = [
+                {
+                    "user_id": user_id,
+                    "concept_id": concept_id,
+                    "retention": retention,
+                    "last_reviewed": last_reviewed,
+                    "next_review": next_review,
+                }
+                for concept_id in concept_ids[start : start + BULK_CHUNK_SIZE]
+            ]
+            result = await self.session.execute(
+                insert(UserKnowledge)
+                .values(rows)
+                .on_conflict_do_nothing(
+                    index_elements=[
+                        UserKnowledge.user_id,
+                        UserKnowledge.concept_id,
+                    ]
+                )
+            )
+            added += result.rowcount
+        return added
+
+    async def upsert_many(self, user_id: uuid.UUID, rows: list[dict]) -> int:
+        """Записывает карточки пользователя многострочными INSERT.
+
+        Существующим карточкам retention и сроки заменяются значениями
+        из rows. Транзакция не фиксируется.
+
+        Args:
+            rows: Словари с concept_id, retention, last_reviewed и
+                next_review, при повторе concept_id берется последний.
+        """
+        rows = list({row["concept_id"]: row for row in rows}.values())
+        chunk_size = MAX_QUERY_PARAMS // 5
+        for start in range(0, len(rows), chunk_size):
+            stmt = insert(UserKnowledge).values(
+                [
+                    {"user_id": user_id, **row}
+                    for row in rows[start : start + chunk_size]
+                ]
+            )
+            await self.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[
+                        UserKnowledge.user_id,
+                        UserKnowledge.concept_id,
+                    ],
+                    set_={
+                        key: stmt.excluded[key]
+                        for key in (
+                            "retention",
+                            "last_reviewed",
+                            "next_review",
+                        )
+                    },
+                )
+            )
+        return len(rows)
+
+    async def remove(self, user_id: uuid.UUID, concept_ids: list) -> list:
+        """Удаляет карточки пользователя без фиксации транзакции.
+
+        Returns:
+            retention удаленных карточек.
+        """
+        result = await self.session.execute(
+            delete(UserKnowledge)
+            .where(UserKnowledge.user_id == user_id)
+            .where(UserKnowledge.concept_id.in_(concept_ids))
+            .returning(UserKnowledge.retention)
+        )
+        return list(result.scalars().all())
+
+    async def get_review_states(self, pairs: list[tuple]) -> list:
+        """retention карточек и lambda_coef их владельцев одним запросом.
+
+        Args:
+            pairs: Пары (user_id, concept_id).
+
+        Returns:
+            Строки (user_id, concept_id, retention, lambda_coef).
+        """
+        if not pairs:
+            return []
+        result = await self.session.execute(
+            select(
+                UserKnowledge.user_id,
+                UserKnowledge.concept_id,
+                UserKnowledge.retention,
+                User.lambda_coef,
+            )
+            .join(User, User.id == UserKnowledge.user_id)
+            .where(
+                tuple_(UserKnowledge.user_id, UserKnowledge.concept_id).in_(
+                    pairs
+                )
+            )
+        )
+        return result.all()
+
+    async def schedule_page(self, after: tuple | None, limit: int) -> list:
+        """Страница (user_id, concept_id, retention) в порядке ключа.
+
+        Args:
+            after: Последняя пара (user_id, concept_id) предыдущей
+                страницы или None для первой.
+        """
+        query = (
+            select(
+                UserKnowledge.user_id,
+                UserKnowledge.concept_id,
+                UserKnowledge.retention,
+            )
+            .where(UserKnowledge.last_reviewed.is_not(None))
+            .order_by(UserKnowledge.user_id, UserKnowledge.concept_id)
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(
+                tuple_(UserKnowledge.user_id, UserKnowledge.concept_id)
+                > tuple_(*after)
+            )
+        result = await self.session.execute(query)
+        return result.all()
+
+    def _listing(
+        self, user_id: uuid.UUID, after: tuple | None, columns=LISTING_COLUMNS
+    ):
+        query = (
+            select(*columns)
+            .join(Concept, UserKnowledge.concept_id == Concept.id)
+            .where(UserKnowledge.user_id == user_id)
+            .order_by(UserKnowledge.next_review, UserKnowledge.concept_id)
+        )
+        # NULL в next_review идут после всех дат (NULLS LAST)
+        if after is None:
+            return query
+        moment, concept_id = after
+        if moment is None:
+            return query.where(
+                UserKnowledge.next_review.is_(None),
+                UserKnowledge.concept_id > concept_id,
+            )
+        return query.where(
+            or_(
+                tuple_(UserKnowledge.next_review, UserKnowledge.concept_id)
+                > tuple_(moment, concept_id),
+                UserKnowledge.next_review.is_(None),
+            )
+        )
+
+    async def knowledge_page(
+        self, user_id: uuid.UUID, after: tuple | None, limit: int
+    ) -> list:
+        """Страница карточек пользователя в порядке (next_review, id).
+
+        Страница начинается сразу после ключа after, поэтому стоимость
+        не зависит от глубины: запрос читает диапазон индекса
+        (user_id, next_review, concept_id) с нужного места. Карточки без
+        next_review идут в конце, как и в индексе.
+
+        Args:
+            after: (next_review, concept_id) последней карточки
+                предыдущей страницы или None для первой.
+
+        Returns:
+            Строки (concept_id, название, retention, next_review).
+        """
+        result = await self.session.execute(
+            self._listing(user_id, after).limit(limit)
+        )
+        return result.all()
+
+    async def stream_knowledge(
+        self,
+        user_id: uuid.UUID,
+        after: tuple | None = None,
+        chunk_size: int = 1000,
+        columns=LISTING_COLUMNS,
+    ):
+        """Все карточки пользователя после after через серверный курсор.
+
+        Строки те же, что у knowledge_page, или с колонками columns,
+        приходят пачками по chunk_size, в памяти не больше одной пачки.
+        """
+        result = await self.session.stream(
+            self._listing(user_id, after, columns).execution_options(
+                yield_per=chunk_size
+            )
+        )
+        async for rows in result.partitions():
+            yield rows
+
     async def get_by_user_with_concepts(
-        self, user_id: uuid.UUID, limit: int = 20, min_retention: float = 0.0
+        self,
+        user_id: uuid.UUID,
+        limit: int = 20,
+        min_retention: float = 0.0,
+        now: datetime | None = None,
+        max_predicted: float | None = None,
+    ):
+        """Очередь повторений пользователя с названиями концептов.
+
+        Сначала идут карточки, срок которых наступил, от наименьшего
+        ожидаемого удержания (сильно просроченные раньше слегка
+        просроченных), затем остальные по next_review. Оба запроса
+        читают индекс (user_id, next_review), сортировка выполняется
+        только по наступившим карточкам.
+
+        Args:
+            now: Момент, на который считается удержание, по умолчанию
+                время БД.
+            max_predicted: Вернуть только наступившие карточки с ожидаемым
+                удержанием не выше указанного.
+        """
+        return await self._review_queue(
+            (UserKnowledge, Concept.name),
+            user_id,
+            limit,
+            min_retention,
+            now,
+            max_predicted,
+        )
+
+    async def get_review_cards(
+        self, user_id: uuid.UUID, limit: int = 20, now: datetime | None = None
+    ):
+        """Та же очередь, строки (UserKnowledge, название, определение)"""
+        return await self._review_queue(
+            (UserKnowledge, Concept.name, Concept.description),
+            user_id,
+            limit,
+            now=now,
+        )
+
+    async def _review_queue(
+        self,
+        columns,
+        user_id,
+        limit,
+        min_retention=0.0,
+        now=None,
+        max_predicted=None,
     ):
-        """Возвращает знания пользователя с названиями концептов"""
+        due_at = func.now() if now is None else now
         query = (
-            select(UserKnowledge, Concept.name)
+            select(*columns)
             .join(Concept, UserKnowledge.concept_id == Concept.id)
+            .join(User, User.id == UserKnowledge.user_id)
             .where(UserKnowledge.user_id == user_id)
             .where(UserKnowledge.retention >= min_retention)
-            .order_by(UserKnowledge.next_review.asc())
+            .where(
+                or_(
+                    UserKnowledge.next_review.is_(None),
+                    UserKnowledge.next_review <= due_at,
+                )
+            )
+            .order_by(predicted_retention(now), UserKnowledge.concept_id)
             .limit(limit)
         )
+        if max_predicted is not None:
+            query = query.where(predicted_retention(now) <= max_predicted)
+
+        result = await self.session.execute(query)
+        items = result.all()
+        if len(items) >= limit or max_predicted is not None:
+            return items
+
+        result = await self.session.execute(
+            select(*columns)
+            .join(Concept, UserKnowledge.concept_id == Concept.id)
+            .where(UserKnowledge.user_id == user_id)
+            .where(UserKnowledge.retention >= min_retention)
+            .where(UserKnowledge.next_review > due_at)
+            .order_by(UserKnowledge.next_review.asc())
+            .limit(limit - len(items))
+        )
+        return items + result.all()
+
+    async def review_forecast(
+        self,
+        days: int,
+        user_id: uuid.UUID | None = None,
+        now: datetime | None = None,
+    ) -> list:
+        """Число карточек, наступающих в каждый из ближайших days дней.
+
+        Просроченные карточки и карточки без next_review считаются в
+        текущий день. Для одного пользователя запрос читает диапазон
+        индекса (user_id, next_review), для всех - весь индекс без
+        чтения таблицы.
 
+        Returns:
+            Строки (день, число карточек) по возрастанию дня, дни без
+            карточек пропущены.
+        """
+        now = func.now() if now is None else now
+        # Дни считаются по UTC независимо от часового пояса сессии
+        moment = func.greatest(UserKnowledge.next_review, now)
+        day = func.date_trunc("day", func.timezone("UTC", moment)).label("day")
+        query = (
+            select(day, func.count())
+            .where(
+                or_(
+                    UserKnowledge.next_review.is_(None),
+                    UserKnowledge.next_review < now + timedelta(days=days),
+                )
+            )
+            .group_by(day)
+            .order_by(day)
+        )
+        if user_id is not None:
+            query = query.where(UserKnowledge.user_id == user_id)
         result = await self.session.execute(query)
         return result.all()
 
@@ -37,7 +421,7 @@ class UserKnowledgeRepository(GenericRepository):
         min_retention: float = None,
         max_retention: float = None,
     ):
-        query = select(UserKnowledge).where(UserKnowledge.user_id == user_id)
+        query = select(func.count()).where(UserKnowledge.user_id == user_id)
 
         if min_retention is not None:
             query = query.where(UserKnowledge.retention >= min_retention)
@@ -46,7 +430,7 @@ class UserKnowledgeRepository(GenericRepository):
             query = query.where(UserKnowledge.retention <= max_retention)
 
         result = await self.session.execute(query)
-        return len(result.scalars().all())
+        return result.scalar()
 
     async def avg_retention_by_user(self, user_id: uuid.UUID):
         result = await self.session.execute(
@@ -60,9 +444,51 @@ class UserKnowledgeRepository(GenericRepository):
         self, user_id: uuid.UUID, start: datetime, end: datetime
     ):
         result = await self.session.execute(
-            select(UserKnowledge)
+            select(func.count())
             .where(UserKnowledge.user_id == user_id)
             .where(UserKnowledge.last_reviewed >= start)
             .where(UserKnowledge.last_reviewed <= end)
         )
-        return len(result.scalars().all())
+        return result.scalar()
+
+    async def stats_by_user(
+        self,
+        user_id: uuid.UUID,
+        start: datetime,
+        end: datetime,
+        weak_below: float = WEAK_RETENTION,
+        strong_from: float = STRONG_RETENTION,
+    ) -> dict:
+        """Статистика знаний пользователя одним запросом.
+
+        Счетчики карточек считаются агрегатами с FILTER за один проход по
+        индексу (user_id, next_review), число ответов за период -
+        подзапросами по дневной свертке и краям периода в retention_logs
+        (review_count).
+
+        Returns:
+            Словарь с ключами total, weak, strong, avg_retention, added
+            и reviews.
+        """
+        reviews = review_count(user_id, start, end)
+        added = and_(
+            UserKnowledge.last_reviewed >= start,
+            UserKnowledge.last_reviewed <= end,
+        )
+        result = await self.session.execute(
+            select(
+                func.count().label("total"),
+                func.count()
+                .filter(UserKnowledge.retention <= weak_below)
+                .label("weak"),
+                func.count()
+                .filter(UserKnowledge.retention >= strong_from)
+                .label("strong"),
+                func.coalesce(func.avg(UserKnowledge.retention), 0.0).label(
+                    "avg_retention"
+                ),
+                func.count().filter(added).label("added"),
+                reviews.label("reviews"),
+            ).where(UserKnowledge.user_id == user_id)
+        )
+        return dict(result.mappings().one())
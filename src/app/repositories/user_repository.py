@@ -21,3 +21,11 @@ class UserRepository(GenericRepository):
             select(User).where(User.email == email)
         )
         return result.scalar_one_or_none()
+
+    async def ids_after(self, after_id=None, limit: int = 1000) -> list:
+        """id пользователей по возрастанию, начиная после after_id"""
+        query = select(User.id).order_by(User.id).limit(limit)
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        result = await self.session.execute(query)
+        return list(result.scalars().all())
@@ -0,0 +1,295 @@
+import uuid
+from datetime import UTC, date, datetime, time, timedelta
+
+from sqlalchemy import Integer, and_, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, array, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.retention_log import RetentionLog
+from app.models.user_knowledge import UserKnowledge
+from app.models.user_stats import STATS_BUCKET_DAYS, UserStats
+
+from .base import GenericRepository
+from .user_knowledge_repository import STRONG_RETENTION, WEAK_RETENTION
+
+COUNTERS = ("total_cards", "weak_cards", "strong_cards", "retention_sum")
+
+
+def stats_delta(user_id, retention=None, count=1, reviews=0, added=0) -> dict:
+    """Изменение счетчиков от появления count карточек с retention.
+
+    Отрицательный count означает удаление карточек.
+    """
+    delta = {
+        "user_id": user_id,
+        "total_cards": 0,
+        "weak_cards": 0,
+        "strong_cards": 0,
+        "retention_sum": 0.0,
+        "reviews": reviews,
+        "added": added,
+    }
+    if retention is not None:
+        delta["total_cards"] = count
+        delta["weak_cards"] = count * (retention <= WEAK_RETENTION)
+        delta["strong_cards"] = count * (retention >= STRONG_RETENTION)
+        delta["retention_sum"] = count * retention
+    return delta
+
+
+def review_delta(user_id, before: float, after: float) -> dict:
+    """Ответ на карточку: retention изменился с before на after"""
+    delta = merge_deltas(
+        [stats_delta(user_id, before, -1), stats_delta(user_id, after)]
+    )[0]
+    delta["reviews"] = 1
+    return delta
+
+
+def merge_deltas(deltas) -> list[dict]:
+    """Складывает изменения одного пользователя в одно"""
+    merged = {}
+    for delta in deltas:
+        current = merged.get(delta["user_id"])
+        if current is None:
+            merged[delta["user_id"]] = dict(delta)
+            continue
+        for key, value in delta.items():
+            if key != "user_id":
+                current[key] += value
+    return list(merged.values())
+
+
+def shift_buckets(buckets: list, from_day: date, to_day: date) -> list:
+    """Сдвигает дневные корзины так, чтобы первая относилась к to_day"""
+    shift = min(max((to_day - from_day).days, 0), STATS_BUCKET_DAYS)
+    return ([0] * shift + list(buckets))[:STATS_BUCKET_DAYS]
+
+
+def _buckets(first: int) -> list:
+    return [first] + [0] * (STATS_BUCKET_DAYS - 1)
+
+
+def _shifted(buckets, day):
+    """Корзины с нулями впереди за дни от buckets_day до day.
+
+    Результат длиннее STATS_BUCKET_DAYS, лишнее отрезается срезом. Срез
+    нельзя индексировать повторно: Postgres прочитает это как срез
+    многомерного массива.
+    """
+    shift = func.least(
+        func.greatest(day - UserStats.buckets_day, 0), STATS_BUCKET_DAYS
+    )
+    return func.array_cat(
+        func.array_fill(0, array([shift]), type_=ARRAY(Integer)),
+        buckets,
+        type_=ARRAY(Integer),
+    )
+
+
+class UserStatsRepository(GenericRepository):
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, UserStats)
+
+    async def apply(self, deltas: list[dict], day: date) -> int:
+        """Прибавляет изменения к счетчикам пользователей.
+
+        Вызывается в транзакции, меняющей карточки, после записи
+        изменений, транзакция не фиксируется. Корзины сдвигаются к day
+        прямо в UPDATE. Пользователю без строки счетчики сначала
+        считаются по исходным таблицам (_seed_missing), иначе первое
+        изменение записалось бы как абсолютные значения.
+
+        Args:
+            deltas: Изменения из stats_delta, review_delta.
+            day: День, к которому относятся ответы и добавления.
+        """
+        merged = merge_deltas(deltas)
+        if not merged:
+            return 0
+        seeded = await self._seed_missing(merged, day)
+        rows = [
+            {
+                "user_id": delta["user_id"],
+                **{key: delta[key] for key in COUNTERS},
+                "review_buckets": _buckets(delta["reviews"]),
+                "added_buckets": _buckets(delta["added"]),
+                "buckets_day": day,
+            }
+            for delta in merged
+            if delta["user_id"] not in seeded
+        ]
+        if not rows:
+            return len(merged)
+
+        stmt = insert(UserStats).values(rows)
+        excluded = stmt.excluded
+
+        def advance(current, new):
+            # Сдвиг к новому дню и прибавление его значения к первой
+            # корзине
+            shifted = _shifted(current, excluded.buckets_day)
+            return func.array_cat(
+                array([shifted[1] + new[1]]),
+                shifted[2:STATS_BUCKET_DAYS],
+            )
+
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[UserStats.user_id],
+                set_={
+                    **{
+                        key: getattr(UserStats, key) + getattr(excluded, key)
+                        for key in COUNTERS
+                    },
+                    "review_buckets": advance(
+                        UserStats.review_buckets, excluded.review_buckets
+                    ),
+                    "added_buckets": advance(
+                        UserStats.added_buckets, excluded.added_buckets
+                    ),
+                    "buckets_day": func.greatest(
+                        UserStats.buckets_day, excluded.buckets_day
+                    ),
+                    "updated_at": func.now(),
+                },
+            )
+        )
+        return len(merged)
+
+    async def _seed_missing(self, deltas: list[dict], day: date) -> set:
+        """Создает строки пользователям без счетчиков по source_stats.
+
+        Изменения уже записаны в транзакции, поэтому пересчет их
+        включает. Если строку параллельно создала другая транзакция,
+        вставка пропускается, и к ней прибавляется изменение.
+
+        Returns:
+            Пользователи, для которых строка создана.
+        """
+        user_ids = [delta["user_id"] for delta in deltas]
+        result = await self.session.execute(
+            select(UserStats.user_id).where(UserStats.user_id.in_(user_ids))
+        )
+        existing = set(result.scalars().all())
+        missing = [user_id for user_id in user_ids if user_id not in existing]
+        if not missing:
+            return set()
+
+        added = {delta["user_id"]: delta["added"] for delta in deltas}
+        stats = await self.source_stats(missing, day)
+        result = await self.session.execute(
+            insert(UserStats)
+            .values(
+                [
+                    {**row, "added_buckets": _buckets(added[user_id])}
+                    for user_id, row in stats.items()
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=[UserStats.user_id])
+            .returning(UserStats.user_id)
+        )
+        return set(result.scalars().all())
+
+    async def summary(self, user_id: uuid.UUID, today: date) -> dict | None:
+        """Статистика из счетчиков, None если их еще нет"""
+        stats = await self.get_by_id(user_id)
+        if stats is None:
+            return None
+        reviews = shift_buckets(stats.review_buckets, stats.buckets_day, today)
+        added = shift_buckets(stats.added_buckets, stats.buckets_day, today)
+        total = stats.total_cards
+        return {
+            "total": total,
+            "weak": stats.weak_cards,
+            "strong": stats.strong_cards,
+            "avg_retention": stats.retention_sum / total if total else 0.0,
+            "added": sum(added),
+            "reviews": sum(reviews),
+        }
+
+    async def get_many(self, user_ids: list) -> list:
+        result = await self.session.execute(
+            select(UserStats).where(UserStats.user_id.in_(user_ids))
+        )
+        return list(result.scalars().all())
+
+    async def source_stats(self, user_ids: list, today: date) -> dict:
+        """Счетчики, посчитанные заново по user_knowledge и retention_logs.
+
+        Returns:
+            {user_id: строка для replace} для каждого из user_ids.
+            added_buckets не считаются: время добавления карточки в
+            исходных таблицах не хранится.
+        """
+        result = await self.session.execute(
+            select(
+                UserKnowledge.user_id,
+                func.count(),
+                func.count().filter(UserKnowledge.retention <= WEAK_RETENTION),
+                func.count().filter(
+                    UserKnowledge.retention >= STRONG_RETENTION
+                ),
+                func.coalesce(func.sum(UserKnowledge.retention), 0.0),
+            )
+            .where(UserKnowledge.user_id.in_(user_ids))
+            .group_by(UserKnowledge.user_id)
+        )
+        stats = {
+            user_id: {
+                "user_id": user_id,
+                "total_cards": 0,
+                "weak_cards": 0,
+                "strong_cards": 0,
+                "retention_sum": 0.0,
+                "review_buckets": _buckets(0),
+                "buckets_day": today,
+            }
+            for user_id in user_ids
+        }
+        for user_id, *counters in result.all():
+            stats[user_id].update(zip(COUNTERS, counters))
+
+        day = func.date(func.timezone("UTC", RetentionLog.timestamp))
+        since = datetime.combine(
+            today - timedelta(days=STATS_BUCKET_DAYS - 1), time.min, UTC
+        )
+        result = await self.session.execute(
+            select(RetentionLog.user_id, day, func.count())
+            .where(
+                and_(
+                    RetentionLog.user_id.in_(user_ids),
+                    RetentionLog.timestamp >= since,
+                )
+            )
+            .group_by(RetentionLog.user_id, day)
+        )
+        for user_id, log_day, count in result.all():
+            row = stats.get(user_id)
+            offset = (today - log_day).days
+            if row is not None and 0 <= offset < STATS_BUCKET_DAYS:
+                row["review_buckets"][offset] += count
+        return stats
+
+    async def replace(self, rows: list[dict]) -> int:
+        """Записывает счетчики целиком, корзины добавлений сохраняются"""
+        if not rows:
+            return 0
+        stmt = insert(UserStats).values(
+            [{**row, "added_buckets": _buckets(0)} for row in rows]
+        )
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[UserStats.user_id],
+                set_={
+                    **{key: getattr(stmt.excluded, key) for key in COUNTERS},
+                    "review_buckets": stmt.excluded.review_buckets,
+                    "added_buckets": _shifted(
+                        UserStats.added_buckets, stmt.excluded.buckets_day
+                    )[1:STATS_BUCKET_DAYS],
+                    "buckets_day": stmt.excluded.buckets_day,
+                    "updated_at": func.now(),
+                },
+            )
+        )
+        return len(rows)
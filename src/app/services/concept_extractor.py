@@ -0,0 +1,108 @@
+import os
+import weakref
+
+from spacy.matcher import Matcher
+
+from app.utils.cache import LRUCache
+from app.utils.text import lemma_key, normalize_text
+
+# Увеличивается при изменении правил, чтобы не использовать старый кэш
+EXTRACTOR_VERSION = 2
+LEMMA_CACHE_SIZE = int(os.getenv("LEMMA_CACHE_SIZE", "50000"))
+
+ALLOWED_ENT_TYPES = {"PER", "ORG", "LOC", "MISC", "GPE", "EVENT", "PRODUCT"}
+NOUN_POS = ["NOUN", "PROPN"]
+
+# Шаблон и длина в символах, которую должна превышать найденная фраза
+PHRASE_PATTERNS = {
+    "TERM": (
+        [{"POS": {"IN": NOUN_POS}, "LENGTH": {">=": 4}}],
+        0,
+    ),
+    "ADJ_NOUN": (
+        [
+            {"POS": "ADJ", "LENGTH": {">=": 4}},
+            {"POS": {"IN": NOUN_POS}},
+        ],
+        7,
+    ),
+    "ADJ_ADJ_NOUN": (
+        [
+            {"POS": "ADJ", "LENGTH": {">=": 4}},
+            {"POS": "ADJ"},
+            {"POS": {"IN": NOUN_POS}},
+        ],
+        10,
+    ),
+}
+
+_extractors = weakref.WeakKeyDictionary()
+
+
+class ConceptExtractor:
+    """Извлекает концепты из Doc за один проход скомпилированного Matcher.
+
+    Концепты возвращаются как {канонический ключ: форма из текста}, где
+    ключ собран из лемм, поэтому разные падежи и числа одного термина
+    сводятся к одной записи. Соответствие формы и ключа запоминается в
+    ограниченном LRU-кэше.
+    """
+
+    def __init__(self, nlp, lemma_cache_size: int = LEMMA_CACHE_SIZE):
+        self.matcher = Matcher(nlp.vocab)
+        self.min_lengths = {}
+        for label, (pattern, min_length) in PHRASE_PATTERNS.items():
+            self.matcher.add(label, [pattern])
+            self.min_lengths[nlp.vocab.strings[label]] = min_length
+        self.lemmas = LRUCache(lemma_cache_size)
+
+    def extract(self, doc) -> dict:
+        concepts = {}
+
+        for ent in doc.ents:
+            if ent.label_ in ALLOWED_ENT_TYPES and len(ent.text) > 3:
+                self._add(concepts, ent, ent.text)
+
+        for match_id, start, end in self.matcher(doc):
+            span = doc[start:end]
+            phrase = " ".join(token.text for token in span)
+            if len(phrase) > self.min_lengths[match_id]:
+                self._add(concepts, span, phrase)
+
+        return concepts
+
+    def _add(self, concepts: dict, span, phrase: str):
+        surface = normalize_text(phrase)
+        canonical = self.lemmas.get(surface)
+        if canonical is None:
+            canonical = lemma_key(token.lemma_ or token.text for token in span)
+            self.lemmas.put(surface, canonical)
+        concepts.setdefault(canonical, surface)
+
+    def canonicalize(self, nlp, phrases: list[str]) -> list[str]:
+        """Приводит произвольные фразы к каноническому ключу"""
+        surfaces = [normalize_text(phrase) for phrase in phrases]
+        known = {}
+        missing = []
+        for surface in dict.fromkeys(surfaces):
+            canonical = self.lemmas.get(surface)
+            if canonical is None:
+                missing.append(surface)
+            else:
+                known[surface] = canonical
+
+        for surface, doc in zip(missing, nlp.pipe(missing)):
+            canonical = lemma_key(token.lemma_ or token.text for token in doc)
+            self.lemmas.put(surface, canonical)
+            known[surface] = canonical
+
+        return [known[surface] for surface in surfaces]
+
+
+def get_extractor(nlp) -> ConceptExtractor:
+    """Возвращает экстрактор, шаблоны которого собраны один раз на модель"""
+    extractor = _extractors.get(nlp)
+    if extractor is None:
+        extractor = ConceptExtractor(nlp)
+        _extractors[nlp] = extractor
+    return extractor
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import os
+from datetime import UTC, datetime, timedelta
+
+from app.db import Session
+from app.repositories.definition_cache_repository import (
+    DefinitionCacheRepository,
+)
+from app.utils.cache import LRUCache
+from app.utils.text import lemma_key
+
+logger = logging.getLogger(__name__)
+
+DEFINITION_CACHE_SIZE = int(os.getenv("DEFINITION_CACHE_SIZE", "5000"))
+DEFINITION_CACHE_TTL_DAYS = float(os.getenv("DEFINITION_CACHE_TTL_DAYS", "30"))
+DEFINITION_RETRY_BASE = float(os.getenv("DEFINITION_RETRY_BASE", "300"))
+DEFINITION_RETRY_MAX = float(os.getenv("DEFINITION_RETRY_MAX", "86400"))
+DEFINITION_CACHE_PURGE_EVERY = int(
+    os.getenv("DEFINITION_CACHE_PURGE_EVERY", "500")
+)
+
+
+class DefinitionCache:
+    """Кэш определений концептов: LRU в процессе и таблица в Postgres.
+
+    Ключ состоит из нормализованного названия концепта, модели и версии
+    промпта. Неудачные генерации тоже запоминаются, повтор для них
+    откладывается с экспоненциальной задержкой. Одновременные запросы
+    одного термина в процессе ждут один общий вызов генерации.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        prompt_version: int,
+        memory_size: int = DEFINITION_CACHE_SIZE,
+        ttl: timedelta = timedelta(days=DEFINITION_CACHE_TTL_DAYS),
+        retry_base: float = DEFINITION_RETRY_BASE,
+        retry_max: float = DEFINITION_RETRY_MAX,
+        purge_every: int = DEFINITION_CACHE_PURGE_EVERY,
+        session_factory=Session,
+    ):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.memory = LRUCache(memory_size)
+        self.ttl = ttl
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.purge_every = purge_every
+        self.session_factory = session_factory
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.negative_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.generated = 0
+        self.failed = 0
+        self._inflight = {}
+        self._writes_since_purge = 0
+
+    @staticmethod
+    def key(concept: str) -> str:
+        return lemma_key([concept])
+
+    def _memory_get(self, key: str):
+        entry = self.memory.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= datetime.now(UTC):
+            self.memory.pop(key)
+            return None
+        return entry
+
+    async def get_many(self, concepts) -> dict:
+        """Возвращает {концепт: определение} для найденных в кэше.
+
+        Для концепта, генерация которого недавно не удалась и еще не
+        прошла задержка, значение None.
+        """
+        found = {}
+        missing = {}
+        for concept in concepts:
+            key = self.key(concept)
+            entry = self._memory_get(key)
+            if entry is None:
+                missing.setdefault(key, []).append(concept)
+            else:
+                self.memory_hits += 1
+                found[concept] = entry[0]
+
+        if missing:
+            try:
+                async with self.session_factory() as session:
+                    stored = await DefinitionCacheRepository(session).get_many(
+                        list(missing), self.model, self.prompt_version
+                    )
+            except Exception as e:
+                logger.error(f"Definition cache lookup failed: {str(e)}")
+                stored = {}
+
+            for key, entry in stored.items():
+                self.memory.put(key, entry)
+                self.db_hits += len(missing[key])
+                for concept in missing[key]:
+                    found[concept] = entry[0]
+
+        for definition in found.values():
+            if definition is None:
+                self.negative_hits += 1
+        return found
+
+    def retry_at(self, concepts) -> datetime | None:
+        """Когда истечет последняя из недавних неудач генерации concepts"""
+        moments = [
+            entry[1]
+            for entry in (self._memory_get(self.key(c)) for c in concepts)
+            if entry is not None and entry[0] is None
+        ]
+        return max(moments, default=None)
+
+    async def put_many(self, definitions: dict):
+        """Сохраняет {концепт: определение или None при неудаче}"""
+        entries = {self.key(c): d for c, d in definitions.items()}
+        if not entries:
+            return
+        expires_at = datetime.now(UTC) + self.ttl
+        retry_at = datetime.now(UTC) + timedelta(seconds=self.retry_base)
+        for key, definition in entries.items():
+            self.memory.put(
+                key,
+                (definition, retry_at if definition is None else expires_at),
+            )
+
+        try:
+            async with self.session_factory() as session:
+                repo = DefinitionCacheRepository(session)
+                stored = await repo.put_many(
+                    entries,
+                    self.model,
+                    self.prompt_version,
+                    expires_at,
+                    self.retry_base,
+                    self.retry_max,
+                )
+                # В БД учтено число прошлых неудач и старое определение
+                for key, entry in stored.items():
+                    self.memory.put(key, entry)
+
+                self._writes_since_purge += len(entries)
+                if self._writes_since_purge >= self.purge_every:
+                    self._writes_since_purge = 0
+                    purged = await repo.purge_expired()
+                    if purged:
+                        logger.info(f"Definition cache purged {purged} rows")
+        except Exception as e:
+            logger.error(f"Definition cache write failed: {str(e)}")
+
+    async def get_or_generate(self, concepts, generate) -> dict:
+        """Возвращает определения, генерируя только отсутствующие в кэше.
+
+        Args:
+            concepts: Названия концептов.
+            generate: Корутина, которая принимает список названий и
+                возвращает {название: определение или None при неудаче}.
+
+        Returns:
+            {название: определение или None, если его нет и генерация
+            сейчас не удалась или отложена}.
+        """
+        concepts = list(dict.fromkeys(concepts))
+        result = await self.get_many(concepts)
+
+        loop = asyncio.get_running_loop()
+        waiting = {}
+        owned = {}
+        for concept in concepts:
+            if concept in result:
+                continue
+            key = self.key(concept)
+            future = self._inflight.get(key)
+            if future is not None:
+                waiting[concept] = future
+                self.coalesced += 1
+            else:
+                future = loop.create_future()
+                self._inflight[key] = future
+                owned[key] = (concept, future)
+
+        if owned:
+            names = [concept for concept, _ in owned.values()]
+            self.misses += len(names)
+            generated = {}
+            try:
+                generated = await generate(names)
+                await self.put_many(
+                    {name: generated.get(name) for name in names}
+                )
+            finally:
+                for key, (concept, future) in owned.items():
+                    self._inflight.pop(key, None)
+                    definition = generated.get(concept)
+                    if definition is None:
+                        self.failed += 1
+                    else:
+                        self.generated += 1
+                    future.set_result(definition)
+                    result[concept] = definition
+
+        for concept, future in waiting.items():
+            result[concept] = await future
+        return result
+
+    def metrics(self) -> dict:
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses + self.coalesced
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "negative_hits": self.negative_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "generated": self.generated,
+            "failed": self.failed,
+            "memory_size": len(self.memory),
+        }
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime
+
+from app.db import Session
+from app.repositories.concept_repository import ConceptRepository
+from app.repositories.job_repository import JobRepository
+from app.services.prompt_generator import DEFAULT_DEFINITION
+
+logger = logging.getLogger(__name__)
+
+DEFINE_CONCEPTS = "define_concepts"
+DEFINITION_JOB_SIZE = int(os.getenv("DEFINITION_JOB_SIZE", "20"))
+DEFINITION_JOB_ATTEMPTS = int(os.getenv("DEFINITION_JOB_ATTEMPTS", "8"))
+
+
+class DefinitionsPending(RuntimeError):
+    """Часть определений не сгенерирована, задачу нужно повторить"""
+
+    def __init__(self, message: str, retry_at: datetime | None = None):
+        super().__init__(message)
+        # Раньше этого момента кэш определений вернет ту же неудачу
+        self.retry_at = retry_at
+
+
+def _dedupe_key(chunk: list[int]) -> str:
+    # Ключ по всему набору id: у [1, 5] и [1, 3, 5] концы совпадают
+    digest = hashlib.sha1(",".join(map(str, chunk)).encode()).hexdigest()
+    return f"{DEFINE_CONCEPTS}:{digest}"
+
+
+def definition_jobs(concept_ids, size: int = DEFINITION_JOB_SIZE) -> list:
+    """Задачи генерации определений, по size концептов в каждой"""
+    ids = sorted(set(concept_ids))
+    return [
+        {
+            "kind": DEFINE_CONCEPTS,
+            "payload": {"concept_ids": chunk},
+            "dedupe_key": _dedupe_key(chunk),
+            "max_attempts": DEFINITION_JOB_ATTEMPTS,
+        }
+        for chunk in (
+            ids[start : start + size] for start in range(0, len(ids), size)
+        )
+    ]
+
+
+async def enqueue_definitions(session, concept_ids) -> int:
+    """Ставит генерацию определений в очередь в текущей транзакции"""
+    return await JobRepository(session).enqueue_many(
+        definition_jobs(concept_ids)
+    )
+
+
+async def define_concepts(
+    payload: dict, prompt_service, session_factory=Session
+):
+    """Обработчик задачи: заполняет определения концептов из payload.
+
+    Концепты, у которых определение уже есть, пропускаются, поэтому
+    повтор задачи безопасен. Сессия не держится открытой во время
+    генерации: концепты читаются в одной, определения записываются в
+    другой и только тем, у кого их все еще нет.
+
+    Raises:
+        DefinitionsPending: Если часть определений не удалось получить.
+    """
+    async with session_factory() as session:
+        concepts = await ConceptRepository(session).get_undefined(
+            payload["concept_ids"]
+        )
+        names = {concept.id: concept.name for concept in concepts}
+    if not names:
+        return
+
+    definitions = await prompt_service.generate_concept_definitions(
+        list(names.values())
+    )
+    ready = {}
+    failed = []
+    for concept_id, name in names.items():
+        definition = definitions.get(name)
+        if definition and definition != DEFAULT_DEFINITION:
+            ready[concept_id] = definition
+        else:
+            failed.append(name)
+
+    if ready:
+        async with session_factory() as session:
+            for concept in await ConceptRepository(session).get_undefined(
+                list(ready)
+            ):
+                concept.description = ready[concept.id]
+            await session.commit()
+
+    if failed:
+        cache = prompt_service.cache
+        raise DefinitionsPending(
+            f"{len(failed)} of {len(names)} definitions are not generated",
+            retry_at=cache.retry_at(failed) if cache is not None else None,
+        )
+
+
+async def _backfill(after_id: int, batch_size: int):
+    total = 0
+    while True:
+        async with Session() as session:
+            ids = await ConceptRepository(session).undefined_ids(
+                after_id, limit=batch_size
+            )
+            if not ids:
+                break
+            enqueued = await enqueue_definitions(session, ids)
+            await session.commit()
+        total += enqueued
+        after_id = ids[-1]
+        print(f"Поставлено задач: {total}, последний id концепта: {after_id}")
+    return total
+
+
+def backfill_definitions():
+    """Ставит в очередь генерацию определений для всех концептов-заглушек.
+
+    Повторный запуск безопасен: концепты с определением не выбираются,
+    а еще не выполненные задачи не дублируются. Прерванный запуск можно
+    продолжить с --after-id.
+    """
+    parser = argparse.ArgumentParser(description=backfill_definitions.__doc__)
+    parser.add_argument(
+        "--after-id",
+        type=int,
+        default=0,
+        help="Начать с концептов с id больше указанного",
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    total = asyncio.run(_backfill(args.after_id, args.batch_size))
+    print(f"✅ Готово, поставлено задач: {total}")
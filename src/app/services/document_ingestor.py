@@ -0,0 +1,169 @@
+import codecs
+import logging
+import os
+from dataclasses import dataclass
+from itertools import islice
+from time import monotonic, perf_counter
+
+from razdel import sentenize
+
+from app.db import Session
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_EXTENSIONS = {".txt", ".md"}
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(20 * 1024**2)))
+DOCUMENT_BATCH_SENTENCES = int(os.getenv("DOCUMENT_BATCH_SENTENCES", "256"))
+DOCUMENT_PROGRESS_INTERVAL = float(
+    os.getenv("DOCUMENT_PROGRESS_INTERVAL", "3")
+)
+READ_CHUNK_BYTES = 64 * 1024
+# Текст без границ предложений не копится в памяти дольше этого размера
+MAX_SENTENCE_CHARS = 10_000
+
+
+@dataclass
+class IngestionProgress:
+    """Состояние загрузки документа для отчета пользователю"""
+
+    total_bytes: int = 0
+    bytes_read: int = 0
+    sentences: int = 0
+    batches: int = 0
+    concepts_added: int = 0
+    seconds: float = 0.0
+    done: bool = False
+
+    @property
+    def percent(self) -> float:
+        if not self.total_bytes:
+            return 1.0 if self.done else 0.0
+        return min(1.0, self.bytes_read / self.total_bytes)
+
+
+def read_chunks(file, progress=None, chunk_bytes: int = READ_CHUNK_BYTES):
+    """Читает бинарный файл кусками и декодирует их как UTF-8.
+
+    Многобайтовые символы на границе кусков собирает инкрементальный
+    декодер, поэтому файл никогда не читается целиком.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while chunk := file.read(chunk_bytes):
+        if progress is not None:
+            progress.bytes_read += len(chunk)
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def split_sentences(chunks, max_chars: int = MAX_SENTENCE_CHARS):
+    """Разбивает поток текста на предложения.
+
+    Последнее предложение куска может продолжаться в следующем, поэтому
+    оно остается в буфере до прихода новых данных.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        sentences = list(sentenize(buffer))
+        if len(sentences) > 1:
+            for sentence in sentences[:-1]:
+                yield sentence.text
+            buffer = buffer[sentences[-1].start :]
+        if len(buffer) > max_chars:
+            yield buffer
+            buffer = ""
+
+    for sentence in sentenize(buffer):
+        yield sentence.text
+
+
+def batched(items, size: int):
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class DocumentIngestor:
+    """Потоковая загрузка больших текстовых документов.
+
+    Файл читается кусками, разбивается на предложения, концепты
+    извлекаются и сохраняются пачками по batch_sentences предложений,
+    так что в памяти одновременно находится только одна пачка.
+    """
+
+    def __init__(
+        self,
+        processor,
+        batch_sentences: int = DOCUMENT_BATCH_SENTENCES,
+        progress_interval: float = DOCUMENT_PROGRESS_INTERVAL,
+        session_factory=Session,
+    ):
+        self.processor = processor
+        self.batch_sentences = batch_sentences
+        self.progress_interval = progress_interval
+        self.session_factory = session_factory
+
+    async def ingest(
+        self, path: str, user_id, domain_id: int, on_progress=None
+    ) -> IngestionProgress:
+        """Загружает документ и сохраняет концепты пользователю.
+
+        Args:
+            path: Путь к файлу в кодировке UTF-8.
+            on_progress: Корутина, которая получает IngestionProgress не
+                чаще раза в progress_interval секунд и в конце загрузки.
+
+        Returns:
+            Итоговое состояние загрузки.
+        """
+        progress = IngestionProgress(total_bytes=os.path.getsize(path))
+        started = perf_counter()
+        last_report = monotonic()
+
+        # Локальный временный файл читается небольшими кусками
+        with open(path, "rb") as file:  # noqa: ASYNC230
+            sentences = split_sentences(read_chunks(file, progress))
+            for batch in batched(sentences, self.batch_sentences):
+                progress.concepts_added += await self._ingest_batch(
+                    batch, user_id, domain_id
+                )
+                progress.sentences += len(batch)
+                progress.batches += 1
+                progress.seconds = perf_counter() - started
+
+                if (
+                    on_progress
+                    and monotonic() - last_report >= self.progress_interval
+                ):
+                    await on_progress(progress)
+                    last_report = monotonic()
+
+        progress.seconds = perf_counter() - started
+        progress.done = True
+        logger.info(
+            f"Document ingested: {progress.total_bytes} bytes, "
+            f"{progress.sentences} sentences, "
+            f"{progress.concepts_added} new concepts "
+            f"in {progress.seconds:.1f}s"
+        )
+        if on_progress:
+            await on_progress(progress)
+        return progress
+
+    async def _ingest_batch(self, batch: list[str], user_id, domain_id):
+        concepts = {}
+        for found in await self.processor.extract_concepts(batch):
+            for canonical, name in found.items():
+                concepts.setdefault(canonical, name)
+        if not concepts:
+            return 0
+
+        async with self.session_factory() as session:
+            added = await self.processor.store_concepts(
+                concepts, user_id, domain_id, session
+            )
+        return len(added)
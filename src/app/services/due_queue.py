@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from time import monotonic
+
+from app.db import Session
+from app.repositories.user_knowledge_repository import (
+    SECONDS_PER_DAY,
+    UserKnowledgeRepository,
+)
+from app.repositories.user_repository import UserRepository
+from app.services.spaced_repetition import SpacedRepetitionService
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DUE_QUEUE_SIZE = int(os.getenv("DUE_QUEUE_SIZE", "20"))
+DUE_QUEUE_REFILL_AT = int(os.getenv("DUE_QUEUE_REFILL_AT", "5"))
+DUE_QUEUE_TTL = float(os.getenv("DUE_QUEUE_TTL", "300"))
+DUE_QUEUE_MAX_USERS = int(os.getenv("DUE_QUEUE_MAX_USERS", "10000"))
+DUE_QUEUE_MAX_CARDS = int(os.getenv("DUE_QUEUE_MAX_CARDS", "200000"))
+
+
+@dataclass(order=True)
+class QueuedCard:
+    """Карточка в очереди; сравнение только по приоритету"""
+
+    priority: tuple
+    concept_id: int = field(compare=False)
+    word: str = field(compare=False)
+    definition: str | None = field(compare=False)
+
+    def as_dict(self) -> dict:
+        return {
+            "concept_id": self.concept_id,
+            "word": self.word,
+            "definition": self.definition or "Без определения",
+        }
+
+
+@dataclass
+class UserQueue:
+    user_id: object
+    heap: list
+    loaded_at: float
+    # Карточки, отвеченные во время дозагрузки: ее результат для них
+    # может быть устаревшим
+    reviewed: set = field(default_factory=set)
+    refilling: bool = False
+    # В БД нет карточек сверх загруженных
+    complete: bool = False
+
+
+def card_priority(knowledge, lambda_coef, now: datetime) -> tuple:
+    """Ключ кучи, совпадающий с порядком очереди в БД.
+
+    Наступившие карточки идут первыми по ожидаемому удержанию,
+    остальные по времени следующего повторения.
+    """
+    next_review = knowledge.next_review
+    if next_review is not None and next_review > now:
+        return (1, next_review.timestamp(), knowledge.concept_id)
+    days = 0.0
+    if knowledge.last_reviewed is not None:
+        days = (now - knowledge.last_reviewed).total_seconds()
+        days /= SECONDS_PER_DAY
+    predicted = SpacedRepetitionService.predicted_retention(
+        knowledge.retention or 0.0,
+        lambda_coef if lambda_coef is not None else 0.5,
+        days,
+    )
+    return (0, float(predicted), knowledge.concept_id)
+
+
+class DueQueueService:
+    """Очереди ближайших карточек пользователей в памяти процесса.
+
+    Для каждого пользователя хранится куча из size карточек с названиями
+    и определениями, так что /next_card обычно не обращается к БД.
+    Когда карточек остается refill_at или меньше либо очередь старше
+    ttl секунд, она перечитывается в фоне. Пользователи вытесняются
+    по LRU при превышении max_users или общего числа карточек
+    max_cards.
+    """
+
+    def __init__(
+        self,
+        size: int = DUE_QUEUE_SIZE,
+        refill_at: int = DUE_QUEUE_REFILL_AT,
+        ttl: float = DUE_QUEUE_TTL,
+        max_users: int = DUE_QUEUE_MAX_USERS,
+        max_cards: int = DUE_QUEUE_MAX_CARDS,
+        session_factory=Session,
+    ):
+        self.size = size
+        self.refill_at = refill_at
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_cards = max_cards
+        self.session_factory = session_factory
+        self.queues = LRUCache(max_users)
+        self.cards = 0
+        self.hits = 0
+        self.loads = 0
+        self.refills = 0
+        self.evictions = 0
+        self._loading = {}
+        self._tasks = set()
+
+    async def next_card(self, telegram_id: int) -> dict | None:
+        """Ближайшая карточка пользователя или None, если карточек нет.
+
+        Raises:
+            LookupError: Если пользователь не найден.
+        """
+        queue = self.queues.get(telegram_id)
+        if queue is not None and not queue.heap:
+            self._drop(telegram_id)
+            queue = None
+
+        if queue is None:
+            queue = await self._load(telegram_id)
+        else:
+            self.hits += 1
+            low = len(queue.heap) <= self.refill_at and not queue.complete
+            if low or monotonic() - queue.loaded_at > self.ttl:
+                self._schedule_refill(telegram_id, queue)
+
+        if not queue.heap:
+            return None
+        return queue.heap[0].as_dict()
+
+    def invalidate(self, telegram_id: int, concept_id: int | None = None):
+        """Убирает отвеченную карточку из очереди пользователя.
+
+        Без concept_id очередь пользователя удаляется целиком.
+        """
+        queue = self.queues.get(telegram_id)
+        if queue is None:
+            return
+        if concept_id is None:
+            self._drop(telegram_id)
+            return
+
+        queue.reviewed.add(concept_id)
+        if queue.heap and queue.heap[0].concept_id == concept_id:
+            heapq.heappop(queue.heap)
+            self.cards -= 1
+        else:
+            size = len(queue.heap)
+            queue.heap = [c for c in queue.heap if c.concept_id != concept_id]
+            heapq.heapify(queue.heap)
+            self.cards -= size - len(queue.heap)
+        if len(queue.heap) <= self.refill_at:
+            self._schedule_refill(telegram_id, queue)
+
+    async def _load(self, telegram_id: int) -> UserQueue:
+        # Одновременные первые запросы пользователя ждут одну загрузку
+        task = self._loading.get(telegram_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(telegram_id))
+            self._loading[telegram_id] = task
+            task.add_done_callback(
+                lambda _: self._loading.pop(telegram_id, None)
+            )
+        user_id, heap, complete = await task
+
+        queue = self.queues.get(telegram_id)
+        if queue is None:
+            self.loads += 1
+            queue = UserQueue(user_id, heap, monotonic(), complete=complete)
+            self._store(telegram_id, queue)
+        return queue
+
+    async def _fetch(self, telegram_id: int, user_id=None):
+        async with self.session_factory() as session:
+            user = await UserRepository(session).get_by_telegram_id(
+                telegram_id
+            )
+            if user is None:
+                raise LookupError(f"User {telegram_id} not found")
+            rows = await UserKnowledgeRepository(session).get_review_cards(
+                user.id, limit=self.size
+            )
+
+        now = datetime.now(UTC)
+        heap = [
+            QueuedCard(
+                card_priority(knowledge, user.lambda_coef, now),
+                knowledge.concept_id,
+                word,
+                definition,
+            )
+            for knowledge, word, definition in rows
+        ]
+        heapq.heapify(heap)
+        return user.id, heap, len(rows) < self.size
+
+    def _schedule_refill(self, telegram_id: int, queue: UserQueue):
+        if queue.refilling:
+            return
+        queue.refilling = True
+        queue.reviewed = set()
+        task = asyncio.create_task(self._refill(telegram_id, queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, telegram_id: int, queue: UserQueue):
+        try:
+            _, heap, complete = await self._fetch(telegram_id)
+        except Exception as e:
+            logger.error(f"Due queue refill failed: {str(e)}")
+            queue.refilling = False
+            return
+
+        if self.queues.get(telegram_id) is not queue:
+            # Очередь вытеснена или сброшена, пока шел запрос
+            return
+        heap = [c for c in heap if c.concept_id not in queue.reviewed]
+        heapq.heapify(heap)
+        self.cards += len(heap) - len(queue.heap)
+        queue.heap = heap
+        queue.loaded_at = monotonic()
+        queue.complete = complete
+        queue.refilling = False
+        self.refills += 1
+        self._evict()
+
+    def _store(self, telegram_id: int, queue: UserQueue):
+        if telegram_id not in self.queues and len(self.queues) >= (
+            self.max_users
+        ):
+            self._evict_oldest()
+        self.queues.put(telegram_id, queue)
+        self.cards += len(queue.heap)
+        self._evict()
+
+    def _evict(self):
+        # Последняя использованная очередь остается даже сверх лимита
+        while self.cards > self.max_cards and len(self.queues) > 1:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        _, queue = self.queues.popitem()
+        self.cards -= len(queue.heap)
+        self.evictions += 1
+
+    def _drop(self, telegram_id: int):
+        queue = self.queues.pop(telegram_id)
+        if queue is not None:
+            self.cards -= len(queue.heap)
+
+    def metrics(self) -> dict:
+        return {
+            "users": len(self.queues),
+            "cards": self.cards,
+            "hits": self.hits,
+            "loads": self.loads,
+            "refills": self.refills,
+            "evictions": self.evictions,
+        }
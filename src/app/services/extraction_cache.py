@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import unicodedata
+from datetime import timedelta
+
+from app.db import Session
+from app.repositories.extraction_cache_repository import (
+    ExtractionCacheRepository,
+)
+from app.services.concept_extractor import EXTRACTOR_VERSION
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "20000"))
+EXTRACTION_CACHE_MAX_ROWS = int(
+    os.getenv("EXTRACTION_CACHE_MAX_ROWS", "1000000")
+)
+EXTRACTION_CACHE_EVICT_EVERY = int(
+    os.getenv("EXTRACTION_CACHE_EVICT_EVERY", "1000")
+)
+# Время использования записи обновляется не чаще раза в столько часов
+EXTRACTION_CACHE_TOUCH_HOURS = float(
+    os.getenv("EXTRACTION_CACHE_TOUCH_HOURS", "24")
+)
+
+
+class ExtractionCache:
+    """Двухуровневый кэш концептов по предложениям: LRU в процессе и Postgres.
+
+    Ключ включает предложение со схлопнутыми пробелами в NFC (регистр
+    сохраняется: от него зависят части речи и NER), имя и версию модели и
+    версию правил извлечения, поэтому смена модели не возвращает старые
+    результаты. Таблица общая для процессов API и бота.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        memory_size: int = EXTRACTION_CACHE_SIZE,
+        max_rows: int = EXTRACTION_CACHE_MAX_ROWS,
+        evict_every: int = EXTRACTION_CACHE_EVICT_EVERY,
+        session_factory=Session,
+    ):
+        self.model = model
+        self.memory = LRUCache(memory_size)
+        self.max_rows = max_rows
+        self.evict_every = evict_every
+        self.session_factory = session_factory
+        self.db_hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+
+    def key(self, sentence: str) -> str:
+        text = unicodedata.normalize("NFC", " ".join(sentence.split()))
+        raw = f"{self.model}\0{EXTRACTOR_VERSION}\0{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_many(self, sentences) -> dict:
+        """Возвращает {предложение: концепты} для найденных в кэше"""
+        found = {}
+        missing = {}
+        for sentence in sentences:
+            key = self.key(sentence)
+            concepts = self.memory.get(key)
+            if concepts is None:
+                missing.setdefault(key, []).append(sentence)
+            else:
+                found[sentence] = concepts
+
+        if missing:
+            try:
+                async with self.session_factory() as session:
+                    stored = await ExtractionCacheRepository(session).get_many(
+                        list(missing),
+                        touch_after=timedelta(
+                            hours=EXTRACTION_CACHE_TOUCH_HOURS
+                        ),
+                    )
+            except Exception as e:
+                logger.error(f"Extraction cache lookup failed: {str(e)}")
+                stored = {}
+
+            for key, sentences_for_key in missing.items():
+                if key not in stored:
+                    self.misses += len(sentences_for_key)
+                    continue
+                concepts = dict(stored[key])
+                self.memory.put(key, concepts)
+                self.db_hits += len(sentences_for_key)
+                for sentence in sentences_for_key:
+                    found[sentence] = concepts
+
+        return found
+
+    async def put_many(self, results: dict):
+        """Сохраняет {предложение: концепты} в оба уровня кэша"""
+        entries = {}
+        for sentence, concepts in results.items():
+            key = self.key(sentence)
+            self.memory.put(key, dict(concepts))
+            entries[key] = dict(sorted(concepts.items()))
+        if not entries:
+            return
+
+        try:
+            async with self.session_factory() as session:
+                repo = ExtractionCacheRepository(session)
+                await repo.put_many(self.model, entries)
+
+                self._writes_since_evict += len(entries)
+                if self._writes_since_evict >= self.evict_every:
+                    self._writes_since_evict = 0
+                    evicted = await repo.evict(self.max_rows)
+                    if evicted:
+                        logger.info(f"Extraction cache evicted {evicted} rows")
+        except Exception as e:
+            logger.error(f"Extraction cache write failed: {str(e)}")
+
+    def metrics(self) -> dict:
+        lookups = self.memory.hits + self.db_hits + self.misses
+        hits = self.memory.hits + self.db_hits
+        return {
+            "memory_hits": self.memory.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_size": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+        }
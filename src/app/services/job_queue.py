@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import UTC, datetime
+
+from app.db import Session
+from app.repositories.job_repository import JobRepository
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "60"))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", "3600"))
+JOB_STALE_TIMEOUT = float(os.getenv("JOB_STALE_TIMEOUT", "900"))
+JOB_KEEP_DONE_SECONDS = float(os.getenv("JOB_KEEP_DONE_SECONDS", "604800"))
+HOUSEKEEPING_INTERVAL = 60
+
+
+class JobWorker:
+    """Воркер очереди задач в таблице jobs.
+
+    Задачи забираются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+    воркеров может быть сколько угодно в разных процессах. Упавшая
+    задача откладывается с экспоненциальной задержкой или до retry_at
+    из исключения, если обработчик его указал; после max_attempts
+    попыток получает статус failed.
+
+    Args:
+        handlers: Словарь {вид задачи: корутина(payload)}.
+    """
+
+    def __init__(
+        self,
+        handlers: dict,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        retry_base: float = JOB_RETRY_BASE,
+        retry_max: float = JOB_RETRY_MAX,
+        session_factory=Session,
+        name: str | None = None,
+        status=None,
+    ):
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.session_factory = session_factory
+        # Необязательная функция с дополнительными метриками для лога
+        self.status = status
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.completed = 0
+        self.failed = 0
+        self._stopping = None
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.retry_max, self.retry_base * 2 ** max(0, attempts - 1))
+
+    async def run_once(self) -> bool:
+        """Выполняет одну готовую задачу, если она есть"""
+        async with self.session_factory() as session:
+            jobs = await JobRepository(session).claim(
+                list(self.handlers), self.name
+            )
+        if not jobs:
+            return False
+
+        job = jobs[0]
+        try:
+            await self.handlers[job.kind](job.payload)
+        except Exception as e:
+            delay = self.retry_delay(job.attempts)
+            retry_at = getattr(e, "retry_at", None)
+            if retry_at is not None:
+                delay = max(
+                    0.0, (retry_at - datetime.now(UTC)).total_seconds()
+                )
+            logger.warning(
+                f"Job {job.id} ({job.kind}) attempt {job.attempts} "
+                f"failed, retry in {delay:.0f}s: {str(e)}"
+            )
+            self.failed += 1
+            async with self.session_factory() as session:
+                await JobRepository(session).fail(job.id, repr(e), delay)
+        else:
+            self.completed += 1
+            async with self.session_factory() as session:
+                await JobRepository(session).complete(job.id)
+        return True
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Job worker error: {str(e)}")
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=self.poll_interval
+                )
+            except TimeoutError:
+                pass
+
+    async def _housekeeping(self):
+        while not self._stopping.is_set():
+            try:
+                async with self.session_factory() as session:
+                    repo = JobRepository(session)
+                    requeued = await repo.requeue_stale(JOB_STALE_TIMEOUT)
+                    deleted = await repo.delete_finished(JOB_KEEP_DONE_SECONDS)
+                    metrics = await repo.metrics()
+                if requeued:
+                    logger.warning(f"Requeued {requeued} stale jobs")
+                if deleted:
+                    logger.info(f"Deleted {deleted} finished jobs")
+                logger.info(
+                    f"Job queue: {metrics}, worker {self.name}: "
+                    f"{self.completed} completed, {self.failed} failed"
+                    + (f", {self.status()}" if self.status else "")
+                )
+            except Exception as e:
+                logger.error(f"Job housekeeping error: {str(e)}")
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=HOUSEKEEPING_INTERVAL
+                )
+            except TimeoutError:
+                pass
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        logger.info(
+            f"Job worker {self.name} started: {self.concurrency} loops, "
+            f"kinds {list(self.handlers)}"
+        )
+        await asyncio.gather(
+            self._housekeeping(),
+            *(self._loop() for _ in range(self.concurrency)),
+        )
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
@@ -0,0 +1,356 @@
+import codecs
+import csv
+import io
+import json
+import os
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from app.models.concepts import PLACEHOLDER_DESCRIPTION
+from app.repositories.concept_repository import (
+    BULK_CHUNK_SIZE,
+    ConceptRepository,
+)
+from app.repositories.user_knowledge_repository import (
+    EXPORT_COLUMNS,
+    UserKnowledgeRepository,
+)
+from app.repositories.user_stats_repository import UserStatsRepository
+from app.services.definition_jobs import enqueue_definitions
+from app.services.text_processor import (
+    NEW_CARD_RETENTION,
+    TextProcessorService,
+)
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_NAME = 255
+
+FIELDS = ("concept", "definition", "retention", "last_reviewed", "next_review")
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    # Текстовый формат импорта Anki (File > Import), колоды .apkg
+    # требуют SQLite-файла и потоком не собираются
+    "anki": ("text/tab-separated-values; charset=utf-8", "txt"),
+}
+ANKI_HEADER = (
+    "#separator:tab\n#html:false\n#notetype:Basic\n"
+    "#deck:Scientia\n#columns:Front\tBack\n"
+)
+
+
+class ImportFormatError(ValueError):
+    """Ошибка в загруженном файле с номером строки"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _export_record(row) -> dict:
+    name, description, retention, last_reviewed, next_review = row
+    if description == PLACEHOLDER_DESCRIPTION:
+        description = None
+    return {
+        "concept": name,
+        "definition": description,
+        "retention": retention,
+        "last_reviewed": _iso(last_reviewed),
+        "next_review": _iso(next_review),
+    }
+
+
+def render_rows(rows, fmt: str) -> str:
+    """Пачка строк выгрузки в формате fmt"""
+    records = [_export_record(row) for row in rows]
+    if fmt == "jsonl":
+        return "".join(
+            json.dumps(record, ensure_ascii=False) + "\n" for record in records
+        )
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, FIELDS, lineterminator="\n")
+        writer.writerows(records)
+    else:
+        writer = csv.writer(buffer, delimiter="\t", lineterminator="\n")
+        writer.writerows(
+            [r["concept"], r["definition"] or ""] for r in records
+        )
+    return buffer.getvalue()
+
+
+async def export_knowledge(
+    session_factory, user_id: uuid.UUID, fmt: str, chunk_size=None
+):
+    """Карточки пользователя в формате fmt кусками по chunk_size строк.
+
+    Строки читаются серверным курсором в порядке (next_review,
+    concept_id), в памяти не больше одной пачки.
+    """
+    if fmt == "csv":
+        yield ",".join(FIELDS) + "\n"
+    elif fmt == "anki":
+        yield ANKI_HEADER
+    async with session_factory() as session:
+        repo = UserKnowledgeRepository(session)
+        async for rows in repo.stream_knowledge(
+            user_id,
+            chunk_size=chunk_size or EXPORT_CHUNK_SIZE,
+            columns=EXPORT_COLUMNS,
+        ):
+            yield render_rows(rows, fmt)
+
+
+async def iter_lines(chunks):
+    """Строки из потока байтов в UTF-8, куски могут резать символы"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in chunks:
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+async def _csv_rows(lines, delimiter: str):
+    """Записи CSV с переводами строк внутри кавычек.
+
+    Запись закончена, когда число кавычек в ней четное: экранированная
+    кавычка удваивается и четность не меняет.
+    """
+    record = []
+    quotes = 0
+    async for number, line in lines:
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        text = "\n".join(record)
+        record, quotes = [], 0
+        if text.strip():
+            yield number, next(csv.reader([text], delimiter=delimiter))
+    if record:
+        raise ImportFormatError(number, "unterminated quoted field")
+
+
+async def _numbered(lines):
+    number = 0
+    async for line in lines:
+        number += 1
+        yield number, line
+
+
+async def _skip_header(lines):
+    """Пропускает строки "#..." заголовка в начале файла"""
+    header = True
+    async for number, line in lines:
+        header = header and line.startswith("#")
+        if not header:
+            yield number, line
+
+
+async def parse_records(chunks, fmt: str):
+    """Записи (номер строки, словарь FIELDS) из загруженного файла.
+
+    Файл разбирается по мере чтения chunks. csv - с заголовком из
+    FIELDS (обязательна колонка concept), jsonl - объекты с теми же
+    ключами, anki - текстовая выгрузка Anki: первая колонка название,
+    вторая определение, строки заголовка "#" пропускаются.
+    """
+    lines = _numbered(iter_lines(chunks))
+    if fmt == "jsonl":
+        async for number, line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ImportFormatError(number, f"invalid JSON: {e}") from e
+            if not isinstance(record, dict):
+                raise ImportFormatError(number, "expected an object")
+            yield number, record
+        return
+
+    if fmt == "anki":
+        async for number, row in _csv_rows(_skip_header(lines), "\t"):
+            yield (
+                number,
+                {
+                    "concept": row[0],
+                    "definition": row[1] if len(row) > 1 else None,
+                },
+            )
+        return
+
+    header = None
+    async for number, row in _csv_rows(lines, ","):
+        if header is None:
+            header = [name.strip().lower() for name in row]
+            if "concept" not in header:
+                raise ImportFormatError(number, "missing concept column")
+            continue
+        yield number, dict(zip(header, row))
+
+
+def _parse_time(value, number: int, field: str):
+    if value in (None, ""):
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise ImportFormatError(number, f"invalid {field}: {value}") from e
+    return moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+
+
+def card_from_record(number: int, record: dict, now: datetime) -> dict:
+    """Проверенная карточка из записи, пустые поля как у новой карточки"""
+    name = (record.get("concept") or "").strip()
+    if not name:
+        raise ImportFormatError(number, "empty concept")
+    if len(name) > IMPORT_MAX_NAME:
+        raise ImportFormatError(
+            number, f"concept longer than {IMPORT_MAX_NAME}"
+        )
+
+    retention = record.get("retention")
+    try:
+        retention = (
+            NEW_CARD_RETENTION if retention in (None, "") else float(retention)
+        )
+    except (TypeError, ValueError) as e:
+        raise ImportFormatError(
+            number, f"invalid retention: {retention}"
+        ) from e
+    if not 0.0 <= retention <= 1.0:
+        raise ImportFormatError(number, f"retention out of range: {retention}")
+
+    last_reviewed = _parse_time(
+        record.get("last_reviewed"), number, "last_reviewed"
+    )
+    next_review = _parse_time(record.get("next_review"), number, "next_review")
+    definition = (record.get("definition") or "").strip()
+    return {
+        "name": name,
+        "definition": definition or None,
+        "retention": retention,
+        "last_reviewed": last_reviewed or now,
+        "next_review": next_review or now + timedelta(days=1),
+    }
+
+
+async def _store_batch(
+    session, processor, user_id: uuid.UUID, cards: list
+) -> int:
+    """Находит концепты карточек по каноническим ключам, как /add.
+
+    Новые концепты без определения в файле и найденные без определения
+    ставятся в очередь генерации определений.
+    """
+    canonicals = await processor.canonicalize([card["name"] for card in cards])
+    # Название без значимых слов ищется только по имени
+    keys = [
+        canonical or card["name"] for canonical, card in zip(canonicals, cards)
+    ]
+    # Первая карточка с ключом задает имя и определение концепта
+    first = {}
+    for key, canonical, card in zip(keys, canonicals, cards):
+        first.setdefault(key, (canonical or None, card))
+
+    concept_repo = ConceptRepository(session)
+    concepts = await concept_repo.get_by_canonicals(
+        {key: card["name"] for key, (_, card) in first.items()}
+    )
+    to_define = [
+        concept.id for concept in concepts.values() if not concept.description
+    ]
+
+    missing = {
+        key: {
+            "name": card["name"],
+            "canonical_name": canonical,
+            "domain_id": None,
+            "description": card["definition"] or PLACEHOLDER_DESCRIPTION,
+        }
+        for key, (canonical, card) in first.items()
+        if key not in concepts
+    }
+    created = {
+        concept.name: concept
+        for concept in await concept_repo.bulk_upsert(list(missing.values()))
+    }
+    for key, row in missing.items():
+        concept = concepts[key] = created[row["name"]]
+        if concept.description in (None, "", PLACEHOLDER_DESCRIPTION):
+            to_define.append(concept.id)
+    if to_define:
+        await enqueue_definitions(session, sorted(set(to_define)))
+
+    return await UserKnowledgeRepository(session).upsert_many(
+        user_id,
+        [
+            {
+                "concept_id": concepts[key].id,
+                "retention": card["retention"],
+                "last_reviewed": card["last_reviewed"],
+                "next_review": card["next_review"],
+            }
+            for key, card in zip(keys, cards)
+        ],
+    )
+
+
+async def import_knowledge(
+    session,
+    user_id: uuid.UUID,
+    records,
+    batch_size: int = BULK_CHUNK_SIZE,
+    now: datetime | None = None,
+    processor: TextProcessorService | None = None,
+) -> int:
+    """Загружает карточки пользователя пачками многострочных upsert.
+
+    Концепты ищутся и создаются по каноническому ключу названия, как
+    при добавлении текста, определение сохраняется только у новых.
+    Концептам без определения ставится задача генерации. Карточки,
+    которые у пользователя уже есть, получают retention и сроки из
+    файла. Счетчики user_stats пересчитываются по карточкам в конце.
+    Транзакция не фиксируется: ошибка в любой строке должна откатить
+    весь импорт.
+
+    Args:
+        records: Асинхронный поток (номер строки, запись) из
+            parse_records.
+        processor: Сервис для канонических ключей, по умолчанию
+            TextProcessorService с моделью текущего процесса.
+
+    Returns:
+        Число загруженных записей.
+
+    Raises:
+        ImportFormatError: Запись с ошибкой, с номером строки.
+    """
+    now = now or datetime.now(UTC)
+    processor = processor or TextProcessorService()
+    imported = 0
+    batch = []
+    async for number, record in records:
+        batch.append(card_from_record(number, record, now))
+        if len(batch) >= batch_size:
+            await _store_batch(session, processor, user_id, batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        await _store_batch(session, processor, user_id, batch)
+        imported += len(batch)
+
+    stats_repo = UserStatsRepository(session)
+    stats = await stats_repo.source_stats([user_id], now.date())
+    await stats_repo.replace(list(stats.values()))
+    return imported
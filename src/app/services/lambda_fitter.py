@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from time import perf_counter
+
+import numpy as np
+
+from app.db import Session
+from app.repositories.retention_log_repository import RetentionLogRepository
+from app.repositories.user_repository import UserRepository
+from app.services.spaced_repetition import LAMBDA_BOUNDS
+
+logger = logging.getLogger(__name__)
+
+LAMBDA_FIT_CHUNK = int(os.getenv("LAMBDA_FIT_CHUNK", "50000"))
+LAMBDA_FIT_MIN_REVIEWS = int(os.getenv("LAMBDA_FIT_MIN_REVIEWS", "20"))
+LAMBDA_FIT_WRITE_BATCH = int(os.getenv("LAMBDA_FIT_WRITE_BATCH", "5000"))
+LAMBDA_FIT_GRID = np.linspace(*LAMBDA_BOUNDS, 81)
+
+SECONDS_PER_DAY = 86400.0
+_EPS = 1e-6
+
+
+@dataclass
+class FitStats:
+    rows: int = 0
+    observations: int = 0
+    users: int = 0
+    fitted: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        rate = self.rows / self.seconds if self.seconds else 0
+        return (
+            f"{self.rows} log rows, {self.observations} observations, "
+            f"{self.fitted} of {self.users} users fitted in "
+            f"{self.seconds:.1f}s ({rate:.0f} rows/s)"
+        )
+
+
+def review_observations(rows) -> tuple:
+    """Повторения, для которых известен интервал с прошлого ответа.
+
+    Args:
+        rows: Строки журнала (user_id, concept_id, timestamp,
+            retention_before, retention_after) в порядке
+            (user_id, concept_id, timestamp).
+
+    Returns:
+        Массивы (user_id, prior, days, recalled) для каждой строки,
+        перед которой есть ответ на ту же карточку. prior - удержание
+        после прошлого ответа, recalled - ответ был верным (удержание
+        выросло).
+    """
+    count = len(rows)
+    users = np.empty(count, dtype=object)
+    users[:] = [row[0] for row in rows]
+    concepts = np.fromiter((r[1] for r in rows), dtype=np.int64, count=count)
+    seconds = np.fromiter(
+        (r[2].timestamp() for r in rows), dtype=np.float64, count=count
+    )
+    # None в колонках становится nan и отбрасывается ниже
+    before = np.array([r[3] for r in rows], dtype=np.float64)
+    after = np.array([r[4] for r in rows], dtype=np.float64)
+
+    paired = (users[1:] == users[:-1]) & (concepts[1:] == concepts[:-1])
+    paired &= ~np.isnan(before[1:]) & ~np.isnan(after[1:])
+    current = np.flatnonzero(paired) + 1
+    return (
+        users[current],
+        before[current],
+        (seconds[current] - seconds[current - 1]) / SECONDS_PER_DAY,
+        after[current] > before[current],
+    )
+
+
+def log_likelihood(prior, days, recalled, grid=LAMBDA_FIT_GRID):
+    """Логарифм правдоподобия ответов для каждого lambda из сетки.
+
+    Вероятность вспомнить карточку - ожидаемое удержание
+    prior * exp(-lambda * days), как в predicted_retention.
+
+    Returns:
+        Матрица (число ответов, размер сетки).
+    """
+    p = np.asarray(prior)[:, None] * np.exp(
+        -np.maximum(np.asarray(days), 0)[:, None] * grid[None, :]
+    )
+    p = np.clip(p, _EPS, 1 - _EPS)
+    return np.where(np.asarray(recalled)[:, None], np.log(p), np.log1p(-p))
+
+
+class LambdaFitter:
+    """Подбор lambda_coef пользователей по истории retention_logs.
+
+    Журнал читается серверным курсором в порядке пользователей, для
+    каждого пользователя копится логарифм правдоподобия по сетке
+    значений lambda, и как только его строки закончились, выбирается
+    максимум. Память ограничена одной пачкой строк и пачкой
+    результатов, ожидающих записи.
+    """
+
+    def __init__(
+        self,
+        session_factory=Session,
+        chunk_size: int = LAMBDA_FIT_CHUNK,
+        min_reviews: int = LAMBDA_FIT_MIN_REVIEWS,
+        write_batch: int = LAMBDA_FIT_WRITE_BATCH,
+        grid=LAMBDA_FIT_GRID,
+    ):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.min_reviews = min_reviews
+        self.write_batch = write_batch
+        self.grid = grid
+        self.stats = FitStats()
+        self._user = None
+        self._ll = None
+        self._count = 0
+        self._fitted = []
+
+    async def run(self, after_user: uuid.UUID | None = None) -> FitStats:
+        started = perf_counter()
+        carry = []
+        # Курсор живет в своей транзакции, результаты фиксируются
+        # отдельной сессией
+        async with self.session_factory() as session:
+            history = RetentionLogRepository(session).stream_history(
+                self.chunk_size, after_user
+            )
+            async for rows in history:
+                self.stats.rows += len(rows)
+                # Последняя строка прошлой пачки дает интервал для
+                # первого ответа этой
+                rows = carry + list(rows)
+                carry = rows[-1:]
+                self._accumulate(*review_observations(rows))
+                if len(self._fitted) >= self.write_batch:
+                    await self._flush()
+
+        self._finish_user()
+        await self._flush()
+        self.stats.seconds = perf_counter() - started
+        logger.info(f"Lambda fit finished: {self.stats}")
+        return self.stats
+
+    def _accumulate(self, users, prior, days, recalled):
+        if not len(users):
+            return
+        self.stats.observations += len(users)
+        ll = log_likelihood(prior, days, recalled, self.grid)
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+        sums = np.add.reduceat(ll, starts, axis=0)
+        counts = np.diff(np.r_[starts, len(users)])
+        for start, total, count in zip(starts, sums, counts):
+            user_id = users[start]
+            if user_id != self._user:
+                self._finish_user()
+                self._user = user_id
+                self._ll = np.zeros_like(self.grid)
+                self._count = 0
+            self._ll += total
+            self._count += int(count)
+
+    def _finish_user(self):
+        if self._user is None:
+            return
+        self.stats.users += 1
+        if self._count >= self.min_reviews:
+            best = float(self.grid[int(np.argmax(self._ll))])
+            self._fitted.append((self._user, best))
+        self._user = None
+
+    async def _flush(self):
+        if not self._fitted:
+            return
+        async with self.session_factory() as session:
+            await UserRepository(session).update_from_values(
+                ["id", "lambda_coef"], self._fitted
+            )
+            await session.commit()
+        self.stats.fitted += len(self._fitted)
+        logger.info(
+            f"Fitted lambda for {self.stats.fitted} users, "
+            f"last user {self._fitted[-1][0]}"
+        )
+        self._fitted = []
+
+
+def fit_lambdas():
+    """Подбирает lambda_coef пользователей по журналу повторений.
+
+    Прерванный запуск можно продолжить с --after-user: пользователи
+    обрабатываются в порядке id, последний записанный id выводится в
+    журнал.
+    """
+    parser = argparse.ArgumentParser(description=fit_lambdas.__doc__)
+    parser.add_argument("--after-user", type=uuid.UUID, default=None)
+    parser.add_argument("--chunk-size", type=int, default=LAMBDA_FIT_CHUNK)
+    parser.add_argument(
+        "--min-reviews", type=int, default=LAMBDA_FIT_MIN_REVIEWS
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fitter = LambdaFitter(
+        chunk_size=args.chunk_size, min_reviews=args.min_reviews
+    )
+    stats = asyncio.run(fitter.run(args.after_user))
+    print(f"✅ {stats}")
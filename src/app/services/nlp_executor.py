@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import monotonic, perf_counter
+
+from app.services.nlp_loader import load_nlp_model
+from app.services.text_processor import TextProcessorService
+
+logger = logging.getLogger(__name__)
+
+NLP_WORKERS = int(os.getenv("NLP_WORKERS", str(min(4, os.cpu_count() or 1))))
+NLP_MAX_PENDING = int(os.getenv("NLP_MAX_PENDING", "32"))
+
+_worker_processor = None
+
+
+def _init_worker(model_name: str | None):
+    global _worker_processor
+    load_nlp_model(model_name)
+    _worker_processor = TextProcessorService()
+
+
+def _extract_in_worker(texts: list[str]):
+    results = _worker_processor.extract_concepts_batch(texts)
+    return results, _worker_processor.last_stats.sentences
+
+
+def _canonicalize_in_worker(phrases: list[str]):
+    return _worker_processor.canonicalize_batch(phrases), 0
+
+
+def _ping():
+    return _worker_processor is not None
+
+
+class NLPQueueFull(RuntimeError):
+    """Очередь NLP-задач переполнена, запрос нужно повторить позже"""
+
+
+class NLPExecutor:
+    """Пул процессов для извлечения концептов вне event loop.
+
+    Каждый процесс один раз загружает модель spaCy, в пул одновременно
+    передается не больше задач, чем в нем процессов, остальные ждут в
+    ограниченной очереди.
+    """
+
+    def __init__(
+        self,
+        workers: int = NLP_WORKERS,
+        max_pending: int = NLP_MAX_PENDING,
+        model_name: str | None = None,
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.model_name = model_name
+        self._pool = None
+        self._slots = None
+        self._started_at = None
+        self._waiting = 0
+        self._running = 0
+        self._busy_seconds = 0.0
+        self.ready = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.sentences = 0
+
+    def start(self):
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_name,),
+        )
+        self._slots = asyncio.Semaphore(self.workers)
+        self._started_at = monotonic()
+        logger.info(
+            f"NLP executor started: {self.workers} workers, "
+            f"queue limit {self.max_pending}"
+        )
+
+    async def warm_up(self):
+        """Запускает процессы пула и дожидается загрузки в них модели"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        started = perf_counter()
+        try:
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(self._pool, _ping)
+                    for _ in range(self.workers)
+                )
+            )
+        except Exception as e:
+            logger.error(f"NLP executor warm-up failed: {str(e)}")
+            return
+        self.ready = True
+        logger.info(
+            f"NLP executor warmed up in {perf_counter() - started:.1f}s"
+        )
+
+    def shutdown(self):
+        if self._pool is None:
+            return
+        logger.info(f"NLP executor stopping: {self.metrics()}")
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    async def extract(self, texts: list[str]) -> list[dict]:
+        """Извлекает концепты из текстов в одном из процессов пула"""
+        return await self._submit(_extract_in_worker, texts)
+
+    async def canonicalize(self, phrases: list[str]) -> list[str]:
+        """Приводит фразы к каноническим ключам в одном из процессов пула"""
+        return await self._submit(_canonicalize_in_worker, phrases)
+
+    async def _submit(self, func, items: list[str]):
+        self.start()
+        if self._waiting >= self.max_pending:
+            self.rejected += 1
+            raise NLPQueueFull(
+                f"NLP queue is full ({self._waiting} pending tasks)"
+            )
+
+        self.submitted += 1
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        started = perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            results, sentences = await loop.run_in_executor(
+                self._pool, func, items
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._busy_seconds += perf_counter() - started
+            self._running -= 1
+            self._slots.release()
+
+        self.completed += 1
+        self.sentences += sentences
+        return results
+
+    def metrics(self) -> dict:
+        uptime = monotonic() - self._started_at if self._started_at else 0.0
+        capacity = uptime * self.workers
+        return {
+            "ready": self.ready,
+            "workers": self.workers,
+            "queue_depth": self._waiting,
+            "queue_limit": self.max_pending,
+            "in_flight": self._running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "sentences": self.sentences,
+            "utilisation": self._busy_seconds / capacity if capacity else 0.0,
+            "sentences_per_second": (
+                self.sentences / uptime if uptime else 0.0
+            ),
+        }
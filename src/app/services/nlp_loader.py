@@ -1,30 +1,199 @@
-import spacy
+import argparse
+import logging
 import os
+import threading
+from pathlib import Path
+from time import perf_counter
+
+import spacy
+
+logger = logging.getLogger(__name__)
+
+MODEL_SIZES = {
+    "sm": "ru_core_news_sm",
+    "md": "ru_core_news_md",
+    "lg": "ru_core_news_lg",
+}
+WARMUP_TEXT = "Нейронная сеть обрабатывает текст в Москве."
+
+
+def resolve_model_name(name: str) -> str:
+    return MODEL_SIZES.get(name, name)
+
+
+def _env_list(name: str, default: str) -> list[str]:
+    value = os.getenv(name, default)
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+NLP_MODEL = resolve_model_name(os.getenv("NLP_MODEL", "md"))
+NLP_MODEL_PATH = os.getenv("NLP_MODEL_PATH")
+NLP_DISABLE = _env_list("NLP_DISABLE", "parser")
+NLP_ALLOW_DOWNLOAD = os.getenv("NLP_ALLOW_DOWNLOAD", "false").lower() in {
+    "1",
+    "true",
+    "yes",
+}
+
+
+class NLPModelManager:
+    """Загружает модель spaCy один раз и сообщает о готовности.
+
+    Модель берется из каталога NLP_MODEL_PATH (заранее сохраненный
+    урезанный пайплайн) или по имени NLP_MODEL, компоненты из
+    NLP_DISABLE не загружаются. Загрузку можно запустить в фоне через
+    start_warmup(), а состояние получить через status().
+    """
+
+    def __init__(
+        self,
+        model_name: str = NLP_MODEL,
+        model_path: str | None = NLP_MODEL_PATH,
+        disable: list[str] = NLP_DISABLE,
+        allow_download: bool = NLP_ALLOW_DOWNLOAD,
+    ):
+        self.model_name = resolve_model_name(model_name)
+        self.model_path = model_path
+        self.disable = list(disable)
+        self.allow_download = allow_download
+        self.nlp = None
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def source(self) -> str:
+        return self.model_path or self.model_name
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
 
-nlp_model = None
+    def fingerprint(self) -> str:
+        """Имя, версия и исключенные компоненты модели без ее загрузки"""
+        name = Path(self.source).name
+        fingerprint = f"{name}@{get_model_version(self.source)}"
+        if self.disable:
+            fingerprint += "-" + "+".join(sorted(self.disable))
+        return fingerprint
 
+    def load(self):
+        with self._lock:
+            if self.nlp is not None:
+                return self.nlp
 
-def load_nlp_model(model_name: str = "ru_core_news_md"):
-    global nlp_model
+            os.environ["GRPC_DNS_RESOLVER"] = "native"
+            started = perf_counter()
+            try:
+                nlp = self._load()
+                nlp(WARMUP_TEXT)
+            except Exception as e:
+                self.error = e
+                logger.exception(f"NLP model '{self.source}' failed to load")
+                raise
 
-    os.environ["GRPC_DNS_RESOLVER"] = "native"
+            self.nlp = nlp
+            self.error = None
+            self.load_seconds = perf_counter() - started
+            self._ready.set()
+            logger.info(
+                f"NLP model '{self.source}' loaded in "
+                f"{self.load_seconds:.1f}s, pipeline: {nlp.pipe_names}"
+            )
+            return nlp
 
-    if nlp_model is None:
+    def _load(self):
         try:
-            nlp_model = spacy.load(model_name)
-            print(f"✅ NLP модель '{model_name}' успешно загружена")
+            return spacy.load(self.source, exclude=self.disable)
         except OSError:
-            print(f"⚠️ Модель {model_name} не найдена. Пытаюсь загрузить...")
-            spacy.cli.download(model_name)
-            nlp_model = spacy.load(model_name)
+            if self.model_path or not self.allow_download:
+                raise
+            logger.warning(f"Model {self.model_name} not found, downloading")
+            spacy.cli.download(self.model_name)
+            return spacy.load(self.model_name, exclude=self.disable)
+
+    def start_warmup(self):
+        """Загружает модель в фоновом потоке, не блокируя запуск процесса"""
+        if self.is_ready or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(
+            target=self._warmup, name="nlp-warmup", daemon=True
+        )
+        self._thread.start()
+
+    def _warmup(self):
+        try:
+            self.load()
+        except Exception:
+            # Ошибка уже записана в лог и доступна через status()
+            pass
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def get(self):
+        if self.nlp is None:
+            raise RuntimeError(
+                "NLP модель не загружена. Сначала вызовите load_nlp_model()"
+            )
+        return self.nlp
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "model": self.source,
+            "disabled": self.disable,
+            "load_seconds": self.load_seconds,
+            "error": str(self.error) if self.error else None,
+        }
+
+
+model_manager = NLPModelManager()
 
-    return nlp_model
+
+def load_nlp_model(model_name: str | None = None):
+    global model_manager
+
+    if model_name and resolve_model_name(model_name) != model_manager.source:
+        model_manager = NLPModelManager(model_name=model_name, model_path=None)
+    return model_manager.load()
 
 
 def get_nlp_model():
-    global nlp_model
-    if nlp_model is None:
-        raise RuntimeError(
-            "NLP модель не загружена. Сначала вызовите load_nlp_model()"
-        )
-    return nlp_model
+    return model_manager.get()
+
+
+def get_model_version(model_name: str) -> str:
+    """Версия модели без ее загрузки: из пакета или из meta.json каталога"""
+    version = spacy.util.get_package_version(model_name)
+    if version is None:
+        meta_path = Path(model_name) / "meta.json"
+        if meta_path.exists():
+            version = spacy.util.load_meta(meta_path).get("version")
+    return version or "unknown"
+
+
+def export_trimmed_pipeline():
+    """Сохраняет модель без исключенных компонентов для NLP_MODEL_PATH"""
+    parser = argparse.ArgumentParser(
+        description=export_trimmed_pipeline.__doc__
+    )
+    parser.add_argument("output", help="Каталог для сохранения пайплайна")
+    parser.add_argument("--model", default=NLP_MODEL)
+    parser.add_argument(
+        "--disable",
+        default=",".join(NLP_DISABLE),
+        help="Компоненты через запятую, которые не нужно сохранять",
+    )
+    args = parser.parse_args()
+
+    manager = NLPModelManager(
+        model_name=args.model,
+        model_path=None,
+        disable=[c for c in args.disable.split(",") if c],
+    )
+    nlp = manager.load()
+    nlp.to_disk(args.output)
+    print(f"✅ Пайплайн {nlp.pipe_names} сохранен в {args.output}")
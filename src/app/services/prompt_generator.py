@@ -1,10 +1,13 @@
+import asyncio
+import json
 import os
+import re
 from typing import List
 import httpx
 from dotenv import load_dotenv
 from app.db import Session
+from app.models.concepts import PLACEHOLDER_DESCRIPTION
 from app.repositories.user_domain_repository import UserDomainRepository
-from app.repositories.domain_repository import DomainRepository
 import logging
 import uuid
 
@@ -13,9 +16,83 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_DEFINITION = PLACEHOLDER_DESCRIPTION
+AI_MODEL = "deepseek-chat"
+# Увеличивается при изменении промпта определений, чтобы не отдавать
+# из кэша ответы на старый промпт
+DEFINITION_PROMPT_VERSION = 1
+DEFINITION_BATCH_SIZE = int(os.getenv("DEFINITION_BATCH_SIZE", "10"))
+DEFINITION_CONCURRENCY = int(os.getenv("DEFINITION_CONCURRENCY", "4"))
+DEFINITION_TOKENS_PER_TERM = 150
+
+_http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий клиент с пулом соединений к AI API"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=DEFINITION_CONCURRENCY * 2,
+                max_keepalive_connections=DEFINITION_CONCURRENCY,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def parse_definitions(content: str, terms: list[str]) -> dict:
+    """Достает определения терминов из JSON-ответа модели.
+
+    Принимает объект {термин: определение} или список объектов с
+    полями term и definition, в том числе внутри блока ```json.
+    Термины сопоставляются без учета регистра.
+
+    Returns:
+        Словарь {термин: определение} только для найденных терминов.
+    """
+    match = re.search(r"```(?:json)?\s*(.*?)```", content, re.DOTALL)
+    if match:
+        content = match.group(1)
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+
+    if isinstance(data, dict) and isinstance(data.get("definitions"), list):
+        data = data["definitions"]
+    if isinstance(data, list):
+        data = {
+            item.get("term"): item.get("definition")
+            for item in data
+            if isinstance(item, dict)
+        }
+    if not isinstance(data, dict):
+        return {}
+
+    answers = {
+        str(term).strip().lower(): definition
+        for term, definition in data.items()
+        if isinstance(definition, str) and definition.strip()
+    }
+    return {
+        term: answers[term.strip().lower()].strip()
+        for term in terms
+        if term.strip().lower() in answers
+    }
+
 
 class PromptService:
-    def __init__(self):
+    def __init__(self, client: httpx.AsyncClient = None, cache=None):
+        self._client = client
+        self.cache = cache
         self.ai_api_url = os.getenv("DEEPSEEK_API_URL")
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
         self.default_prompt = """Проанализируй список тем (domains) пользователя и предложи:
@@ -31,16 +108,9 @@ class PromptService:
         try:
             user_uuid = uuid.UUID(user_id)
             async with Session() as session:
-                domain_repo = DomainRepository(session)
-                user_domain_repo = UserDomainRepository(session)
-
-                user_domains = await user_domain_repo.get_by_user(user_uuid)
-                domains = []
-                for ud in user_domains:
-                    domain = await domain_repo.get_by_id(ud.domain_id)
-                    if domain:
-                        domains.append(domain.name)
-                return domains
+                return await UserDomainRepository(session).domain_names(
+                    user_uuid
+                )
         except Exception as e:
             logger.error(f"Error getting user domains: {str(e)}")
             return []
@@ -71,7 +141,7 @@ class PromptService:
             }
 
             payload = {
-                "model": "deepseek-chat",
+                "model": AI_MODEL,
                 "messages": [{"role": "user", "content": prompt}],
                 "temperature": 0.7,
             }
@@ -97,18 +167,30 @@ class PromptService:
             logger.exception("Unexpected error in AI service")
             return f"Неожиданная ошибка при обращении к AI-сервису: {str(e)}"
 
-    async def generate_concept_definition(self, concept_name: str) -> str:
-        """Генерирует определение концепта с помощью AI"""
-        if not self.ai_api_url or not self.api_key:
-            return "Автоматически извлеченный термин"
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
 
+    async def _chat(self, payload: dict, timeout: float) -> str:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
+        response = await self.client.post(
+            self.ai_api_url, json=payload, headers=headers, timeout=timeout
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"]
 
+    async def generate_concept_definition(self, concept_name: str) -> str:
+        """Генерирует определение концепта с помощью AI"""
+        definitions = await self.generate_concept_definitions([concept_name])
+        return definitions[concept_name]
+
+    async def _request_definition(self, concept_name: str) -> str | None:
         payload = {
-            "model": "deepseek-chat",
+            "model": AI_MODEL,
             "messages": [
                 {
                     "role": "user",
@@ -121,17 +203,109 @@ class PromptService:
                 }
             ],
             "temperature": 0.5,
-            "max_tokens": 150,
+            "max_tokens": DEFINITION_TOKENS_PER_TERM,
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.ai_api_url, json=payload, headers=headers, timeout=30
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data["choices"][0]["message"]["content"]
+            return await self._chat(payload, timeout=30)
         except Exception as e:
             logger.error(f"Error generating definition: {str(e)}")
-            return "Автоматически извлеченный термин"
+            return None
+
+    async def generate_concept_definitions(
+        self,
+        concept_names: list[str],
+        batch_size: int = DEFINITION_BATCH_SIZE,
+        concurrency: int = DEFINITION_CONCURRENCY,
+    ) -> dict:
+        """Генерирует определения для набора терминов пачками.
+
+        Термины делятся на пачки по batch_size, каждая пачка
+        запрашивается одним промптом с ответом в JSON, одновременно
+        выполняется не больше concurrency запросов. Термины, для которых
+        ответ не удалось разобрать, запрашиваются по одному. Если задан
+        cache, запрашиваются только отсутствующие в нем термины.
+
+        Returns:
+            Словарь {термин: определение} для всех переданных терминов.
+        """
+        names = list(dict.fromkeys(concept_names))
+        if not names:
+            return {}
+        if not self.ai_api_url or not self.api_key:
+            return dict.fromkeys(names, DEFAULT_DEFINITION)
+
+        async def generate(terms):
+            return await self._generate_definitions(
+                terms, batch_size, concurrency
+            )
+
+        if self.cache is not None:
+            definitions = await self.cache.get_or_generate(names, generate)
+        else:
+            definitions = await generate(names)
+        return {
+            name: definitions.get(name) or DEFAULT_DEFINITION for name in names
+        }
+
+    async def _generate_definitions(
+        self, names: list[str], batch_size: int, concurrency: int
+    ) -> dict:
+        """Возвращает {термин: определение или None при неудаче}"""
+        slots = asyncio.Semaphore(max(1, concurrency))
+        batches = [
+            names[i : i + batch_size] for i in range(0, len(names), batch_size)
+        ]
+
+        async def run(batch):
+            async with slots:
+                return await self._define_batch(batch)
+
+        definitions = {}
+        for result in await asyncio.gather(*(run(b) for b in batches)):
+            definitions.update(result)
+        return definitions
+
+    async def _define_batch(self, terms: list[str]) -> dict:
+        terms_list = "\n".join(f"- {term}" for term in terms)
+        payload = {
+            "model": AI_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": (
+                        "Сгенерируй краткие, понятные и информативные "
+                        "определения для терминов на русском языке. "
+                        "Каждое определение должно быть длиной "
+                        "1-2 предложения, достаточно подробным для учебных "
+                        "целей.\n"
+                        f"Термины:\n{terms_list}\n\n"
+                        "Ответь только JSON-объектом вида "
+                        '{"термин": "определение"}, '
+                        "ключи должны совпадать с терминами из списка."
+                    ),
+                }
+            ],
+            "temperature": 0.5,
+            "max_tokens": DEFINITION_TOKENS_PER_TERM * len(terms),
+            "response_format": {"type": "json_object"},
+        }
+
+        try:
+            content = await self._chat(payload, timeout=60)
+        except Exception as e:
+            logger.error(
+                f"Error generating {len(terms)} definitions: {str(e)}"
+            )
+            return dict.fromkeys(terms)
+
+        definitions = parse_definitions(content, terms)
+        missing = [term for term in terms if term not in definitions]
+        if missing:
+            logger.warning(
+                f"Batch definition response missing {len(missing)} of "
+                f"{len(terms)} terms, requesting them one by one"
+            )
+            for term in missing:
+                definitions[term] = await self._request_definition(term)
+        return definitions
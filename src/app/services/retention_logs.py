@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import text
+
+from app.db import Session, get_engine
+from app.db.partitions import (
+    add_months,
+    convert_to_partitioned,
+    detach_partition,
+    ensure_partitions,
+    list_partitions,
+    month_start,
+    partition_month,
+)
+from app.repositories.retention_daily_repository import (
+    RetentionDailyRepository,
+)
+
+logger = logging.getLogger(__name__)
+
+RETENTION_MAINTENANCE_INTERVAL = int(
+    os.getenv("RETENTION_MAINTENANCE_INTERVAL", "3600")
+)
+# Секции старше стольких месяцев выгружаются в архив
+RETENTION_ARCHIVE_MONTHS = int(os.getenv("RETENTION_ARCHIVE_MONTHS", "12"))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "archive")
+ARCHIVE_CHUNK_SIZE = 5000
+# Ключ pg_advisory_xact_lock: журнал обслуживает один процесс за раз
+MAINTENANCE_LOCK = 7_406_251
+
+ARCHIVE_COLUMNS = (
+    "id",
+    "user_id",
+    "concept_id",
+    "old_lambda",
+    "new_lambda",
+    "retention_before",
+    "retention_after",
+    "timestamp",
+)
+
+
+def today() -> date:
+    return datetime.now(UTC).date()
+
+
+@dataclass
+class Maintenance:
+    """Результат обслуживания журнала"""
+
+    partitions: list = field(default_factory=list)
+    rolled_up: list = field(default_factory=list)
+
+    def __str__(self):
+        days = (
+            f"{self.rolled_up[0]}..{self.rolled_up[-1]}"
+            if self.rolled_up
+            else "none"
+        )
+        return (
+            f"{len(self.partitions)} partitions ensured, "
+            f"days rolled up: {days}"
+        )
+
+
+async def _try_lock(session) -> bool:
+    # Блокировка до конца транзакции: сессия может вернуть соединение в
+    # пул после commit, поэтому она берется заново в каждой транзакции
+    result = await session.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"),
+        {"key": MAINTENANCE_LOCK},
+    )
+    return bool(result.scalar())
+
+
+async def maintain(session_factory=Session, day: date | None = None):
+    """Создает секции наперед и сворачивает прошедшие дни.
+
+    Сворачиваются дни от последнего свернутого (или первого дня
+    журнала) до вчерашнего, каждый в своей транзакции, поэтому
+    прерванный запуск продолжается с того же места. Последний свернутый
+    день пересчитывается заново: ответы, записанные с опозданием,
+    попадают в свертку. Каждая транзакция держит MAINTENANCE_LOCK; если
+    его занял другой процесс, обслуживание останавливается.
+    """
+    day = day or today()
+    result = Maintenance()
+    async with session_factory() as session:
+        if not await _try_lock(session):
+            logger.info("Retention log maintenance is running elsewhere")
+            return result
+        result.partitions = await ensure_partitions(session, day)
+        await session.commit()
+
+        repo = RetentionDailyRepository(session)
+        yesterday = day - timedelta(days=1)
+        rolled = await repo.rolled_through()
+        current = (
+            min(rolled, yesterday)
+            if rolled is not None
+            else await repo.first_log_day()
+        )
+        while current is not None and current <= yesterday:
+            if not await _try_lock(session):
+                logger.info(f"Retention log rollup taken over at {current}")
+                break
+            users = await repo.rollup(current)
+            await session.commit()
+            logger.info(f"Rolled up {current}: {users} users")
+            result.rolled_up.append(current)
+            current += timedelta(days=1)
+    return result
+
+
+async def run_maintenance(interval: int = RETENTION_MAINTENANCE_INTERVAL):
+    """Обслуживает журнал каждые interval секунд до отмены задачи"""
+    while True:
+        try:
+            logger.info(f"Retention log maintenance: {await maintain()}")
+        except Exception as e:
+            logger.error(f"Retention log maintenance error: {str(e)}")
+        await asyncio.sleep(interval)
+
+
+async def export_partition(session, name: str, path: Path) -> int:
+    """Выгружает секцию в CSV, сжатый gzip, через серверный курсор.
+
+    Файл пишется во временный и переименовывается после записи
+    последней строки, так что готовый файл всегда полный.
+    """
+    partial = path.with_name(path.name + ".partial")
+    query = text(
+        f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM public.{name} "
+        "ORDER BY timestamp, id"
+    ).execution_options(yield_per=ARCHIVE_CHUNK_SIZE)
+    count = 0
+    with gzip.open(partial, "wt", newline="", encoding="utf-8") as archive:
+        writer = csv.writer(archive)
+        writer.writerow(ARCHIVE_COLUMNS)
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            writer.writerows(rows)
+            count += len(rows)
+    os.replace(partial, path)
+    return count
+
+
+async def archive_partitions(
+    before: date,
+    directory: Path,
+    drop: bool = False,
+    session_factory=Session,
+) -> list[str]:
+    """Выгружает месячные секции до месяца before и отсоединяет их.
+
+    Секция архивируется, только если все ее дни уже свернуты в
+    retention_daily: иначе статистика за эти дни пропала бы вместе с
+    журналом. Отсоединенная таблица остается в базе, с drop удаляется.
+
+    Returns:
+        Имена архивированных секций.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    archived = []
+    async with session_factory() as session:
+        rolled = await RetentionDailyRepository(session).rolled_through()
+        for name in await list_partitions(session):
+            month = partition_month(name)
+            if month is None or month >= month_start(before):
+                continue
+            last_day = add_months(month, 1) - timedelta(days=1)
+            if rolled is None or rolled < last_day:
+                logger.warning(
+                    f"Skip {name}: not rolled up through {last_day}"
+                )
+                continue
+            path = directory / f"{name}.csv.gz"
+            count = await export_partition(session, name, path)
+            await detach_partition(session, name, drop=drop)
+            await session.commit()
+            logger.info(f"Archived {count} rows of {name} to {path}")
+            archived.append(name)
+    return archived
+
+
+async def _partition(day: date) -> int:
+    async with get_engine().begin() as conn:
+        return await convert_to_partitioned(conn, day)
+
+
+def manage_retention_logs():
+    """Обслуживание журнала ответов retention_logs.
+
+    partition - перевести существующую таблицу на месячные секции
+    (однократно, в окно обслуживания); maintain - создать секции наперед
+    и свернуть прошедшие дни в retention_daily; archive - выгрузить
+    секции старше --months месяцев в <dir>/<секция>.csv.gz и отсоединить.
+    """
+    parser = argparse.ArgumentParser(
+        description=manage_retention_logs.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "command", choices=["partition", "maintain", "archive"]
+    )
+    parser.add_argument("--months", type=int, default=RETENTION_ARCHIVE_MONTHS)
+    parser.add_argument("--dir", type=Path, default=RETENTION_ARCHIVE_DIR)
+    parser.add_argument(
+        "--drop",
+        action="store_true",
+        help="удалить секции после выгрузки",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    day = today()
+    if args.command == "partition":
+        moved = asyncio.run(_partition(day))
+        print(f"✅ {moved} rows moved into partitions")
+    elif args.command == "maintain":
+        print(f"✅ {asyncio.run(maintain(day=day))}")
+    else:
+        before = add_months(month_start(day), -args.months)
+        archived = asyncio.run(archive_partitions(before, args.dir, args.drop))
+        print(f"✅ {len(archived)} partitions archived: {', '.join(archived)}")
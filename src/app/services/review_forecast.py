@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import UTC, date, datetime, timedelta
+from time import monotonic
+
+from app.db import Session
+from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+from app.utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+FORECAST_DAYS = int(os.getenv("FORECAST_DAYS", "90"))
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "10000"))
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "900"))
+FORECAST_REFRESH_INTERVAL = float(
+    os.getenv("FORECAST_REFRESH_INTERVAL", "600")
+)
+
+
+def fill_days(rows, start: date, days: int) -> list[dict]:
+    """Ряд по всем дням от start, дни без карточек с нулем"""
+    counts = {}
+    for day, count in rows:
+        day = day.date() if isinstance(day, datetime) else day
+        counts[day] = counts.get(day, 0) + count
+    series = (start + timedelta(days=i) for i in range(days))
+    return [{"date": day, "reviews": counts.get(day, 0)} for day in series]
+
+
+class ReviewForecastService:
+    """Прогноз числа повторений по дням на ближайшие days дней.
+
+    Прогноз пользователя кэшируется на ttl секунд и сбрасывается после
+    его ответа. Общий прогноз пересчитывается в фоне раз в
+    refresh_interval секунд, запросы получают последний посчитанный.
+    """
+
+    def __init__(
+        self,
+        days: int = FORECAST_DAYS,
+        cache_size: int = FORECAST_CACHE_SIZE,
+        ttl: float = FORECAST_CACHE_TTL,
+        refresh_interval: float = FORECAST_REFRESH_INTERVAL,
+        session_factory=Session,
+    ):
+        self.days = days
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.session_factory = session_factory
+        self.cache = LRUCache(cache_size)
+        self.global_forecast = None
+        self._stopping = None
+
+    async def _compute(self, user_id: uuid.UUID | None) -> dict:
+        async with self.session_factory() as session:
+            rows = await UserKnowledgeRepository(session).review_forecast(
+                self.days, user_id
+            )
+        generated_at = datetime.now(UTC)
+        days = fill_days(rows, generated_at.date(), self.days)
+        return {
+            "generated_at": generated_at,
+            "total": sum(day["reviews"] for day in days),
+            "days": days,
+        }
+
+    async def for_user(self, user_id: uuid.UUID) -> dict:
+        entry = self.cache.get(user_id)
+        if entry is not None and monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        forecast = await self._compute(user_id)
+        self.cache.put(user_id, (monotonic(), forecast))
+        return forecast
+
+    def invalidate(self, user_id: uuid.UUID):
+        self.cache.pop(user_id)
+
+    async def system(self) -> dict:
+        if self.global_forecast is None:
+            await self.refresh()
+        return self.global_forecast
+
+    async def refresh(self):
+        started = monotonic()
+        self.global_forecast = await self._compute(None)
+        logger.info(
+            f"Review forecast refreshed in {monotonic() - started:.2f}s: "
+            f"{self.global_forecast['total']} reviews"
+        )
+
+    async def run(self):
+        """Фоновый пересчет общего прогноза до вызова stop"""
+        self._stopping = asyncio.Event()
+        while not self._stopping.is_set():
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Review forecast refresh failed: {str(e)}")
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=self.refresh_interval
+                )
+            except TimeoutError:
+                pass
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
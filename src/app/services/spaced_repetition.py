@@ -1,26 +1,63 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+
+import numpy as np
+
 from app.models import User, UserKnowledge
 
+GOOD_QUALITY = 0.6
+LAMBDA_ON_SUCCESS = 0.9
+LAMBDA_ON_FAILURE = 1.1
+RETENTION_ON_FAILURE = 0.5
+MAX_INTERVAL_DAYS = 10
+LAMBDA_BOUNDS = (0.1, 0.9)
+RETENTION_BOUNDS = (0.1, 0.99)
+
+
+@dataclass
+class ScheduleUpdate:
+    """Результат пакетного пересчета, массивы выровнены по входу.
+
+    retention и lambda_coef ограничены допустимыми границами и
+    сохраняются в БД, raw_* нужны для журнала retention_logs, как и в
+    update_knowledge.
+    """
+
+    retention: np.ndarray
+    lambda_coef: np.ndarray
+    raw_retention: np.ndarray
+    raw_lambda: np.ndarray
+    interval_days: np.ndarray
+
 
 class SpacedRepetitionService:
     @staticmethod
-    def update_knowledge(user: User, knowledge: UserKnowledge, quality: float):
+    def update_knowledge(
+        user: User,
+        knowledge: UserKnowledge,
+        quality: float,
+        now: datetime | None = None,
+    ):
         if not hasattr(user, "lambda_coef"):
             user.lambda_coef = 0.5
 
         retention = knowledge.retention
         old_lambda = user.lambda_coef
-        if quality >= 0.6:
+        if quality >= GOOD_QUALITY:
             new_retention = retention + (1 - retention) * old_lambda
-            new_lambda = old_lambda * 0.9
+            new_lambda = old_lambda * LAMBDA_ON_SUCCESS
         else:
-            new_retention = retention * 0.5
-            new_lambda = old_lambda * 1.1
+            new_retention = retention * RETENTION_ON_FAILURE
+            new_lambda = old_lambda * LAMBDA_ON_FAILURE
 
-        interval_days = max(1, int(10 * (1 - new_retention)))
-        user.lambda_coef = max(0.1, min(0.9, new_lambda))
-        knowledge.retention = max(0.1, min(0.99, new_retention))
-        knowledge.last_reviewed = datetime.utcnow()
+        interval_days = max(1, int(MAX_INTERVAL_DAYS * (1 - new_retention)))
+        user.lambda_coef = max(
+            LAMBDA_BOUNDS[0], min(LAMBDA_BOUNDS[1], new_lambda)
+        )
+        knowledge.retention = max(
+            RETENTION_BOUNDS[0], min(RETENTION_BOUNDS[1], new_retention)
+        )
+        knowledge.last_reviewed = now or datetime.utcnow()
         knowledge.next_review = knowledge.last_reviewed + timedelta(
             days=interval_days
         )
@@ -35,6 +72,58 @@ class SpacedRepetitionService:
 
         return user, knowledge, log_data
 
+    @staticmethod
+    def update_batch(retention, lambda_coef, quality) -> ScheduleUpdate:
+        """Те же правила, что в update_knowledge, для массивов значений.
+
+        Args:
+            retention: Текущие retention карточек.
+            lambda_coef: lambda_coef владельцев карточек, по одному
+                значению на карточку.
+            quality: Оценки ответов.
+        """
+        retention = np.asarray(retention, dtype=np.float64)
+        lambda_coef = np.asarray(lambda_coef, dtype=np.float64)
+        good = np.asarray(quality, dtype=np.float64) >= GOOD_QUALITY
+
+        raw_retention = np.where(
+            good,
+            retention + (1 - retention) * lambda_coef,
+            retention * RETENTION_ON_FAILURE,
+        )
+        raw_lambda = lambda_coef * np.where(
+            good, LAMBDA_ON_SUCCESS, LAMBDA_ON_FAILURE
+        )
+        return ScheduleUpdate(
+            retention=np.clip(raw_retention, *RETENTION_BOUNDS),
+            lambda_coef=np.clip(raw_lambda, *LAMBDA_BOUNDS),
+            raw_retention=raw_retention,
+            raw_lambda=raw_lambda,
+            interval_days=SpacedRepetitionService.interval_days(raw_retention),
+        )
+
+    @staticmethod
+    def interval_days(retention) -> np.ndarray:
+        """Интервал до следующего повторения в днях для массива retention"""
+        retention = np.asarray(retention, dtype=np.float64)
+        # astype отбрасывает дробную часть так же, как int()
+        days = (MAX_INTERVAL_DAYS * (1 - retention)).astype(np.int64)
+        return np.maximum(1, days)
+
+    @staticmethod
+    def predicted_retention(retention, lambda_coef, days_since):
+        """Ожидаемое удержание через days_since дней после повторения.
+
+        Экспоненциальная кривая забывания R * exp(-lambda * t): сохраненный
+        retention меняется только при ответе, а между ответами убывает
+        тем быстрее, чем больше lambda_coef пользователя. Та же формула
+        в SQL используется для порядка очереди повторений.
+        """
+        days = np.maximum(np.asarray(days_since, dtype=np.float64), 0)
+        return np.asarray(retention, dtype=np.float64) * np.exp(
+            -np.asarray(lambda_coef, dtype=np.float64) * days
+        )
+
 
 class RetentionLogData:
     def __init__(
@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import numpy as np
+from sqlalchemy import Integer, column, func
+
+from app.db import Session
+from app.models.user_knowledge import UserKnowledge
+from app.repositories.retention_log_repository import RetentionLogRepository
+from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+from app.repositories.user_repository import UserRepository
+from app.repositories.user_stats_repository import (
+    UserStatsRepository,
+    stats_delta,
+)
+from app.services.spaced_repetition import SpacedRepetitionService
+
+logger = logging.getLogger(__name__)
+
+SRS_BATCH_SIZE = int(os.getenv("SRS_BATCH_SIZE", "5000"))
+
+
+@dataclass
+class BatchStats:
+    """Счетчики и длительность этапов пакетного пересчета"""
+
+    rows: int = 0
+    skipped: int = 0
+    read_seconds: float = 0.0
+    compute_seconds: float = 0.0
+    write_seconds: float = 0.0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.read_seconds + self.compute_seconds + self.write_seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        total = self.total_seconds
+        return self.rows / total if total > 0 else 0.0
+
+    def __str__(self):
+        compute = (
+            self.rows / self.compute_seconds if self.compute_seconds else 0
+        )
+        return (
+            f"{self.rows} rows ({self.skipped} skipped) in "
+            f"{self.total_seconds:.2f}s, {self.rows_per_second:.0f} rows/s "
+            f"(read {self.read_seconds:.2f}s, "
+            f"compute {compute:.0f} rows/s, "
+            f"write {self.write_seconds:.2f}s)"
+        )
+
+
+def _codes(items) -> tuple[np.ndarray, list]:
+    """Номера уникальных значений в порядке первого появления"""
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(item, len(index)) for item in items),
+        dtype=np.int64,
+        count=len(items),
+    )
+    return codes, list(index)
+
+
+def _rank_within(codes: np.ndarray) -> np.ndarray:
+    """Порядковый номер каждого элемента среди элементов с тем же кодом"""
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(sorted_codes) != 0])
+    sizes = np.diff(np.r_[starts, len(codes)])
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes)) - np.repeat(starts, sizes)
+    return ranks
+
+
+@dataclass
+class ReviewLog:
+    """Значения для retention_logs, выровненные по ответам"""
+
+    old_lambda: np.ndarray
+    new_lambda: np.ndarray
+    retention_before: np.ndarray
+    retention_after: np.ndarray
+    ranks: np.ndarray
+
+
+def apply_in_order(
+    retention, lambda_coef, interval, card_codes, user_codes, quality
+) -> ReviewLog:
+    """Применяет ответы к состоянию на месте, по порядку для пользователя.
+
+    Каждый ответ меняет lambda_coef пользователя, поэтому i-е ответы
+    всех пользователей считаются одним вызовом update_batch.
+
+    Args:
+        retention: retention карточек, обновляется на месте.
+        lambda_coef: lambda_coef пользователей, обновляется на месте.
+        interval: Интервалы карточек в днях, обновляются на месте.
+        card_codes: Индекс карточки в retention для каждого ответа.
+        user_codes: Индекс пользователя в lambda_coef для каждого ответа.
+        quality: Оценки ответов.
+    """
+    count = len(quality)
+    log = ReviewLog(
+        np.empty(count),
+        np.empty(count),
+        np.empty(count),
+        np.empty(count),
+        _rank_within(user_codes),
+    )
+    if not count:
+        return log
+
+    for step in range(int(log.ranks.max()) + 1):
+        idx = np.flatnonzero(log.ranks == step)
+        c = card_codes[idx]
+        u = user_codes[idx]
+        update = SpacedRepetitionService.update_batch(
+            retention[c], lambda_coef[u], quality[idx]
+        )
+        log.old_lambda[idx] = lambda_coef[u]
+        log.retention_before[idx] = retention[c]
+        log.new_lambda[idx] = update.raw_lambda
+        log.retention_after[idx] = update.raw_retention
+
+        retention[c] = update.retention
+        lambda_coef[u] = update.lambda_coef
+        interval[c] = update.interval_days
+    return log
+
+
+class SpacedRepetitionBatch:
+    """Пакетный пересчет интервальных повторений на массивах NumPy.
+
+    Правила те же, что в SpacedRepetitionService.update_knowledge,
+    результаты записываются запросами UPDATE ... FROM (VALUES ...).
+    """
+
+    def __init__(self, session_factory=Session, batch_size=SRS_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+
+    async def apply_reviews(
+        self, reviews: list[tuple], reviewed_at: datetime | None = None
+    ) -> BatchStats:
+        """Применяет пачку ответов (user_id, concept_id, quality).
+
+        Ответы одного пользователя применяются по порядку, потому что
+        каждый меняет его lambda_coef: i-е ответы всех пользователей
+        считаются одним векторным шагом. Ответы на отсутствующие
+        карточки пропускаются.
+        """
+        stats = BatchStats()
+        reviewed_at = reviewed_at or datetime.utcnow()
+        for start in range(0, len(reviews), self.batch_size):
+            chunk = reviews[start : start + self.batch_size]
+            async with self.session_factory() as session:
+                await self._apply_chunk(session, chunk, reviewed_at, stats)
+        logger.info(f"Applied reviews: {stats}")
+        return stats
+
+    async def _apply_chunk(self, session, reviews, reviewed_at, stats):
+        started = perf_counter()
+        knowledge_repo = UserKnowledgeRepository(session)
+        states = await knowledge_repo.get_review_states(
+            list({(u, c) for u, c, _ in reviews})
+        )
+        stats.read_seconds += perf_counter() - started
+
+        started = perf_counter()
+        known = {(u, c): r for u, c, r, _ in states}
+        lambdas = {u: lam for u, _, _, lam in states}
+        total = len(reviews)
+        reviews = [r for r in reviews if (r[0], r[1]) in known]
+        stats.skipped += total - len(reviews)
+        if not reviews:
+            stats.compute_seconds += perf_counter() - started
+            return
+
+        user_codes, users = _codes([u for u, _, _ in reviews])
+        pair_codes, pairs = _codes([(u, c) for u, c, _ in reviews])
+        quality = np.fromiter(
+            (q for _, _, q in reviews), dtype=np.float64, count=len(reviews)
+        )
+        retention = np.array([known[p] for p in pairs], dtype=np.float64)
+        lambda_coef = np.array(
+            [lambdas[u] if lambdas[u] is not None else 0.5 for u in users],
+            dtype=np.float64,
+        )
+        interval = np.ones(len(pairs), dtype=np.int64)
+        log = apply_in_order(
+            retention, lambda_coef, interval, pair_codes, user_codes, quality
+        )
+        n = len(reviews)
+
+        # Уникальность (user_id, concept_id, timestamp) в журнале:
+        # повторные ответы на карточку сдвигаются на микросекунды
+        log_rows = [
+            {
+                "user_id": user_id,
+                "concept_id": concept_id,
+                "old_lambda": values[0],
+                "new_lambda": values[1],
+                "retention_before": values[2],
+                "retention_after": values[3],
+                "timestamp": reviewed_at + timedelta(microseconds=values[4]),
+            }
+            for (user_id, concept_id, _), values in zip(
+                reviews,
+                zip(
+                    log.old_lambda.tolist(),
+                    log.new_lambda.tolist(),
+                    log.retention_before.tolist(),
+                    log.retention_after.tolist(),
+                    log.ranks.tolist(),
+                ),
+            )
+        ]
+        knowledge_rows = [
+            (
+                user_id,
+                concept_id,
+                value,
+                reviewed_at,
+                reviewed_at + timedelta(days=days),
+            )
+            for (user_id, concept_id), value, days in zip(
+                pairs, retention.tolist(), interval.tolist()
+            )
+        ]
+        lambda_rows = list(zip(users, lambda_coef.tolist()))
+        stats_deltas = [
+            stats_delta(user_id, known[user_id, concept_id], count=-1)
+            for user_id, concept_id in pairs
+        ]
+        stats_deltas += [
+            stats_delta(user_id, value)
+            for (user_id, _), value in zip(pairs, retention.tolist())
+        ]
+        stats_deltas += [
+            stats_delta(user_id, reviews=1) for user_id, _, _ in reviews
+        ]
+        stats.compute_seconds += perf_counter() - started
+
+        started = perf_counter()
+        await knowledge_repo.update_from_values(
+            [
+                "user_id",
+                "concept_id",
+                "retention",
+                "last_reviewed",
+                "next_review",
+            ],
+            knowledge_rows,
+            keys=("user_id", "concept_id"),
+        )
+        await UserRepository(session).update_from_values(
+            ["id", "lambda_coef"], lambda_rows
+        )
+        await RetentionLogRepository(session).add_many(log_rows)
+        await UserStatsRepository(session).apply(
+            stats_deltas, reviewed_at.date()
+        )
+        await session.commit()
+        stats.write_seconds += perf_counter() - started
+        stats.rows += n
+
+    async def reschedule(self) -> BatchStats:
+        """Пересчитывает next_review всех карточек по текущему retention.
+
+        Нужен после изменения правил интервалов. Карточки читаются
+        страницами по ключу (user_id, concept_id), интервалы считаются
+        векторно, а next_review = last_reviewed + интервал вычисляется
+        в самом UPDATE.
+        """
+        stats = BatchStats()
+        after = None
+        days = column("days", Integer)
+        while True:
+            started = perf_counter()
+            async with self.session_factory() as session:
+                repo = UserKnowledgeRepository(session)
+                page = await repo.schedule_page(after, self.batch_size)
+                stats.read_seconds += perf_counter() - started
+                if not page:
+                    break
+
+                started = perf_counter()
+                retention = np.fromiter(
+                    (r if r is not None else 0.0 for _, _, r in page),
+                    dtype=np.float64,
+                    count=len(page),
+                )
+                intervals = SpacedRepetitionService.interval_days(retention)
+                rows = [
+                    (user_id, concept_id, interval)
+                    for (user_id, concept_id, _), interval in zip(
+                        page, intervals.tolist()
+                    )
+                ]
+                stats.compute_seconds += perf_counter() - started
+
+                started = perf_counter()
+                await repo.update_from_values(
+                    ["user_id", "concept_id", days],
+                    rows,
+                    keys=("user_id", "concept_id"),
+                    set_=lambda v: {
+                        "next_review": UserKnowledge.last_reviewed
+                        + func.make_interval(0, 0, 0, v.c.days)
+                    },
+                )
+                await session.commit()
+                stats.write_seconds += perf_counter() - started
+
+            stats.rows += len(page)
+            after = page[-1][:2]
+            logger.info(f"Rescheduled {stats.rows} cards")
+
+        logger.info(f"Reschedule finished: {stats}")
+        return stats
+
+
+def reschedule_all():
+    """Пересчитывает next_review всех карточек по текущим правилам"""
+    parser = argparse.ArgumentParser(description=reschedule_all.__doc__)
+    parser.add_argument("--batch-size", type=int, default=SRS_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = asyncio.run(
+        SpacedRepetitionBatch(batch_size=args.batch_size).reschedule()
+    )
+    print(f"✅ {stats}")
@@ -0,0 +1,166 @@
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from time import perf_counter
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services.spaced_repetition import (
+    GOOD_QUALITY,
+    SpacedRepetitionService,
+)
+from app.services.srs_batch import apply_in_order
+
+# Момент всех ответов бенчмарка, чтобы прогоны не зависели от часов
+BENCHMARK_NOW = datetime(2025, 1, 1, tzinfo=UTC)
+
+
+@dataclass
+class RecallModel:
+    """Модель памяти синтетических пользователей.
+
+    Вероятность вспомнить карточку exp(-decay * t / stability): скорость
+    забывания decay своя у каждого пользователя (логнормальная), у
+    каждой карточки есть множитель сложности, а stability растет в
+    growth раз после каждого верного ответа.
+    """
+
+    decay_median: float = 0.3
+    decay_sigma: float = 0.4
+    difficulty_sigma: float = 0.3
+    growth: float = 1.8
+
+    def recall_probability(self, decay, stability, days):
+        return np.exp(-decay * days / stability)
+
+
+@dataclass
+class SimulationConfig:
+    users: int = 1000
+    cards_per_user: int = 50
+    new_cards_per_day: int = 5
+    days: int = 365
+    seed: int = 0
+
+
+@dataclass
+class SimulationReport:
+    config: dict
+    daily_reviews: list = field(repr=False)
+    reviews: int = 0
+    engine_seconds: float = 0.0
+    retention: dict = field(default_factory=dict)
+    recall: dict = field(default_factory=dict)
+
+    @property
+    def reviews_per_second(self) -> float:
+        if not self.engine_seconds:
+            return 0.0
+        return self.reviews / self.engine_seconds
+
+    def load_summary(self) -> dict:
+        load = np.asarray(self.daily_reviews)
+        return {
+            "mean": float(load.mean()),
+            "p95": float(np.percentile(load, 95)),
+            "max": int(load.max()),
+        }
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data.pop("daily_reviews")
+        data["daily_load"] = self.load_summary()
+        data["reviews_per_second"] = self.reviews_per_second
+        return data
+
+
+def _percentiles(values) -> dict:
+    points = np.percentile(values, [10, 50, 90])
+    return {
+        "mean": float(np.mean(values)),
+        "p10": float(points[0]),
+        "p50": float(points[1]),
+        "p90": float(points[2]),
+    }
+
+
+def simulate(
+    config: SimulationConfig, model: RecallModel | None = None
+) -> SimulationReport:
+    """Моделирует ежедневные повторения всех карточек config.days дней.
+
+    Каждый день пользователи отвечают на все наступившие карточки,
+    ответ определяется моделью памяти, а состояние пересчитывается тем
+    же векторным движком, что и SpacedRepetitionBatch. Время
+    моделируется номером дня, замеряется только время движка.
+    """
+    model = model or RecallModel()
+    rng = np.random.default_rng(config.seed)
+    cards = config.users * config.cards_per_user
+
+    owner = np.repeat(np.arange(config.users), config.cards_per_user)
+    # Новые карточки появляются у каждого пользователя постепенно
+    position = np.tile(np.arange(config.cards_per_user), config.users)
+    added_day = position // max(config.new_cards_per_day, 1)
+
+    decay = rng.lognormal(
+        np.log(model.decay_median), model.decay_sigma, config.users
+    )[owner] * rng.lognormal(0, model.difficulty_sigma, cards)
+    stability = np.ones(cards)
+    last_day = added_day.astype(np.float64)
+
+    retention = np.zeros(cards)
+    lambda_coef = np.full(config.users, 0.5)
+    interval = np.zeros(cards, dtype=np.int64)
+    next_day = added_day.copy()
+
+    report = SimulationReport(asdict(config), [])
+    for day in range(config.days):
+        due = np.flatnonzero(next_day <= day)
+        report.daily_reviews.append(len(due))
+        if len(due):
+            recalled = rng.random(len(due)) < model.recall_probability(
+                decay[due], stability[due], day - last_day[due]
+            )
+            quality = np.where(
+                recalled,
+                rng.uniform(GOOD_QUALITY, 1, len(due)),
+                rng.uniform(0, GOOD_QUALITY, len(due)),
+            )
+            stability[due[recalled]] *= model.growth
+
+            started = perf_counter()
+            apply_in_order(
+                retention, lambda_coef, interval, due, owner[due], quality
+            )
+            report.engine_seconds += perf_counter() - started
+
+            last_day[due] = day
+            next_day[due] = day + interval[due]
+            report.reviews += len(due)
+
+    seen = added_day < config.days
+    report.retention = _percentiles(retention[seen])
+    report.recall = _percentiles(
+        model.recall_probability(
+            decay[seen], stability[seen], config.days - last_day[seen]
+        )
+    )
+    return report
+
+
+def benchmark_update_knowledge(
+    calls: int, now: datetime = BENCHMARK_NOW, seed: int = 0
+) -> float:
+    """Число вызовов update_knowledge в секунду, путь одного /review"""
+    rng = np.random.default_rng(seed)
+    user = SimpleNamespace(id=1, lambda_coef=0.5)
+    knowledge = SimpleNamespace(concept_id=1, retention=0.5)
+    quality = rng.random(calls).tolist()
+
+    started = perf_counter()
+    for value in quality:
+        SpacedRepetitionService.update_knowledge(
+            user, knowledge, value, now=now
+        )
+    return calls / (perf_counter() - started)
@@ -1,86 +1,171 @@
-from app.utils.text import normalize_text
 from app.repositories.concept_repository import ConceptRepository
 from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+from app.repositories.user_stats_repository import (
+    UserStatsRepository,
+    stats_delta,
+)
+from app.models.concepts import PLACEHOLDER_DESCRIPTION
+import asyncio
 import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
-from razdel import tokenize, sentenize
-from app.models.user_knowledge import UserKnowledge
+from sqlalchemy import bindparam, text
+from razdel import sentenize
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from time import perf_counter
+import os
 import re
 import logging
+from app.services.concept_extractor import get_extractor
+from app.services.definition_jobs import enqueue_definitions
 from app.services.nlp_loader import get_nlp_model
 
 logger = logging.getLogger(__name__)
 
-ALLOWED_ENT_TYPES = {"PER", "ORG", "LOC", "MISC", "GPE", "EVENT", "PRODUCT"}
+NLP_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "64"))
+NEW_CARD_RETENTION = 0.5
+
+
+@dataclass
+class ExtractionStats:
+    """Счетчики и длительность этапов пакетного извлечения концептов"""
+
+    texts: int = 0
+    sentences: int = 0
+    split_seconds: float = 0.0
+    nlp_seconds: float = 0.0
+    match_seconds: float = 0.0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.split_seconds + self.nlp_seconds + self.match_seconds
+
+    def rate(self, seconds: float) -> float:
+        """Предложений в секунду для этапа с указанной длительностью"""
+        return self.sentences / seconds if seconds > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.texts} texts, {self.sentences} sentences in "
+            f"{self.total_seconds:.3f}s "
+            f"(split {self.rate(self.split_seconds):.0f}/s, "
+            f"nlp {self.rate(self.nlp_seconds):.0f}/s, "
+            f"match {self.rate(self.match_seconds):.0f}/s, "
+            f"total {self.rate(self.total_seconds):.0f}/s)"
+        )
 
 
 class TextProcessorService:
-    def __init__(self, prompt_service=None):
-        self.nlp = get_nlp_model()
+    def __init__(
+        self,
+        prompt_service=None,
+        batch_size: int = NLP_BATCH_SIZE,
+        executor=None,
+        cache=None,
+        defer_definitions: bool = False,
+    ):
+        self._nlp = None
         self.prompt_service = prompt_service
+        # Определения новых концептов генерируются воркером очереди
+        # задач, а не во время обработки текста
+        self.defer_definitions = defer_definitions
+        self.batch_size = batch_size
+        self.executor = executor
+        self.cache = cache
+        self.last_stats = None
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = get_nlp_model()
+        return self._nlp
+
+    @property
+    def extractor(self):
+        return get_extractor(self.nlp)
+
+    def extract_concepts_batch(
+        self, texts: list[str], batch_size: int | None = None
+    ) -> list[dict]:
+        """Извлекает концепты из нескольких текстов за один проход nlp.pipe"""
+        stats = ExtractionStats(texts=len(texts))
+        results = [{} for _ in texts]
+
+        started = perf_counter()
+        sentences = []
+        owners = []
+        for index, content in enumerate(texts):
+            if not content.strip():
+                continue
+            for sentence in sentenize(content):
+                sentences.append(sentence.text)
+                owners.append(index)
+        stats.sentences = len(sentences)
+        stats.split_seconds = perf_counter() - started
+
+        docs = iter(
+            self.nlp.pipe(sentences, batch_size=batch_size or self.batch_size)
+        )
+        for owner in owners:
+            started = perf_counter()
+            doc = next(docs)
+            parsed = perf_counter()
+            for canonical, surface in self.extractor.extract(doc).items():
+                results[owner].setdefault(canonical, surface)
+            stats.nlp_seconds += parsed - started
+            stats.match_seconds += perf_counter() - parsed
+
+        self.last_stats = stats
+        logger.info(f"Concept extraction: {stats}")
+        return results
+
+    def canonicalize_batch(self, phrases: list[str]) -> list[str]:
+        return self.extractor.canonicalize(self.nlp, phrases)
+
+    async def canonicalize(self, phrases: list[str]) -> list[str]:
+        """Канонические ключи для фраз без контекста, например из "::" """
+        if not phrases:
+            return []
+        if self.executor is not None:
+            return await self.executor.canonicalize(phrases)
+        # nlp.pipe и загрузка модели не должны блокировать event loop
+        return await asyncio.to_thread(self.canonicalize_batch, phrases)
+
+    async def extract_concepts(self, texts: list[str]) -> list[dict]:
+        """Извлекает концепты по предложениям, минуя spaCy для кэшированных"""
+        sentences_by_text = [
+            [s.text for s in sentenize(content)] if content.strip() else []
+            for content in texts
+        ]
+        unique = list(
+            dict.fromkeys(
+                s for sentences in sentences_by_text for s in sentences
+            )
+        )
 
-    async def _extract_concepts(self, text: str):
-        if not text.strip():
-            return set()
-
-        concepts = set()
-        sentences = [s.text for s in sentenize(text)]
-
-        for sentence in sentences:
-            doc = self.nlp(sentence)
-
-            for ent in doc.ents:
-                if ent.label_ in ALLOWED_ENT_TYPES and len(ent.text) > 3:
-                    normalized = normalize_text(ent.text)
-                    concepts.add(normalized)
-
-            tokens = [token.text for token in tokenize(sentence)]
-
-            pos_tags = {token.text: token.pos_ for token in doc}
-
-            for i in range(len(tokens)):
-                token = tokens[i]
-                if len(token) < 4:
-                    continue
-
-                pos_tag = pos_tags.get(token, "")
-
-                if pos_tag in {"NOUN", "PROPN"}:
-                    concepts.add(normalize_text(token))
-                if i < len(tokens) - 1:
-                    next_token = tokens[i + 1]
-                    next_pos = pos_tags.get(next_token, "")
-
-                    if pos_tag == "ADJ" and next_pos in {"NOUN", "PROPN"}:
-                        phrase = f"{token} {next_token}"
-                        if len(phrase) > 7:
-                            concepts.add(normalize_text(phrase))
-                if i < len(tokens) - 2:
-                    next_token1 = tokens[i + 1]
-                    next_token2 = tokens[i + 2]
-                    next_pos1 = pos_tags.get(next_token1, "")
-                    next_pos2 = pos_tags.get(next_token2, "")
-
-                    if (
-                        pos_tag == "ADJ"
-                        and next_pos1 == "ADJ"
-                        and next_pos2 in {"NOUN", "PROPN"}
-                    ):
-                        phrase = f"{token} {next_token1} {next_token2}"
-                        if len(phrase) > 10:
-                            concepts.add(normalize_text(phrase))
-        custom_defs = {}
-        lines = text.split("\n")
-        for line in lines:
-            if "::" in line:
-                parts = line.split("::", 1)
-                concept_name = normalize_text(parts[0].strip())
-                definition = parts[1].strip()
-                custom_defs[concept_name] = definition
+        found = await self.cache.get_many(unique) if self.cache else {}
+        missing = [sentence for sentence in unique if sentence not in found]
+        if missing:
+            if self.executor is not None:
+                extracted = await self.executor.extract(missing)
+            else:
+                extracted = self.extract_concepts_batch(missing)
+            fresh = dict(zip(missing, extracted))
+            found.update(fresh)
+            if self.cache:
+                await self.cache.put_many(fresh)
+
+        results = []
+        for sentences in sentences_by_text:
+            merged = {}
+            for sentence in sentences:
+                for canonical, surface in found[sentence].items():
+                    merged.setdefault(canonical, surface)
+            results.append(merged)
+        return results
 
-        return concepts
+    async def _extract_concepts(self, text: str):
+        return (await self.extract_concepts([text]))[0]
 
     @staticmethod
     def normalize_text(text: str) -> str:
@@ -111,66 +196,111 @@ class TextProcessorService:
     ) -> list:
         concepts = await self._extract_concepts(text)
         custom_defs = self._extract_custom_definitions(text)
+        custom_keys = await self.canonicalize(list(custom_defs))
+        custom_defs = dict(zip(custom_keys, custom_defs.values()))
+        return await self.store_concepts(
+            concepts, user_id, domain_id, session, custom_defs
+        )
 
+    async def store_concepts(
+        self,
+        concepts: dict,
+        user_id: uuid.UUID,
+        domain_id: int,
+        session: AsyncSession,
+        custom_defs: dict | None = None,
+    ) -> list:
+        """Сохраняет извлеченные концепты и добавляет их пользователю.
+
+        Args:
+            concepts: Словарь {канонический ключ: название} из
+                extract_concepts.
+            custom_defs: Пользовательские определения по каноническим
+                ключам.
+
+        Returns:
+            Названия добавленных концептов.
+        """
+        custom_defs = custom_defs or {}
+        concepts = {k: v for k, v in concepts.items() if k}
         concept_repo = ConceptRepository(session)
         knowledge_repo = UserKnowledgeRepository(session)
 
+        # Все концепты ищутся, создаются и связываются с пользователем
+        # несколькими пакетными запросами в одной транзакции
+        existing = await concept_repo.get_by_canonicals(concepts)
+
         new_concepts_to_generate = []
         added_concepts = []
-
-        for concept_name in concepts:
-            if not concept_name:
-                continue
-            if concept_name in custom_defs:
-                description = custom_defs[concept_name]
-                concept = await concept_repo.get_or_create(
-                    name=concept_name,
-                    domain_id=domain_id,
-                    description=description,
+        linked = []
+        missing = []
+
+        for canonical, concept_name in concepts.items():
+            concept = existing.get(canonical)
+            if concept is None:
+                missing.append(
+                    {
+                        "name": concept_name,
+                        "canonical_name": canonical,
+                        "domain_id": domain_id,
+                        "description": custom_defs.get(
+                            canonical, PLACEHOLDER_DESCRIPTION
+                        ),
+                    }
                 )
+                continue
+            linked.append(concept)
+            if canonical in custom_defs:
+                added_concepts.append(concept_name)
+            elif not concept.description:
+                new_concepts_to_generate.append(concept)
                 added_concepts.append(concept_name)
-            else:
-                existing_concept = await concept_repo.get_first(
-                    name=concept_name
-                )
 
-                if existing_concept and existing_concept.description:
-                    concept = existing_concept
-                else:
-                    new_concepts_to_generate.append(concept_name)
-                    concept = await concept_repo.get_or_create(
-                        name=concept_name,
-                        domain_id=domain_id,
-                        description="Автоматически извлеченный термин",
+        created = await concept_repo.bulk_upsert(missing)
+        for concept in created:
+            linked.append(concept)
+            added_concepts.append(concept.name)
+            if concept.canonical_name not in custom_defs:
+                new_concepts_to_generate.append(concept)
+
+        now = datetime.utcnow()
+        added = await knowledge_repo.bulk_add(
+            user_id,
+            [concept.id for concept in linked],
+            retention=NEW_CARD_RETENTION,
+            last_reviewed=now,
+            next_review=now + timedelta(days=1),
+        )
+        if added:
+            await UserStatsRepository(session).apply(
+                [
+                    stats_delta(
+                        user_id, NEW_CARD_RETENTION, count=added, added=added
                     )
-                    added_concepts.append(concept_name)
-
-            knowledge = await knowledge_repo.get_first(
-                user_id=user_id, concept_id=concept.id
+                ],
+                now.date(),
             )
-
-            if not knowledge:
-                await knowledge_repo.add(
-                    UserKnowledge(
-                        user_id=user_id,
-                        concept_id=concept.id,
-                        retention=0.5,
-                        last_reviewed=datetime.utcnow(),
-                        next_review=datetime.utcnow() + timedelta(days=1),
-                    )
+        if new_concepts_to_generate and self.defer_definitions:
+            await enqueue_definitions(
+                session, [concept.id for concept in new_concepts_to_generate]
+            )
+        await session.commit()
+
+        if (
+            new_concepts_to_generate
+            and self.prompt_service
+            and not self.defer_definitions
+        ):
+            definitions = (
+                await self.prompt_service.generate_concept_definitions(
+                    [concept.name for concept in new_concepts_to_generate]
                 )
-
-        if new_concepts_to_generate and self.prompt_service:
-            for concept_name in new_concepts_to_generate:
-                ai_definition = (
-                    await self.prompt_service.generate_concept_definition(
-                        concept_name
-                    )
+            )
+            for concept in new_concepts_to_generate:
+                concept.description = definitions.get(
+                    concept.name, concept.description
                 )
-                concept = await concept_repo.get_first(name=concept_name)
-                if concept:
-                    concept.description = ai_definition
-                    await session.commit()
+            await session.commit()
 
         return added_concepts
 
@@ -180,30 +310,20 @@ class TextProcessorService:
         """Находит связи между концептами на основе совместного употребления"""
         if not concepts:
             return {}
-        concept_repo = ConceptRepository(session)
-        concept_ids = []
-        for concept_name in concepts:
-            concept = await concept_repo.get_first(name=concept_name)
-            if concept:
-                concept_ids.append(concept.id)
-
-        if not concept_ids:
-            return {}
+        # Концепты ищутся по названиям в том же запросе, а не по одному
         query = text("""
             SELECT c1.name AS concept_from, c2.name AS concept_to, COUNT(*) AS cooccurrence_count
             FROM user_knowledge uk1
             JOIN user_knowledge uk2 ON uk1.user_id = uk2.user_id
             JOIN concepts c1 ON uk1.concept_id = c1.id
             JOIN concepts c2 ON uk2.concept_id = c2.id
-            WHERE c1.id IN :concept_ids
-            AND c2.id IN :concept_ids
+            WHERE c1.name IN :names
+            AND c2.name IN :names
             AND c1.id != c2.id
             GROUP BY c1.name, c2.name
             ORDER BY cooccurrence_count DESC
-        """)
-        result = await session.execute(
-            query, {"concept_ids": tuple(concept_ids)}
-        )
+        """).bindparams(bindparam("names", expanding=True))
+        result = await session.execute(query, {"names": list(concepts)})
         relations = {concept: [] for concept in concepts}
         for row in result.all():
             concept_from = row[0]
@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime
+
+from app.db import Session
+from app.repositories.user_repository import UserRepository
+from app.repositories.user_stats_repository import (
+    COUNTERS,
+    UserStatsRepository,
+    shift_buckets,
+)
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_BATCH = int(os.getenv("STATS_RECONCILE_BATCH", "1000"))
+RETENTION_SUM_TOLERANCE = 1e-6
+
+
+def today() -> date:
+    return datetime.now(UTC).date()
+
+
+@dataclass
+class StatsDrift:
+    """Расхождения счетчиков user_stats с исходными таблицами"""
+
+    users: int = 0
+    drifted: int = 0
+    missing: int = 0
+    fields: dict = field(default_factory=dict)
+
+    def __str__(self):
+        details = ", ".join(
+            f"{name}: {count}" for name, count in sorted(self.fields.items())
+        )
+        return (
+            f"{self.users} users checked, {self.drifted} drifted, "
+            f"{self.missing} without stats"
+            + (f" ({details})" if details else "")
+        )
+
+
+def drifted_fields(stored, expected: dict) -> list[str]:
+    """Поля, в которых сохраненные счетчики расходятся с пересчетом"""
+    names = []
+    for name in COUNTERS:
+        value = getattr(stored, name)
+        if name == "retention_sum":
+            if abs(value - expected[name]) > RETENTION_SUM_TOLERANCE:
+                names.append(name)
+        elif value != expected[name]:
+            names.append(name)
+    buckets = shift_buckets(
+        stored.review_buckets, stored.buckets_day, expected["buckets_day"]
+    )
+    if buckets != expected["review_buckets"]:
+        names.append("review_buckets")
+    return names
+
+
+async def reconcile_stats(
+    fix: bool = True,
+    batch_size: int = STATS_RECONCILE_BATCH,
+    after_id: uuid.UUID | None = None,
+    session_factory=Session,
+) -> StatsDrift:
+    """Пересчитывает user_stats по user_knowledge и retention_logs.
+
+    Пользователи обходятся страницами по id. Для каждой страницы
+    счетчики считаются заново, сравниваются с сохраненными и при fix
+    перезаписываются.
+    """
+    drift = StatsDrift()
+    while True:
+        async with session_factory() as session:
+            user_ids = await UserRepository(session).ids_after(
+                after_id, batch_size
+            )
+            if not user_ids:
+                break
+
+            repo = UserStatsRepository(session)
+            day = today()
+            expected = await repo.source_stats(user_ids, day)
+            stored = {
+                stats.user_id: stats for stats in await repo.get_many(user_ids)
+            }
+
+            rows = []
+            for user_id in user_ids:
+                row = expected[user_id]
+                current = stored.get(user_id)
+                if current is None:
+                    drift.missing += 1
+                    rows.append(row)
+                    continue
+                names = drifted_fields(current, row)
+                if names:
+                    drift.drifted += 1
+                    rows.append(row)
+                    for name in names:
+                        drift.fields[name] = drift.fields.get(name, 0) + 1
+
+            drift.users += len(user_ids)
+            if fix and rows:
+                await repo.replace(rows)
+                await session.commit()
+        after_id = user_ids[-1]
+        logger.info(f"User stats reconcile: {drift}, last user {after_id}")
+    return drift
+
+
+def reconcile_user_stats():
+    """Пересчитывает user_stats по исходным таблицам и выводит расхождения.
+
+    Нужен после развертывания для заполнения таблицы и периодически для
+    контроля. С --dry-run только сообщает о расхождениях.
+    """
+    parser = argparse.ArgumentParser(description=reconcile_user_stats.__doc__)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--batch-size", type=int, default=STATS_RECONCILE_BATCH
+    )
+    parser.add_argument("--after-id", type=uuid.UUID, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    drift = asyncio.run(
+        reconcile_stats(
+            fix=not args.dry_run,
+            batch_size=args.batch_size,
+            after_id=args.after_id,
+        )
+    )
+    print(f"{'⚠️' if drift.drifted else '✅'} {drift}")
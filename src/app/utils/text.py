@@ -5,3 +5,8 @@ def normalize_text(text: str) -> str:
     """Нормализует текст для обработки: удаляет лишние пробелы, приводит к нижнему регистру"""
     text = re.sub(r"\s+", " ", text).strip()
     return text.lower()
+
+
+def lemma_key(lemmas) -> str:
+    """Канонический ключ концепта из лемм его слов"""
+    return normalize_text(" ".join(lemmas)).replace("ё", "е")
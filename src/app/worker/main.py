@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import signal
+from functools import partial
+
+from dotenv import load_dotenv
+
+from app.db import configure_engine, engine_metrics
+from app.services.definition_cache import DefinitionCache
+from app.services.definition_jobs import DEFINE_CONCEPTS, define_concepts
+from app.services.job_queue import JobWorker
+from app.services.prompt_generator import (
+    AI_MODEL,
+    DEFINITION_PROMPT_VERSION,
+    PromptService,
+    close_http_client,
+)
+from app.services.retention_logs import run_maintenance
+
+logger = logging.getLogger(__name__)
+
+
+def start_worker():
+    """Запускает воркер фоновых задач до SIGINT/SIGTERM"""
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    configure_engine("worker")
+
+    definition_cache = DefinitionCache(AI_MODEL, DEFINITION_PROMPT_VERSION)
+    prompt_service = PromptService(cache=definition_cache)
+    worker = JobWorker(
+        {
+            DEFINE_CONCEPTS: partial(
+                define_concepts, prompt_service=prompt_service
+            )
+        },
+        status=lambda: {
+            "definition_cache": definition_cache.metrics(),
+            "database": engine_metrics(),
+        },
+    )
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        # Секции retention_logs наперед и дневная свертка
+        maintenance = asyncio.create_task(run_maintenance())
+        try:
+            await worker.run()
+        finally:
+            maintenance.cancel()
+            await close_http_client()
+
+    asyncio.run(main())
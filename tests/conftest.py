@@ -0,0 +1,31 @@
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("DB_USER", "sciuser")
+os.environ.setdefault("DB_PASS", "sci_password")
+os.environ.setdefault("DB_NAME", "scientia_db")
+
+
+class FakeSession:
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def fake_session(request):
+    """Фабрика сессий без БД для сервисов с session_factory.
+
+    По умолчанию каждая сессия - новая FakeSession, через indirect-
+    параметризацию можно передать свой объект сессии.
+    """
+    session = getattr(request, "param", None)
+
+    @asynccontextmanager
+    async def factory():
+        yield session if session is not None else FakeSession()
+
+    return factory
@@ -0,0 +1,63 @@
+import logging
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, text
+
+from app.db import engine as db_engine
+from app.db.engine import DatabaseMetrics, EngineSettings
+
+
+def test_settings_are_tuned_per_role(monkeypatch):
+    monkeypatch.setenv("DB_POOL_RECYCLE", "600")
+    monkeypatch.setenv("DB_BOT_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_BOT_POOL_PRE_PING", "false")
+
+    bot = EngineSettings.from_env("bot")
+    api = EngineSettings.from_env("api")
+
+    assert bot.pool_size == 3 and not bot.pool_pre_ping
+    assert api.pool_size == 10 and api.pool_pre_ping
+    assert bot.pool_recycle == api.pool_recycle == 600
+    assert bot.max_overflow == 5 and not api.echo
+
+
+def test_slow_queries_are_counted_and_logged(monkeypatch, caplog):
+    metrics = DatabaseMetrics()
+    monkeypatch.setattr(db_engine, "metrics", metrics)
+    engine = create_engine("sqlite://")
+    settings = EngineSettings(role="api", slow_query_ms=0.001)
+    db_engine._install_query_hooks(
+        SimpleNamespace(sync_engine=engine), settings
+    )
+
+    query = text(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+        "SELECT i + 1 FROM n WHERE i < 20000) SELECT count(*) FROM n"
+    )
+    with (
+        caplog.at_level(logging.WARNING, logger="app.db.engine"),
+        engine.connect() as conn,
+    ):
+        conn.execute(query)
+
+    assert metrics.queries == 1 and metrics.slow_queries == 1
+    assert "Slow query" in caplog.text and "[api]" in caplog.text
+
+
+def test_pool_wait_snapshot():
+    metrics = DatabaseMetrics()
+    metrics.record_wait(0.002)
+    metrics.record_wait(0.004)
+    pool = SimpleNamespace(
+        size=lambda: 5,
+        checkedout=lambda: 2,
+        checkedin=lambda: 3,
+        overflow=lambda: -3,
+    )
+
+    snapshot = metrics.snapshot(pool)
+
+    assert snapshot["checkouts"] == 2
+    assert abs(snapshot["avg_wait_ms"] - 3.0) < 1e-9
+    assert abs(snapshot["max_wait_ms"] - 4.0) < 1e-9
+    assert snapshot["in_use"] == 2 and snapshot["overflow"] == 0
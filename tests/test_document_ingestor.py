@@ -0,0 +1,87 @@
+import asyncio
+import io
+
+from app.services.document_ingestor import (
+    DocumentIngestor,
+    IngestionProgress,
+    batched,
+    read_chunks,
+    split_sentences,
+)
+
+TEXT = (
+    "Нейронная сеть обучается на данных. Градиентный спуск ищет минимум. "
+    "Ёмкость модели ограничена!\n\nПереобучение снижает качество."
+)
+
+
+def test_read_chunks_decodes_multibyte_boundaries():
+    data = TEXT.encode("utf-8")
+    progress = IngestionProgress(total_bytes=len(data))
+
+    chunks = list(read_chunks(io.BytesIO(data), progress, chunk_bytes=7))
+
+    assert "".join(chunks) == TEXT
+    assert progress.bytes_read == len(data)
+    assert progress.percent == 1.0
+
+
+def test_split_sentences_across_chunks():
+    expected = list(split_sentences([TEXT]))
+    chunks = [TEXT[i : i + 10] for i in range(0, len(TEXT), 10)]
+
+    assert list(split_sentences(chunks)) == expected
+    assert len(expected) == 4
+
+
+def test_split_sentences_flushes_long_buffer():
+    chunks = ["слово " * 10] * 5
+
+    sentences = list(split_sentences(chunks, max_chars=100))
+
+    assert max(len(s) for s in sentences) <= 100 + 60
+    assert "".join(sentences).split() == ("слово " * 50).split()
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+class FakeProcessor:
+    def __init__(self):
+        self.batches = []
+        self.stored = []
+
+    async def extract_concepts(self, texts):
+        self.batches.append(texts)
+        return [{text.split()[0].lower(): text.split()[0]} for text in texts]
+
+    async def store_concepts(self, concepts, user_id, domain_id, session):
+        self.stored.append(concepts)
+        return list(concepts.values())
+
+
+def test_ingest_processes_document_in_batches(tmp_path, fake_session):
+    path = tmp_path / "notes.md"
+    path.write_text("\n".join([TEXT] * 3), encoding="utf-8")
+    processor = FakeProcessor()
+    reports = []
+
+    async def on_progress(progress):
+        reports.append((progress.sentences, progress.done))
+
+    ingestor = DocumentIngestor(
+        processor,
+        batch_sentences=5,
+        progress_interval=0,
+        session_factory=fake_session,
+    )
+    result = asyncio.run(ingestor.ingest(path, "user", 1, on_progress))
+
+    assert [len(batch) for batch in processor.batches] == [5, 5, 2]
+    assert result.sentences == 12
+    assert result.batches == 3
+    assert result.done
+    assert result.bytes_read == result.total_bytes
+    assert reports[-1] == (12, True)
+    assert len(reports) == 4
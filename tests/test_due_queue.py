@@ -0,0 +1,112 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+from app.repositories.user_repository import UserRepository
+from app.services.due_queue import DueQueueService
+
+NOW = datetime.now(UTC)
+
+
+def card(concept_id, retention, overdue_days):
+    reviewed = NOW - timedelta(days=overdue_days + 1)
+    return (
+        SimpleNamespace(
+            concept_id=concept_id,
+            retention=retention,
+            last_reviewed=reviewed,
+            next_review=NOW - timedelta(days=overdue_days),
+        ),
+        f"word{concept_id}",
+        None if concept_id == 3 else f"def{concept_id}",
+    )
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = SimpleNamespace(
+        cards={
+            1: [card(1, 0.9, 0), card(2, 0.9, 30), card(3, 0.5, 1)],
+            2: [card(4, 0.5, 1), card(5, 0.5, 2)],
+        },
+        queries=0,
+    )
+
+    async def get_by_telegram_id(self, telegram_id):
+        if telegram_id not in db.cards:
+            return None
+        return SimpleNamespace(id=telegram_id, lambda_coef=0.5)
+
+    async def get_review_cards(self, user_id, limit=20, now=None):
+        db.queries += 1
+        return db.cards[user_id][:limit]
+
+    monkeypatch.setattr(
+        UserRepository, "get_by_telegram_id", get_by_telegram_id
+    )
+    monkeypatch.setattr(
+        UserKnowledgeRepository, "get_review_cards", get_review_cards
+    )
+    return db
+
+
+def test_next_card_is_served_from_memory(fake_db, fake_session):
+    queue = DueQueueService(size=10, refill_at=0, session_factory=fake_session)
+
+    async def scenario():
+        first = await queue.next_card(1)
+        second = await queue.next_card(1)
+        queue.invalidate(1, first["concept_id"])
+        third = await queue.next_card(1)
+        with pytest.raises(LookupError):
+            await queue.next_card(99)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+
+    # Сильно просроченная карточка раньше почти свежей
+    assert first["concept_id"] == 2 and second == first
+    assert third["concept_id"] == 3
+    assert third["definition"] == "Без определения"
+    assert fake_db.queries == 1
+    assert queue.metrics()["hits"] == 2
+    assert queue.cards == 2
+
+
+def test_low_queue_is_refilled_in_background(fake_db, fake_session):
+    queue = DueQueueService(size=2, refill_at=1, session_factory=fake_session)
+
+    async def scenario():
+        await queue.next_card(1)
+        # Ответ на карточку 2 записан, она ушла в конец очереди в БД
+        del fake_db.cards[1][1]
+        queue.invalidate(1, 2)
+        # Дозагрузка еще не выполнена, ответ берется из памяти
+        served = await queue.next_card(1)
+        queue.invalidate(1, served["concept_id"])
+        await asyncio.gather(*queue._tasks)
+        return served
+
+    served = asyncio.run(scenario())
+
+    assert served["concept_id"] == 1
+    assert fake_db.queries == 2
+    assert queue.refills == 1
+    # Отвеченная во время дозагрузки карточка не возвращается
+    assert [c.concept_id for c in queue.queues.get(1).heap] == [3]
+
+
+def test_users_are_evicted_by_card_budget(fake_db, fake_session):
+    queue = DueQueueService(size=10, max_cards=4, session_factory=fake_session)
+
+    async def scenario():
+        await queue.next_card(1)
+        await queue.next_card(2)
+
+    asyncio.run(scenario())
+
+    assert 1 not in queue.queues and 2 in queue.queues
+    assert queue.cards == 2 and queue.evictions == 1
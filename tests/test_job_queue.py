@@ -0,0 +1,165 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.repositories.concept_repository import ConceptRepository
+from app.services import job_queue
+from app.services.definition_jobs import (
+    DEFINE_CONCEPTS,
+    DefinitionsPending,
+    define_concepts,
+    definition_jobs,
+)
+from app.services.job_queue import JobWorker
+from app.services.prompt_generator import DEFAULT_DEFINITION
+
+
+class FakeJobRepository:
+    queue = None
+    completed = None
+    failed = None
+
+    def __init__(self, session):
+        pass
+
+    async def claim(self, kinds, worker, limit=1):
+        jobs = [job for job in self.queue if job.kind in kinds][:limit]
+        for job in jobs:
+            self.queue.remove(job)
+            job.attempts += 1
+        return jobs
+
+    async def complete(self, job_id):
+        self.completed.append(job_id)
+
+    async def fail(self, job_id, error, retry_in):
+        self.failed.append((job_id, retry_in))
+
+
+def test_definition_jobs_are_chunked_and_deduplicated():
+    jobs = definition_jobs([5, 1, 3, 1, 4, 2], size=2)
+
+    assert [job["payload"]["concept_ids"] for job in jobs] == [
+        [1, 2],
+        [3, 4],
+        [5],
+    ]
+    assert jobs[0]["kind"] == DEFINE_CONCEPTS
+    assert jobs[0]["dedupe_key"].startswith(f"{DEFINE_CONCEPTS}:")
+    assert jobs[0]["dedupe_key"] == definition_jobs([2, 1])[0]["dedupe_key"]
+    # Одинаковые концы, разные наборы - разные задачи
+    assert (
+        definition_jobs([1, 5])[0]["dedupe_key"]
+        != definition_jobs([1, 3, 5])[0]["dedupe_key"]
+    )
+
+
+def test_worker_completes_and_retries_with_backoff(monkeypatch, fake_session):
+    monkeypatch.setattr(job_queue, "JobRepository", FakeJobRepository)
+    FakeJobRepository.queue = [
+        SimpleNamespace(id=1, kind="ok", payload={"n": 1}, attempts=0),
+        SimpleNamespace(id=2, kind="broken", payload={}, attempts=2),
+    ]
+    FakeJobRepository.completed = []
+    FakeJobRepository.failed = []
+    seen = []
+
+    async def ok(payload):
+        seen.append(payload["n"])
+
+    async def broken(payload):
+        raise RuntimeError("upstream is down")
+
+    worker = JobWorker(
+        {"ok": ok, "broken": broken},
+        retry_base=10,
+        retry_max=25,
+        session_factory=fake_session,
+    )
+
+    async def drain():
+        return [await worker.run_once() for _ in range(3)]
+
+    assert asyncio.run(drain()) == [True, True, False]
+    assert seen == [1]
+    assert FakeJobRepository.completed == [1]
+    # Третья попытка: 10 * 2^2 = 40, но не больше retry_max
+    assert FakeJobRepository.failed == [(2, 25)]
+    assert worker.completed == 1 and worker.failed == 1
+    assert worker.retry_delay(1) == 10
+    assert worker.retry_delay(2) == 20
+
+
+def test_worker_retries_at_time_given_by_handler(monkeypatch, fake_session):
+    monkeypatch.setattr(job_queue, "JobRepository", FakeJobRepository)
+    FakeJobRepository.queue = [
+        SimpleNamespace(id=1, kind="pending", payload={}, attempts=0),
+    ]
+    FakeJobRepository.completed = []
+    FakeJobRepository.failed = []
+
+    async def pending(payload):
+        raise DefinitionsPending(
+            "1 of 1", retry_at=datetime.now(UTC) + timedelta(seconds=300)
+        )
+
+    worker = JobWorker(
+        {"pending": pending}, retry_base=10, session_factory=fake_session
+    )
+    asyncio.run(worker.run_once())
+
+    # Повтор не раньше, чем кэш определений разрешит новый запрос
+    [(job_id, delay)] = FakeJobRepository.failed
+    assert job_id == 1 and 290 < delay <= 300
+
+
+def test_define_concepts_does_not_hold_session_during_generation(
+    monkeypatch,
+):
+    stored = {
+        1: SimpleNamespace(id=1, name="нейрон", description=None),
+        2: SimpleNamespace(id=2, name="сеть", description=None),
+    }
+    sessions = {"open": 0, "opened": 0, "commits": 0}
+    retry_at = datetime(2025, 5, 1, tzinfo=UTC)
+
+    class Session:
+        async def commit(self):
+            sessions["commits"] += 1
+
+    @asynccontextmanager
+    async def session_factory():
+        sessions["open"] += 1
+        sessions["opened"] += 1
+        try:
+            yield Session()
+        finally:
+            sessions["open"] -= 1
+
+    async def get_undefined(self, concept_ids):
+        return [stored[i] for i in concept_ids if not stored[i].description]
+
+    async def generate(names):
+        assert sessions["open"] == 0
+        return {"нейрон": "Клетка", "сеть": DEFAULT_DEFINITION}
+
+    monkeypatch.setattr(ConceptRepository, "get_undefined", get_undefined)
+    prompt_service = SimpleNamespace(
+        generate_concept_definitions=generate,
+        cache=SimpleNamespace(retry_at=lambda names: retry_at),
+    )
+
+    with pytest.raises(DefinitionsPending) as error:
+        asyncio.run(
+            define_concepts(
+                {"concept_ids": [1, 2]}, prompt_service, session_factory
+            )
+        )
+
+    assert error.value.retry_at == retry_at
+    assert stored[1].description == "Клетка"
+    assert stored[2].description is None
+    assert sessions == {"open": 0, "opened": 2, "commits": 1}
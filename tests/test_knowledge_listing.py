@@ -0,0 +1,104 @@
+import asyncio
+import uuid
+from datetime import UTC, datetime
+
+import pytest
+from sqlalchemy.dialects.postgresql import asyncpg
+
+from app.repositories.user_knowledge_repository import (
+    UserKnowledgeRepository,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def sql(query) -> str:
+    return str(query.compile(dialect=asyncpg.dialect()))
+
+
+def test_cursor_round_trip():
+    moment = datetime(2025, 3, 1, 12, 30, tzinfo=UTC)
+
+    cursor = encode_cursor(moment, 42)
+
+    assert "=" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == (moment, 42)
+    assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_page_seeks_past_cursor_in_index_order():
+    class Session:
+        async def execute(self, query):
+            self.query = sql(query)
+            return self
+
+        def all(self):
+            return []
+
+    session = Session()
+    after = (datetime(2025, 3, 1, tzinfo=UTC), 42)
+
+    asyncio.run(
+        UserKnowledgeRepository(session).knowledge_page(
+            uuid.uuid4(), after, 50
+        )
+    )
+
+    assert (
+        "(user_knowledge.next_review, user_knowledge.concept_id) > "
+        in session.query
+    )
+    assert (
+        "ORDER BY user_knowledge.next_review, user_knowledge.concept_id"
+        in session.query
+    )
+    assert "OFFSET" not in session.query
+    assert "user_knowledge.next_review IS NULL" in session.query
+
+
+def test_page_after_unscheduled_card_stays_among_unscheduled():
+    class Session:
+        async def execute(self, query):
+            self.query = sql(query)
+            return self
+
+        def all(self):
+            return []
+
+    session = Session()
+
+    asyncio.run(
+        UserKnowledgeRepository(session).knowledge_page(
+            uuid.uuid4(), (None, 42), 50
+        )
+    )
+
+    assert "user_knowledge.next_review IS NULL" in session.query
+    assert "user_knowledge.concept_id > " in session.query
+    assert "IS NOT NULL" not in session.query
+
+
+def test_stream_reads_partitions_from_server_cursor():
+    class Result:
+        async def partitions(self):
+            yield [1, 2]
+            yield [3]
+
+    class Session:
+        async def stream(self, query):
+            self.options = query.get_execution_options()
+            return Result()
+
+    session = Session()
+    repo = UserKnowledgeRepository(session)
+
+    async def collect():
+        return [
+            rows
+            async for rows in repo.stream_knowledge(uuid.uuid4(), chunk_size=2)
+        ]
+
+    assert asyncio.run(collect()) == [[1, 2], [3]]
+    assert session.options["yield_per"] == 2
@@ -0,0 +1,200 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.concepts import PLACEHOLDER_DESCRIPTION
+from app.repositories.concept_repository import ConceptRepository
+from app.repositories.user_knowledge_repository import (
+    UserKnowledgeRepository,
+)
+from app.repositories.user_stats_repository import UserStatsRepository
+from app.services import knowledge_transfer
+from app.services.knowledge_transfer import (
+    ImportFormatError,
+    export_knowledge,
+    import_knowledge,
+    parse_records,
+)
+from app.services.text_processor import TextProcessorService
+
+MOMENT = datetime(2025, 5, 1, 9, 0, tzinfo=UTC)
+ROWS = [
+    ("нейрон", "Клетка,\nпередающая сигнал", 0.8, MOMENT, MOMENT),
+    ('сеть "LSTM"', None, 0.4, MOMENT, MOMENT),
+]
+
+
+def export(fmt: str) -> bytes:
+    class Session:
+        async def stream(self, query):
+            return self
+
+        async def partitions(self):
+            yield ROWS[:1]
+            yield ROWS[1:]
+
+    @asynccontextmanager
+    async def session_factory():
+        yield Session()
+
+    async def collect():
+        return [
+            chunk
+            async for chunk in export_knowledge(session_factory, "u", fmt)
+        ]
+
+    return "".join(asyncio.run(collect())).encode()
+
+
+def parse(data: bytes, fmt: str, chunk: int = 7) -> list:
+    async def chunks():
+        # Куски режут строки и многобайтные символы
+        for start in range(0, len(data), chunk):
+            yield data[start : start + chunk]
+
+    async def collect():
+        return [record async for record in parse_records(chunks(), fmt)]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl", "anki"])
+def test_export_parses_back(fmt):
+    records = parse(export(fmt), fmt)
+
+    assert [r["concept"] for _, r in records] == ["нейрон", 'сеть "LSTM"']
+    assert records[0][1]["definition"] == "Клетка,\nпередающая сигнал"
+    assert not records[1][1]["definition"]
+    if fmt != "anki":
+        assert float(records[0][1]["retention"]) == 0.8
+        assert records[0][1]["next_review"] == MOMENT.isoformat()
+
+
+def test_anki_export_has_import_header():
+    lines = export("anki").decode().splitlines()
+
+    assert lines[0] == "#separator:tab"
+    assert "#columns:Front\tBack" in lines
+    assert lines[-1] == '"сеть ""LSTM"""\t'
+
+
+def test_parse_reports_line_numbers():
+    with pytest.raises(ImportFormatError) as error:
+        parse(b'{"concept": "a"}\n\nnot json\n', "jsonl")
+    assert error.value.line == 3
+
+    with pytest.raises(ImportFormatError, match="missing concept"):
+        parse(b"name,definition\na,b\n", "csv")
+
+
+def test_import_loads_batches_and_recounts_stats(monkeypatch):
+    calls = {"concepts": [], "cards": [], "stats": [], "jobs": []}
+    threads = []
+
+    def canonicalize_batch(self, phrases):
+        threads.append(threading.get_ident())
+        return [phrase.upper() for phrase in phrases]
+
+    async def get_by_canonicals(self, names):
+        # BB уже создан через /add под другим именем
+        existing = SimpleNamespace(id=100, name="Bb", description="Есть")
+        return {"BB": existing} if "BB" in names else {}
+
+    async def bulk_upsert(self, rows):
+        calls["concepts"].append(rows)
+        return [
+            SimpleNamespace(
+                name=row["name"],
+                id=len(row["name"]),
+                description=row["description"],
+            )
+            for row in rows
+        ]
+
+    async def upsert_many(self, user_id, rows):
+        calls["cards"].append(rows)
+        return len(rows)
+
+    async def enqueue_definitions(session, concept_ids):
+        calls["jobs"].append(concept_ids)
+
+    async def source_stats(self, user_ids, today):
+        return {user_id: {"user_id": user_id} for user_id in user_ids}
+
+    async def replace(self, rows):
+        calls["stats"].append(rows)
+
+    monkeypatch.setattr(
+        TextProcessorService, "canonicalize_batch", canonicalize_batch
+    )
+    monkeypatch.setattr(
+        ConceptRepository, "get_by_canonicals", get_by_canonicals
+    )
+    monkeypatch.setattr(ConceptRepository, "bulk_upsert", bulk_upsert)
+    monkeypatch.setattr(UserKnowledgeRepository, "upsert_many", upsert_many)
+    monkeypatch.setattr(
+        knowledge_transfer, "enqueue_definitions", enqueue_definitions
+    )
+    monkeypatch.setattr(UserStatsRepository, "source_stats", source_stats)
+    monkeypatch.setattr(UserStatsRepository, "replace", replace)
+
+    data = (
+        "concept,definition,retention,next_review\n"
+        "a,,0.9,2025-06-01T00:00:00\n"
+        "bb,Определение,,\n"
+        "ccc,Свое,,\n"
+    ).encode()
+
+    async def chunks():
+        yield data
+
+    imported = asyncio.run(
+        import_knowledge(
+            None,
+            "u",
+            parse_records(chunks(), "csv"),
+            batch_size=2,
+            now=MOMENT,
+        )
+    )
+
+    assert imported == 3
+    assert [len(batch) for batch in calls["cards"]] == [2, 1]
+    first, second = calls["cards"][0]
+    assert first == {
+        "concept_id": 1,
+        "retention": 0.9,
+        "last_reviewed": MOMENT,
+        "next_review": datetime(2025, 6, 1, tzinfo=UTC),
+    }
+    assert second["retention"] == 0.5
+    assert second["concept_id"] == 100
+    assert calls["concepts"][0] == [
+        {
+            "name": "a",
+            "canonical_name": "A",
+            "domain_id": None,
+            "description": PLACEHOLDER_DESCRIPTION,
+        }
+    ]
+    assert calls["concepts"][1][0]["description"] == "Свое"
+    # Определение генерируется только для нового концепта без него
+    assert calls["jobs"] == [[1]]
+    assert calls["stats"] == [[{"user_id": "u"}]]
+    # spaCy работает вне потока event loop
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
+
+
+def test_import_rejects_invalid_retention():
+    async def chunks():
+        yield b"concept,retention\na,1.5\n"
+
+    with pytest.raises(ImportFormatError, match="line 2"):
+        asyncio.run(
+            import_knowledge(None, "u", parse_records(chunks(), "csv"))
+        )
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.repositories.base import GenericRepository
+from app.repositories.retention_log_repository import RetentionLogRepository
+from app.services.lambda_fitter import LambdaFitter, review_observations
+
+START = datetime(2025, 1, 1, tzinfo=UTC)
+
+
+def simulate_history(user_id, lambda_coef, cards, reviews, rng):
+    """Журнал ответов, где вспоминание следует кривой забывания"""
+    rows = []
+    for concept_id in range(cards):
+        retention = 0.5
+        moment = START
+        for _ in range(reviews):
+            days = rng.uniform(0.5, 6)
+            moment += timedelta(days=days)
+            recalled = rng.random() < retention * np.exp(-lambda_coef * days)
+            after = retention + (1 - retention) * 0.5 if recalled else 0.3
+            rows.append((user_id, concept_id, moment, retention, after))
+            retention = min(max(after, 0.1), 0.99)
+    return rows
+
+
+def test_review_observations_pair_consecutive_reviews():
+    rows = [
+        ("a", 1, START, 0.5, 0.8),
+        ("a", 1, START + timedelta(days=2), 0.8, 0.4),
+        ("a", 2, START + timedelta(days=3), 0.5, 0.9),
+        ("b", 2, START + timedelta(days=4), 0.5, 0.9),
+        ("b", 2, START + timedelta(days=5), 0.9, 0.95),
+    ]
+
+    users, prior, days, recalled = review_observations(rows)
+
+    assert users.tolist() == ["a", "b"]
+    assert prior.tolist() == [0.8, 0.9]
+    assert days.tolist() == [2.0, 1.0]
+    assert recalled.tolist() == [False, True]
+
+
+def test_fitter_recovers_lambda_across_chunks(monkeypatch, fake_session):
+    rng = np.random.default_rng(3)
+    history = simulate_history("a", 0.2, 40, 12, rng)
+    history += simulate_history("b", 0.7, 40, 12, rng)
+    history += simulate_history("c", 0.5, 1, 3, rng)
+    written = []
+
+    async def stream_history(self, chunk_size, after_user=None):
+        for start in range(0, len(history), chunk_size):
+            yield history[start : start + chunk_size]
+
+    async def update_from_values(self, columns, rows, keys=("id",), set_=None):
+        written.extend(rows)
+        return len(rows)
+
+    monkeypatch.setattr(
+        RetentionLogRepository, "stream_history", stream_history
+    )
+    monkeypatch.setattr(
+        GenericRepository, "update_from_values", update_from_values
+    )
+
+    fitter = LambdaFitter(
+        session_factory=fake_session, chunk_size=97, write_batch=1
+    )
+    stats = asyncio.run(fitter.run())
+
+    fitted = dict(written)
+    # У "c" слишком мало ответов для оценки
+    assert set(fitted) == {"a", "b"}
+    assert fitted["a"] == pytest.approx(0.2, abs=0.08)
+    assert fitted["b"] == pytest.approx(0.7, abs=0.15)
+    assert stats.rows == len(history)
+    assert stats.users == 3 and stats.fitted == 2
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import httpx
+
+from app.services.definition_cache import DefinitionCache
+from app.services.prompt_generator import (
+    DEFAULT_DEFINITION,
+    PromptService,
+    parse_definitions,
+)
+
+
+def make_service(monkeypatch, handler):
+    monkeypatch.setenv("DEEPSEEK_API_URL", "https://ai.test/chat")
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "key")
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return PromptService(client=client)
+
+
+def reply(content: str) -> httpx.Response:
+    return httpx.Response(
+        200, json={"choices": [{"message": {"content": content}}]}
+    )
+
+
+def test_parse_definitions_accepts_object_list_and_fences():
+    terms = ["Нейрон", "сеть"]
+
+    assert parse_definitions('{"нейрон": "Клетка.", "сеть": ""}', terms) == {
+        "Нейрон": "Клетка."
+    }
+    assert parse_definitions(
+        '```json\n[{"term": "Сеть", "definition": "Граф."}]\n```', terms
+    ) == {"сеть": "Граф."}
+    assert parse_definitions("не JSON", terms) == {}
+
+
+def test_batches_run_concurrently_with_fallback(monkeypatch):
+    state = {"active": 0, "peak": 0, "single": []}
+
+    async def handler(request):
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        if "Термины:" not in prompt:
+            state["single"].append(prompt)
+            return reply("Отдельное определение.")
+
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        terms = [
+            line[2:] for line in prompt.splitlines() if line.startswith("- ")
+        ]
+        # Модель "забывает" последний термин каждой пачки
+        return reply(json.dumps({t: f"Определение {t}." for t in terms[:-1]}))
+
+    service = make_service(monkeypatch, handler)
+    names = [f"термин{i}" for i in range(10)]
+
+    definitions = asyncio.run(
+        service.generate_concept_definitions(
+            names, batch_size=3, concurrency=2
+        )
+    )
+
+    assert set(definitions) == set(names)
+    assert definitions["термин0"] == "Определение термин0."
+    assert definitions["термин2"] == "Отдельное определение."
+    assert len(state["single"]) == 4
+    assert state["peak"] == 2
+
+
+def test_http_error_falls_back_to_default(monkeypatch):
+    service = make_service(monkeypatch, lambda request: httpx.Response(500))
+
+    definitions = asyncio.run(
+        service.generate_concept_definitions(["нейрон", "нейрон"])
+    )
+
+    assert definitions == {"нейрон": DEFAULT_DEFINITION}
+
+
+def no_database():
+    raise ConnectionError("database is not available")
+
+
+def test_definition_cache_coalesces_and_remembers_failures(monkeypatch):
+    calls = []
+
+    async def handler(request):
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        terms = [
+            line[2:] for line in prompt.splitlines() if line.startswith("- ")
+        ]
+        calls.append(terms)
+        await asyncio.sleep(0.01)
+        if "сбой" in terms:
+            return httpx.Response(503)
+        return reply(json.dumps({t: f"Определение {t}." for t in terms}))
+
+    cache = DefinitionCache("model", 1, session_factory=no_database)
+    service = make_service(monkeypatch, handler)
+    service.cache = cache
+
+    async def scenario():
+        first, second = await asyncio.gather(
+            service.generate_concept_definitions(["Нейрон", "синапс"]),
+            service.generate_concept_definitions(["нейрон"]),
+        )
+        again = await service.generate_concept_definitions(["синапс"])
+        failed = await service.generate_concept_definitions(["сбой"])
+        failed_again = await service.generate_concept_definitions(["сбой"])
+        return first, second, again, failed, failed_again
+
+    first, second, again, failed, failed_again = asyncio.run(scenario())
+
+    assert first["Нейрон"] == second["нейрон"] == "Определение Нейрон."
+    assert again == {"синапс": "Определение синапс."}
+    assert failed == failed_again == {"сбой": DEFAULT_DEFINITION}
+    # Повторный запрос после неудачи отложен, "нейрон" запрошен один раз
+    assert calls == [["Нейрон", "синапс"], ["сбой"]]
+    metrics = cache.metrics()
+    assert metrics["coalesced"] == 1
+    assert metrics["negative_hits"] == 1
+    assert metrics["failed"] == 1
@@ -0,0 +1,258 @@
+import asyncio
+import re
+import uuid
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.api import main
+from app.db import engine as db_engine
+from app.db.engine import DatabaseMetrics, EngineSettings
+from app.db.query_stats import query_budget, record_query, track_queries
+from app.services.due_queue import DueQueueService
+from app.utils.metrics import Histogram, histogram, serve
+
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(db_engine, "metrics", DatabaseMetrics())
+    engine = create_engine("sqlite://")
+    db_engine._install_query_hooks(
+        SimpleNamespace(sync_engine=engine),
+        EngineSettings(slow_query_ms=0),
+    )
+    return engine
+
+
+def run(engine, count):
+    with engine.connect() as conn:
+        for i in range(count):
+            conn.execute(text(f"SELECT {i}"))
+
+
+def test_query_budget_fails_with_statements(engine):
+    with query_budget(2) as stats:
+        run(engine, 2)
+    assert stats.queries == 2
+
+    with pytest.raises(AssertionError) as error, query_budget(2):
+        run(engine, 3)
+
+    assert "3 queries, budget 2" in str(error.value)
+    assert "3. SELECT 2" in str(error.value)
+
+
+def test_nested_tracking_counts_in_outer(engine):
+    with track_queries() as outer:
+        run(engine, 1)
+        with track_queries() as inner:
+            run(engine, 2)
+
+    assert inner.queries == 2 and outer.queries == 3
+    assert outer.seconds >= inner.seconds > 0
+    run(engine, 1)
+    assert outer.queries == 3
+
+
+def test_histogram_renders_cumulative_buckets():
+    metric = Histogram("db_queries", "Queries", (1, 5))
+    for value in (1, 3, 7):
+        metric.observe(value, handler="GET /a")
+    metric.observe(0, handler="GET /b")
+
+    lines = metric.render()
+
+    assert "# TYPE db_queries histogram" in lines
+    assert 'db_queries_bucket{handler="GET /a",le="1"} 1' in lines
+    assert 'db_queries_bucket{handler="GET /a",le="5"} 2' in lines
+    assert 'db_queries_bucket{handler="GET /a",le="+Inf"} 3' in lines
+    assert 'db_queries_sum{handler="GET /a"} 11' in lines
+    assert 'db_queries_count{handler="GET /b"} 1' in lines
+
+
+def test_metrics_server_renders_registry():
+    histogram("test_server_queries", "Queries", (1,)).observe(1)
+
+    async def scrape():
+        server = await serve(0, host="127.0.0.1")
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+        body = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return body.decode()
+
+    body = asyncio.run(scrape())
+
+    assert body.startswith("HTTP/1.1 200 OK")
+    assert "test_server_queries_count 1" in body
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+        self.rowcount = len(rows)
+
+    def scalar_one_or_none(self):
+        return self.rows[0] if self.rows else None
+
+    scalar = first = scalar_one_or_none
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+    async def partitions(self):
+        yield self.rows
+
+
+class RecordingSession:
+    """Сессия без БД: каждый запрос учитывается как выполненный.
+
+    Строки ответа берутся у первого шаблона routes, найденного в SQL.
+    """
+
+    def __init__(self, routes: list):
+        self.routes = routes
+        self.info = {}
+        self.pending = []
+
+    def _result(self, statement) -> Result:
+        sql = str(statement)
+        record_query(sql, 0.0)
+        for pattern, rows in self.routes:
+            if re.search(pattern, sql):
+                return Result(rows)
+        return Result([])
+
+    async def execute(self, statement, params=None):
+        return self._result(statement)
+
+    async def stream(self, statement):
+        # Как у настоящей БД, ответ приходит не сразу
+        await asyncio.sleep(0.01)
+        return self._result(statement)
+
+    def add(self, entity):
+        self.pending.append(entity)
+
+    async def flush(self):
+        for entity in self.pending:
+            record_query(f"INSERT INTO {entity.__tablename__}", 0.0)
+        self.pending = []
+
+    async def commit(self):
+        await self.flush()
+
+    async def rollback(self):
+        self.pending = []
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Клиент API, у которого все сессии - RecordingSession"""
+    moment = datetime.now(UTC)
+    user = SimpleNamespace(id=USER_ID, telegram_id=7, lambda_coef=0.5)
+    knowledge = SimpleNamespace(
+        user_id=USER_ID,
+        concept_id=1,
+        retention=0.6,
+        last_reviewed=moment - timedelta(days=2),
+        next_review=moment - timedelta(hours=1),
+    )
+    listed = SimpleNamespace(
+        concept_id=1, name="нейрон", retention=0.6, next_review=moment
+    )
+    routes = [
+        (r"FROM public.users\b", [user]),
+        (r"FROM public.user_stats\b", [USER_ID]),
+        (r"^SELECT user_knowledge.concept_id, public.concepts.name", [listed]),
+        (r"concepts.description", [(knowledge, "нейрон", "Клетка")]),
+        (r"FROM user_knowledge JOIN", [(knowledge, "нейрон")]),
+        (r"FROM user_knowledge\b", [knowledge]),
+    ]
+
+    @asynccontextmanager
+    async def session_factory():
+        yield RecordingSession(routes)
+
+    async def get_repos():
+        async with session_factory() as session:
+            yield {
+                "users": main.UserRepository(session),
+                "user_knowledge": main.UserKnowledgeRepository(session),
+                "retention_logs": main.RetentionLogRepository(session),
+                "user_stats": main.UserStatsRepository(session),
+            }
+
+    observed = []
+
+    def observe(route, stats):
+        observed.append((route, stats.queries))
+
+    monkeypatch.setattr(main, "Session", session_factory)
+    monkeypatch.setattr(
+        main, "due_queue", DueQueueService(session_factory=session_factory)
+    )
+    monkeypatch.setattr(main, "observe", observe)
+    monkeypatch.setitem(
+        main.app.dependency_overrides, main.get_repos, get_repos
+    )
+
+    async def request(method, url, budget, **kwargs):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://api"
+        ) as client:
+            with query_budget(budget):
+                response = await client.request(method, url, **kwargs)
+        assert response.status_code == 200, response.text
+        return response
+
+    return SimpleNamespace(
+        request=lambda *args, **kwargs: asyncio.run(request(*args, **kwargs)),
+        observed=observed,
+    )
+
+
+def test_knowledge_endpoint_query_budget(api):
+    api.request("GET", f"/knowledge/{USER_ID}", 2)
+
+    assert api.observed == [("GET /knowledge/{user_id}", 2)]
+
+
+def test_next_card_query_budget(api):
+    response = api.request("GET", "/next_card", 3, params={"user": 7})
+    # Следующая карточка берется из очереди в памяти
+    api.request("GET", "/next_card", 0, params={"user": 7})
+
+    assert response.json()["word"] == "нейрон"
+
+
+def test_review_query_budget(api):
+    api.request(
+        "POST",
+        "/review",
+        5,
+        json={"user": 7, "concept_id": 1, "quality": 0.8},
+    )
+
+
+def test_streamed_queries_are_counted_after_body(api):
+    response = api.request(
+        "GET", f"/knowledge/{USER_ID}", 1, params={"format": "ndjson"}
+    )
+
+    assert response.text.count("\n") == 1
+    # Запрос выполняется при отправке тела, уже после обработчика
+    assert api.observed == [("GET /knowledge/{user_id}", 1)]
@@ -0,0 +1,75 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+from app.repositories.retention_log_repository import RetentionLogRepository
+from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+
+
+class FakeResult:
+    def scalar(self):
+        return 7
+
+    def mappings(self):
+        return self
+
+    def one(self):
+        return {"total": 3, "reviews": 7}
+
+
+class FakeSession:
+    def __init__(self):
+        self.queries = []
+
+    async def execute(self, query):
+        self.queries.append(str(query.compile(dialect=postgresql.dialect())))
+        return FakeResult()
+
+
+END = datetime(2025, 1, 8)
+START = END - timedelta(days=7)
+
+
+def test_period_count_does_not_load_rows():
+    session = FakeSession()
+    count = asyncio.run(
+        RetentionLogRepository(session).count_by_user_and_period(
+            uuid.uuid4(), START, END
+        )
+    )
+
+    assert count == 7
+    assert len(session.queries) == 1
+    query = session.queries[0]
+    # Целые дни из свертки, края периода из журнала
+    assert "FROM retention_daily" in query
+    assert query.count("FROM retention_logs") == 2
+
+
+def test_short_period_counts_log_only():
+    session = FakeSession()
+    asyncio.run(
+        RetentionLogRepository(session).count_by_user_and_period(
+            uuid.uuid4(), END - timedelta(hours=6), END
+        )
+    )
+
+    assert session.queries[0].startswith("SELECT (SELECT count(*)")
+    assert "retention_daily" not in session.queries[0]
+
+
+def test_user_stats_is_a_single_statement():
+    session = FakeSession()
+    stats = asyncio.run(
+        UserKnowledgeRepository(session).stats_by_user(
+            uuid.uuid4(), START, END
+        )
+    )
+
+    assert stats == {"total": 3, "reviews": 7}
+    assert len(session.queries) == 1
+    query = session.queries[0]
+    assert query.count("FILTER (WHERE") == 3
+    assert "FROM retention_logs" in query
@@ -0,0 +1,258 @@
+import asyncio
+import gzip
+from datetime import UTC, date, datetime
+
+from app.db.partitions import (
+    PARTITION_MONTHS_AHEAD,
+    add_months,
+    create_partition_sql,
+    ensure_partitions,
+    partition_month,
+)
+from app.repositories.retention_daily_repository import (
+    RetentionDailyRepository,
+)
+from app.services.retention_logs import archive_partitions, maintain
+
+
+class Result:
+    rowcount = 1
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.value
+
+
+class Session:
+    def __init__(
+        self, partitioned=True, partitions=(), locks=None, stranded=()
+    ):
+        self.partitioned = partitioned
+        self.children = list(partitions)
+        # Месяцы строк в секции по умолчанию
+        self.stranded = list(stranded)
+        # Ответы pg_try_advisory_xact_lock по порядку, дальше True
+        self.locks = list(locks or [])
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, query, params=None):
+        sql = str(query)
+        self.statements.append(sql)
+        if "pg_partitioned_table" in sql:
+            return Result(self.partitioned)
+        if "pg_inherits" in sql:
+            return Result(self.children)
+        if "date_trunc" in sql:
+            return Result(self.stranded)
+        if "advisory" in sql:
+            return Result(self.locks.pop(0) if self.locks else True)
+        return Result(True)
+
+    async def stream(self, query):
+        return self
+
+    async def partitions(self):
+        yield [(1, "u", 2, 1.0, 1.1, 0.5, 0.9, "2024-01-05")]
+        yield [(2, "u", 3, 1.1, 1.2, 0.4, 0.8, "2024-01-06")]
+
+    async def commit(self):
+        self.commits += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def test_partition_bounds_are_utc_months():
+    assert add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert partition_month("retention_logs_p2025_12") == date(2025, 12, 1)
+    assert partition_month("retention_logs_default") is None
+    assert create_partition_sql(date(2025, 12, 1)) == (
+        "CREATE TABLE IF NOT EXISTS public.retention_logs_p2025_12 "
+        "PARTITION OF public.retention_logs FOR VALUES "
+        "FROM ('2025-12-01 00:00:00+00') TO ('2026-01-01 00:00:00+00')"
+    )
+
+
+def test_partitions_created_ahead_with_default():
+    session = Session()
+
+    names = asyncio.run(
+        ensure_partitions(session, date(2025, 11, 20), months_ahead=2)
+    )
+
+    assert names == [
+        "retention_logs_p2025_11",
+        "retention_logs_p2025_12",
+        "retention_logs_p2026_01",
+    ]
+    assert session.statements[-1].endswith(
+        "PARTITION OF public.retention_logs DEFAULT"
+    )
+    assert asyncio.run(ensure_partitions(Session(partitioned=False))) == []
+
+
+def test_rows_in_default_partition_are_moved_to_new_month():
+    session = Session(
+        partitions=["retention_logs_default", "retention_logs_p2025_11"],
+        stranded=[date(2025, 9, 1), date(2025, 12, 1)],
+    )
+
+    names = asyncio.run(
+        ensure_partitions(session, date(2025, 11, 20), months_ahead=1)
+    )
+
+    assert names == [
+        "retention_logs_p2025_09",
+        "retention_logs_p2025_11",
+        "retention_logs_p2025_12",
+    ]
+    ddl = [
+        sql
+        for sql in session.statements
+        if sql.startswith(("ALTER", "CREATE", "INSERT", "DELETE"))
+    ]
+    december = (
+        "timestamp >= '2025-12-01 00:00:00+00' "
+        "AND timestamp < '2026-01-01 00:00:00+00'"
+    )
+    # Для каждого месяца: отсоединить DEFAULT, создать секцию,
+    # перенести строки и вернуть DEFAULT на место
+    assert ddl[5:10] == [
+        (
+            "ALTER TABLE public.retention_logs "
+            "DETACH PARTITION public.retention_logs_default"
+        ),
+        create_partition_sql(date(2025, 12, 1)),
+        (
+            "INSERT INTO public.retention_logs (id, user_id, concept_id, "
+            "old_lambda, new_lambda, retention_before, retention_after, "
+            "timestamp) SELECT id, user_id, concept_id, old_lambda, "
+            "new_lambda, retention_before, retention_after, timestamp "
+            f"FROM public.retention_logs_default WHERE {december}"
+        ),
+        f"DELETE FROM public.retention_logs_default WHERE {december}",
+        (
+            "ALTER TABLE public.retention_logs "
+            "ATTACH PARTITION public.retention_logs_default DEFAULT"
+        ),
+    ]
+    assert create_partition_sql(date(2025, 11, 1)) not in ddl
+
+
+def test_maintain_rolls_up_from_last_rolled_day(monkeypatch):
+    rolled = []
+
+    async def rolled_through(self):
+        return date(2025, 3, 2)
+
+    async def rollup(self, day):
+        rolled.append(day)
+        return 1
+
+    monkeypatch.setattr(
+        RetentionDailyRepository, "rolled_through", rolled_through
+    )
+    monkeypatch.setattr(RetentionDailyRepository, "rollup", rollup)
+    session = Session()
+
+    result = asyncio.run(maintain(lambda: session, date(2025, 3, 5)))
+
+    # Последний свернутый день пересчитывается, сегодняшний еще нет
+    assert rolled == [date(2025, 3, 2), date(2025, 3, 3), date(2025, 3, 4)]
+    assert session.commits == 4
+    assert len(result.partitions) == 1 + PARTITION_MONTHS_AHEAD
+    # Блокировка берется в каждой транзакции, commit ее снимает
+    assert sum("advisory" in sql for sql in session.statements) == 4
+
+
+def test_maintain_stops_when_lock_is_taken(monkeypatch):
+    rolled = []
+
+    async def rolled_through(self):
+        return date(2025, 3, 2)
+
+    async def rollup(self, day):
+        rolled.append(day)
+        return 1
+
+    monkeypatch.setattr(
+        RetentionDailyRepository, "rolled_through", rolled_through
+    )
+    monkeypatch.setattr(RetentionDailyRepository, "rollup", rollup)
+
+    busy = Session(locks=[False])
+    assert (
+        asyncio.run(maintain(lambda: busy, date(2025, 3, 5))).partitions == []
+    )
+    assert busy.commits == 0
+
+    # Другой процесс перехватил свертку после первого дня
+    session = Session(locks=[True, True, False])
+    result = asyncio.run(maintain(lambda: session, date(2025, 3, 5)))
+
+    assert rolled == result.rolled_up == [date(2025, 3, 2)]
+
+
+def test_archive_exports_rolled_up_partitions(monkeypatch, tmp_path):
+    async def rolled_through(self):
+        return date(2024, 2, 29)
+
+    monkeypatch.setattr(
+        RetentionDailyRepository, "rolled_through", rolled_through
+    )
+    session = Session(
+        partitions=[
+            "retention_logs_default",
+            "retention_logs_p2024_01",
+            "retention_logs_p2024_02",
+            "retention_logs_p2024_03",
+        ]
+    )
+
+    archived = asyncio.run(
+        archive_partitions(
+            date(2024, 4, 1), tmp_path, session_factory=lambda: session
+        )
+    )
+
+    # Март еще не свернут до конца
+    assert archived == ["retention_logs_p2024_01", "retention_logs_p2024_02"]
+    with gzip.open(tmp_path / "retention_logs_p2024_01.csv.gz", "rt") as f:
+        lines = f.read().splitlines()
+    assert lines[0].startswith("id,user_id,concept_id")
+    assert len(lines) == 3
+    assert (
+        "ALTER TABLE public.retention_logs DETACH PARTITION "
+        "public.retention_logs_p2024_02" in session.statements
+    )
+    assert not any(s.startswith("DROP") for s in session.statements)
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def test_rollup_day_is_utc_window():
+    class Recorder(Session):
+        async def execute(self, query, params=None):
+            self.query = query.compile()
+            self.rowcount = 0
+            return self
+
+    session = Recorder()
+
+    asyncio.run(RetentionDailyRepository(session).rollup(date(2025, 1, 2)))
+
+    params = session.query.params
+    assert "ON CONFLICT (user_id, day) DO UPDATE" in str(session.query)
+    assert datetime(2025, 1, 2, tzinfo=UTC) in params.values()
+    assert datetime(2025, 1, 3, tzinfo=UTC) in params.values()
@@ -0,0 +1,45 @@
+import asyncio
+from datetime import UTC, date, datetime, timedelta
+
+from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+from app.services.review_forecast import ReviewForecastService, fill_days
+
+
+def test_fill_days_adds_empty_days():
+    start = date(2025, 1, 1)
+    rows = [(datetime(2025, 1, 1), 4), (datetime(2025, 1, 3), 2)]
+
+    days = fill_days(rows, start, 4)
+
+    assert [d["reviews"] for d in days] == [4, 0, 2, 0]
+    assert days[-1]["date"] == date(2025, 1, 4)
+
+
+def test_user_forecast_is_cached_until_review(monkeypatch, fake_session):
+    calls = []
+
+    async def review_forecast(self, days, user_id=None, now=None):
+        calls.append(user_id)
+        today = datetime.now(UTC).replace(tzinfo=None)
+        return [(today, 3), (today + timedelta(days=1), len(calls))]
+
+    monkeypatch.setattr(
+        UserKnowledgeRepository, "review_forecast", review_forecast
+    )
+    forecast = ReviewForecastService(days=7, session_factory=fake_session)
+
+    async def scenario():
+        first = await forecast.for_user("u")
+        cached = await forecast.for_user("u")
+        forecast.invalidate("u")
+        fresh = await forecast.for_user("u")
+        system = await forecast.system()
+        return first, cached, fresh, system
+
+    first, cached, fresh, system = asyncio.run(scenario())
+
+    assert cached is first
+    assert first["total"] == 4 and fresh["total"] == 5
+    assert len(fresh["days"]) == 7
+    assert calls == ["u", "u", None]
+    assert system is forecast.global_forecast
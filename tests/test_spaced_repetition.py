@@ -0,0 +1,205 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.repositories.base import GenericRepository
+from app.repositories.retention_log_repository import RetentionLogRepository
+from app.repositories.user_knowledge_repository import UserKnowledgeRepository
+from app.repositories.user_stats_repository import (
+    UserStatsRepository,
+    merge_deltas,
+)
+from app.services.spaced_repetition import SpacedRepetitionService
+from app.services.srs_batch import SpacedRepetitionBatch, _rank_within
+from app.services.srs_simulation import (
+    SimulationConfig,
+    simulate,
+)
+
+
+def scalar_update(retention, lambda_coef, quality):
+    user = SimpleNamespace(id="u", lambda_coef=lambda_coef)
+    knowledge = SimpleNamespace(concept_id=1, retention=retention)
+    user, knowledge, log = SpacedRepetitionService.update_knowledge(
+        user, knowledge, quality
+    )
+    interval = (knowledge.next_review - knowledge.last_reviewed).days
+    return user.lambda_coef, knowledge.retention, interval, log
+
+
+def test_batch_matches_scalar_rules():
+    rng = np.random.default_rng(7)
+    retention = rng.uniform(0.1, 0.99, 500)
+    lambda_coef = rng.uniform(0.1, 0.9, 500)
+    quality = rng.uniform(0, 1, 500)
+
+    update = SpacedRepetitionService.update_batch(
+        retention, lambda_coef, quality
+    )
+
+    for i in range(500):
+        new_lambda, new_retention, interval, log = scalar_update(
+            retention[i], lambda_coef[i], quality[i]
+        )
+        assert update.lambda_coef[i] == pytest.approx(new_lambda)
+        assert update.retention[i] == pytest.approx(new_retention)
+        assert update.interval_days[i] == interval
+        assert update.raw_lambda[i] == pytest.approx(log.new_lambda)
+        assert update.raw_retention[i] == pytest.approx(log.retention_after)
+
+
+def test_rank_within_groups():
+    codes = np.array([2, 0, 2, 1, 0, 2])
+
+    assert _rank_within(codes).tolist() == [0, 0, 1, 0, 1, 2]
+
+
+def test_apply_reviews_is_sequential_per_user(monkeypatch, fake_session):
+    states = {("a", 1): 0.5, ("a", 2): 0.3, ("b", 1): 0.9}
+    lambdas = {"a": 0.5, "b": 0.2}
+    written = {}
+
+    async def get_review_states(self, pairs):
+        return [
+            (u, c, states[u, c], lambdas[u])
+            for u, c in pairs
+            if (u, c) in states
+        ]
+
+    async def update_from_values(self, columns, rows, keys=("id",), set_=None):
+        written.setdefault(columns[-1], []).extend(rows)
+        return len(rows)
+
+    async def add_many(self, rows):
+        written["logs"] = rows
+        return len(rows)
+
+    monkeypatch.setattr(
+        UserKnowledgeRepository, "get_review_states", get_review_states
+    )
+    monkeypatch.setattr(
+        GenericRepository, "update_from_values", update_from_values
+    )
+
+    async def apply_stats(self, deltas, day):
+        written["stats"] = merge_deltas(deltas)
+
+    monkeypatch.setattr(RetentionLogRepository, "add_many", add_many)
+    monkeypatch.setattr(UserStatsRepository, "apply", apply_stats)
+
+    reviews = [
+        ("a", 1, 0.9),
+        ("b", 1, 0.1),
+        ("a", 2, 0.2),
+        ("a", 1, 0.8),
+        ("c", 5, 1.0),
+    ]
+    batch = SpacedRepetitionBatch(session_factory=fake_session)
+    stats = asyncio.run(batch.apply_reviews(reviews, datetime(2025, 1, 1)))
+
+    # Эталон: те же ответы по одному через update_knowledge
+    expected_lambda = dict(lambdas)
+    expected_retention = dict(states)
+    for user_id, concept_id, quality in reviews[:4]:
+        new_lambda, new_retention, _, _ = scalar_update(
+            expected_retention[user_id, concept_id],
+            expected_lambda[user_id],
+            quality,
+        )
+        expected_lambda[user_id] = new_lambda
+        expected_retention[user_id, concept_id] = new_retention
+
+    assert stats.rows == 4 and stats.skipped == 1
+    assert stats.rows_per_second > 0
+    assert {u: lam for u, lam in written["lambda_coef"]} == pytest.approx(
+        expected_lambda
+    )
+    assert {
+        (u, c): r for u, c, r, _, _ in written["next_review"]
+    } == pytest.approx(expected_retention)
+    timestamps = [
+        (r["user_id"], r["concept_id"], r["timestamp"])
+        for r in written["logs"]
+    ]
+    assert len(set(timestamps)) == 4
+    stats = {delta["user_id"]: delta for delta in written["stats"]}
+    assert stats["a"]["reviews"] == 3 and stats["b"]["reviews"] == 1
+    assert stats["a"]["total_cards"] == 0
+    assert stats["a"]["retention_sum"] == pytest.approx(
+        expected_retention["a", 1]
+        + expected_retention["a", 2]
+        - states["a", 1]
+        - states["a", 2]
+    )
+
+
+def test_predicted_retention_decays_with_lambda():
+    predicted = SpacedRepetitionService.predicted_retention(
+        [0.8, 0.8, 0.8, 0.8], [0.5, 0.5, 0.2, 0.5], [0, 2, 2, -1]
+    )
+
+    assert predicted[0] == pytest.approx(0.8)
+    assert predicted[1] == pytest.approx(0.8 * np.exp(-1.0))
+    # У пользователя с меньшим lambda_coef карточка забывается медленнее
+    assert predicted[2] > predicted[1]
+    assert predicted[3] == pytest.approx(0.8)
+
+
+def test_due_queue_is_topped_up_with_upcoming_cards():
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def all(self):
+            return self.rows
+
+    class Session:
+        def __init__(self):
+            self.queries = []
+
+        async def execute(self, query):
+            self.queries.append(str(query))
+            return Result(["due"] if len(self.queries) == 1 else ["next"])
+
+    session = Session()
+    repo = UserKnowledgeRepository(session)
+    items = asyncio.run(repo.get_by_user_with_concepts("u", limit=3))
+
+    assert items == ["due", "next"]
+    assert "exp(" in session.queries[0]
+    # Карточка без next_review считается наступившей
+    assert "user_knowledge.next_review IS NULL" in session.queries[0]
+    assert "ORDER BY user_knowledge.next_review" in session.queries[1]
+
+
+def test_simulation_is_reproducible():
+    config = SimulationConfig(
+        users=50, cards_per_user=10, new_cards_per_day=2, days=60, seed=1
+    )
+
+    report = simulate(config)
+    again = simulate(config)
+
+    assert len(report.daily_reviews) == 60
+    assert report.daily_reviews == again.daily_reviews
+    assert report.reviews == sum(report.daily_reviews)
+    # В первый день доступны только первые две карточки пользователя
+    assert report.daily_reviews[0] == 100
+    assert 0.1 <= report.retention["p10"] <= report.retention["p90"] <= 0.99
+    assert report.as_dict()["daily_load"]["max"] == max(report.daily_reviews)
+
+
+def test_update_knowledge_uses_given_time():
+    moment = datetime(2025, 6, 1, tzinfo=UTC)
+    user = SimpleNamespace(id="u", lambda_coef=0.5)
+    knowledge = SimpleNamespace(concept_id=1, retention=0.5)
+
+    _, knowledge, _ = SpacedRepetitionService.update_knowledge(
+        user, knowledge, 1.0, now=moment
+    )
+
+    assert knowledge.last_reviewed == moment
+    assert knowledge.next_review == moment + timedelta(days=2)
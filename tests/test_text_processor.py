@@ -0,0 +1,312 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc
+
+from app.repositories.concept_repository import ConceptRepository
+from app.repositories.extraction_cache_repository import (
+    ExtractionCacheRepository,
+)
+from app.repositories.user_knowledge_repository import (
+    UserKnowledgeRepository,
+)
+from app.repositories.user_stats_repository import UserStatsRepository
+from app.services import nlp_loader
+from app.services.concept_extractor import get_extractor
+from app.services.extraction_cache import ExtractionCache
+from app.services.text_processor import TextProcessorService
+from app.utils.cache import LRUCache
+
+POS = {
+    "нейронная": "ADJ",
+    "нейронной": "ADJ",
+    "глубокая": "ADJ",
+    "сверточная": "ADJ",
+    "сеть": "NOUN",
+    "сети": "NOUN",
+    "обучение": "NOUN",
+    "данные": "NOUN",
+    "модель": "NOUN",
+}
+LEMMAS = {
+    "нейронная": "нейронный",
+    "нейронной": "нейронный",
+    "сети": "сеть",
+}
+
+
+@Language.component("test_pos_lookup")
+def pos_lookup(doc):
+    for token in doc:
+        token.pos_ = POS.get(token.text.lower(), "X")
+        token.lemma_ = LEMMAS.get(token.text.lower(), token.text.lower())
+    return doc
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    nlp = spacy.blank("ru")
+    nlp.add_pipe("test_pos_lookup")
+    monkeypatch.setattr(nlp_loader.model_manager, "nlp", nlp)
+    return TextProcessorService(batch_size=2)
+
+
+def test_extracts_nouns_and_adjective_phrases(processor):
+    (concepts,) = processor.extract_concepts_batch(
+        ["Нейронная сеть требует обучение."]
+    )
+
+    assert "требует" not in concepts
+    assert concepts["нейронный сеть"] == "нейронная сеть"
+    assert concepts["обучение"] == "обучение"
+
+
+def test_batch_keeps_results_per_text(processor):
+    texts = [
+        "Глубокая сверточная сеть. Модель видит данные.",
+        "",
+        "Обучение модель.",
+    ]
+
+    results = processor.extract_concepts_batch(texts)
+
+    assert len(results) == 3
+    assert "глубокая сверточная сеть" in results[0]
+    assert {"модель", "данные"} <= results[0].keys()
+    assert results[1] == {}
+    assert results[2].keys() == {"обучение", "модель"}
+
+
+def test_batch_reports_stage_stats(processor):
+    processor.extract_concepts_batch(["Модель. Данные. Обучение."] * 3)
+
+    stats = processor.last_stats
+    assert stats.texts == 3
+    assert stats.sentences == 9
+    assert stats.total_seconds >= stats.nlp_seconds
+    assert "sentences" in str(stats)
+
+
+def test_matcher_keeps_pos_of_repeated_surface_forms():
+    nlp = spacy.blank("ru")
+    doc = Doc(
+        nlp.vocab,
+        words=["Прочные", "стали", "быстро", "стали", "ржаветь"],
+        pos=["ADJ", "NOUN", "ADV", "VERB", "VERB"],
+    )
+
+    concepts = get_extractor(nlp).extract(doc)
+
+    assert set(concepts.values()) == {"прочные стали", "стали"}
+
+
+def test_entities_are_merged_and_extractor_is_cached():
+    nlp = spacy.blank("ru")
+    doc = Doc(
+        nlp.vocab,
+        words=["Яндекс", "Практикум", "и", "МГУ"],
+        pos=["X", "X", "CCONJ", "X"],
+        ents=["B-ORG", "I-ORG", "O", "B-ORG"],
+    )
+
+    assert get_extractor(nlp) is get_extractor(nlp)
+    assert get_extractor(nlp).extract(doc) == {
+        "яндекс практикум": "яндекс практикум"
+    }
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+
+def test_cached_sentences_skip_spacy(processor, monkeypatch):
+    def unavailable_db():
+        raise ConnectionError("db is down")
+
+    processor.cache = ExtractionCache(
+        "test_model@1.0", session_factory=unavailable_db
+    )
+    calls = []
+    original = processor.extract_concepts_batch
+
+    def counting_batch(texts, batch_size=None):
+        calls.append(list(texts))
+        return original(texts, batch_size)
+
+    monkeypatch.setattr(processor, "extract_concepts_batch", counting_batch)
+
+    first = asyncio.run(processor.extract_concepts(["Модель. Данные."]))
+    second = asyncio.run(
+        processor.extract_concepts(["Данные. Модель.", "Новая модель."])
+    )
+
+    assert first[0].keys() == {"модель", "данные"}
+    assert [r.keys() for r in second] == [{"модель", "данные"}, {"модель"}]
+    assert calls == [["Модель.", "Данные."], ["Новая модель."]]
+    assert processor.cache.metrics()["memory_hits"] == 2
+
+
+def test_cache_key_keeps_case():
+    cache = ExtractionCache("test_model@1.0")
+
+    # Разбор зависит от регистра: "Москва" - имя собственное
+    assert cache.key("Жители Москвы.") != cache.key("жители москвы.")
+    assert cache.key(" Жители\n Москвы. ") == cache.key("Жители Москвы.")
+    assert cache.key("Ёж") == cache.key("Е\u0308ж")
+
+
+def test_cache_read_touches_only_stale_rows():
+    now = datetime.now(UTC)
+
+    class Session:
+        def __init__(self, rows):
+            self.rows = rows
+            self.updates = []
+            self.commits = 0
+
+        async def execute(self, query):
+            if query.is_select:
+                return SimpleNamespace(all=lambda: self.rows)
+            self.updates.append(query.compile().params)
+
+        async def commit(self):
+            self.commits += 1
+
+    fresh = Session([("a", {"x": "x"}, now - timedelta(minutes=5))])
+    found = asyncio.run(ExtractionCacheRepository(fresh).get_many(["a"]))
+
+    assert found == {"a": {"x": "x"}}
+    assert (fresh.updates, fresh.commits) == ([], 0)
+
+    mixed = Session(
+        [
+            ("a", {}, now - timedelta(minutes=5)),
+            ("b", {}, now - timedelta(days=2)),
+        ]
+    )
+    asyncio.run(ExtractionCacheRepository(mixed).get_many(["a", "b"]))
+
+    assert mixed.commits == 1
+    assert list(mixed.updates[0].values()) == [["b"]]
+
+
+def test_inflected_forms_share_canonical_key(processor):
+    (concepts,) = processor.extract_concepts_batch(
+        ["Нейронная сеть. Свойства нейронной сети."]
+    )
+
+    assert concepts["нейронный сеть"] == "нейронная сеть"
+    assert processor.canonicalize_batch(["Нейронной  сети"]) == [
+        "нейронный сеть"
+    ]
+
+
+class CountingSession:
+    def __init__(self):
+        self.commits = 0
+
+    async def commit(self):
+        self.commits += 1
+
+
+def test_store_concepts_uses_bulk_queries(processor, monkeypatch):
+    described = SimpleNamespace(id=1, name="модель", description="Текст")
+    empty = SimpleNamespace(id=2, name="данные", description=None)
+    calls = {}
+
+    async def get_by_canonicals(self, names):
+        calls["lookup"] = dict(names)
+        return {"модель": described, "данные": empty}
+
+    async def bulk_upsert(self, rows):
+        calls["upsert"] = rows
+        return [
+            SimpleNamespace(
+                id=10 + i,
+                name=row["name"],
+                canonical_name=row["canonical_name"],
+                description=row["description"],
+            )
+            for i, row in enumerate(rows)
+        ]
+
+    async def bulk_add(self, user_id, concept_ids, **kwargs):
+        calls["linked"] = concept_ids
+        return len(concept_ids)
+
+    monkeypatch.setattr(
+        ConceptRepository, "get_by_canonicals", get_by_canonicals
+    )
+    monkeypatch.setattr(ConceptRepository, "bulk_upsert", bulk_upsert)
+
+    async def apply_stats(self, deltas, day):
+        calls["stats"] = deltas
+
+    monkeypatch.setattr(UserKnowledgeRepository, "bulk_add", bulk_add)
+    monkeypatch.setattr(UserStatsRepository, "apply", apply_stats)
+    session = CountingSession()
+
+    added = asyncio.run(
+        processor.store_concepts(
+            {
+                "модель": "модель",
+                "данные": "данные",
+                "нейронный сеть": "нейронная сеть",
+                "обучение": "обучение",
+                "": "",
+            },
+            user_id="user",
+            domain_id=3,
+            session=session,
+            custom_defs={"обучение": "Подбор параметров"},
+        )
+    )
+
+    assert "" not in calls["lookup"]
+    assert [row["name"] for row in calls["upsert"]] == [
+        "нейронная сеть",
+        "обучение",
+    ]
+    assert calls["upsert"][1]["description"] == "Подбор параметров"
+    assert calls["upsert"][0]["domain_id"] == 3
+    assert sorted(calls["linked"]) == [1, 2, 10, 11]
+    assert added == ["данные", "нейронная сеть", "обучение"]
+    assert session.commits == 1
+    assert calls["stats"][0]["total_cards"] == 4
+    assert calls["stats"][0]["added"] == 4
+
+
+def test_concept_relations_use_one_query(processor):
+    class Session:
+        def __init__(self):
+            self.queries = []
+
+        async def execute(self, query, params):
+            self.queries.append(params)
+            return SimpleNamespace(
+                all=lambda: [("сеть", "модель"), ("модель", "сеть")]
+            )
+
+    session = Session()
+    relations = asyncio.run(
+        processor.find_concept_relations(["сеть", "модель", "данные"], session)
+    )
+
+    assert session.queries == [{"names": ["сеть", "модель", "данные"]}]
+    assert relations == {
+        "сеть": ["модель"],
+        "модель": ["сеть"],
+        "данные": [],
+    }
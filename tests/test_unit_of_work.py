@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+
+import pytest
+
+from app.models.user_profile import UserProfile
+from app.models.users import User
+from app.repositories.profile_repository import ProfileRepository
+from app.repositories.unit_of_work import UnitOfWork
+from app.repositories.user_repository import UserRepository
+
+
+class FakeSession:
+    """Сессия, которая записывает вызовы и выдает id при flush"""
+
+    def __init__(self):
+        self.info = {}
+        self.calls = []
+        self.pending = []
+        self.ids = itertools.count(1)
+        self.closed = False
+
+    def add(self, entity):
+        self.pending.append(entity)
+
+    def add_all(self, entities):
+        self.pending.extend(entities)
+
+    def _assign_ids(self):
+        for entity in self.pending:
+            if getattr(entity, "id", None) is None:
+                entity.id = next(self.ids)
+        self.pending = []
+
+    async def flush(self):
+        self._assign_ids()
+        self.calls.append("flush")
+
+    async def commit(self):
+        self._assign_ids()
+        self.calls.append("commit")
+
+    async def refresh(self, entity):
+        self.calls.append("refresh")
+
+    async def rollback(self):
+        self.pending = []
+        self.calls.append("rollback")
+
+    async def close(self):
+        self.closed = True
+
+
+def test_unit_of_work_commits_once():
+    session = FakeSession()
+
+    async def register():
+        async with UnitOfWork(session) as uow:
+            user = await uow.repository(UserRepository).add(
+                User(telegram_id=1, email="a@b.c", hashed_password="x")
+            )
+            profile = await uow.repository(ProfileRepository).add(
+                UserProfile(user_id=user.id, username="a", email="a@b.c")
+            )
+            assert uow.repository(UserRepository) is uow.repository(
+                UserRepository
+            )
+        return user, profile
+
+    user, profile = asyncio.run(register())
+
+    # Ключ пользователя известен до фиксации и попадает в профиль
+    assert profile.user_id == user.id == 1
+    assert session.calls == ["flush", "flush", "commit"]
+    assert not session.info["deferred_commit"]
+
+
+def test_unit_of_work_rolls_back_on_error():
+    session = FakeSession()
+
+    async def failing():
+        async with UnitOfWork(session) as uow:
+            await uow.repository(UserRepository).add_many(
+                [User(telegram_id=i) for i in range(3)]
+            )
+            raise ValueError("profile failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(failing())
+
+    assert session.calls == ["flush", "rollback"]
+
+
+def test_unit_of_work_owns_session_from_factory():
+    session = FakeSession()
+
+    async def run():
+        async with UnitOfWork(session_factory=lambda: session) as uow:
+            await uow.repository(UserRepository).add(User(telegram_id=1))
+        return uow
+
+    uow = asyncio.run(run())
+
+    assert session.closed and uow.session is None
+    assert session.calls == ["flush", "commit"]
+
+
+def test_nested_unit_of_work_commits_at_outer_boundary():
+    session = FakeSession()
+
+    async def run():
+        async with UnitOfWork(session):
+            async with UnitOfWork(session) as inner:
+                await inner.repository(UserRepository).add(User())
+            assert session.calls == ["flush"]
+
+    asyncio.run(run())
+
+    assert session.calls == ["flush", "commit"]
+
+
+def test_repository_commits_without_unit_of_work():
+    session = FakeSession()
+    repo = UserRepository(session)
+
+    asyncio.run(repo.add(User()))
+    asyncio.run(repo.add_many([User(), User()]))
+
+    assert session.calls == ["commit", "refresh", "flush", "commit"]
@@ -0,0 +1,174 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.repositories.user_repository import UserRepository
+from app.repositories.user_stats_repository import (
+    UserStatsRepository,
+    merge_deltas,
+    review_delta,
+    shift_buckets,
+    stats_delta,
+)
+from app.services import user_stats
+from app.services.user_stats import reconcile_stats
+
+TODAY = date(2025, 1, 10)
+
+
+def test_deltas_follow_card_thresholds():
+    merged = merge_deltas(
+        [
+            stats_delta("u", 0.5, count=3, added=3),
+            review_delta("u", 0.4, 0.8),
+            stats_delta("u", 0.9, count=-1),
+        ]
+    )
+
+    assert merged == [
+        {
+            "user_id": "u",
+            "total_cards": 2,
+            "weak_cards": 2,
+            "strong_cards": 0,
+            "retention_sum": pytest.approx(1.5 + 0.4 - 0.9),
+            "reviews": 1,
+            "added": 3,
+        }
+    ]
+
+
+def test_shift_buckets_drops_old_days():
+    buckets = [5, 4, 3, 2, 1, 0, 7]
+
+    assert shift_buckets(buckets, TODAY, TODAY) == buckets
+    assert shift_buckets(buckets, date(2025, 1, 8), TODAY) == [
+        0,
+        0,
+        5,
+        4,
+        3,
+        2,
+        1,
+    ]
+    assert shift_buckets(buckets, date(2024, 12, 1), TODAY) == [0] * 7
+
+
+def stored(user_id, total, buckets, day):
+    return SimpleNamespace(
+        user_id=user_id,
+        total_cards=total,
+        weak_cards=0,
+        strong_cards=0,
+        retention_sum=0.5 * total,
+        review_buckets=buckets,
+        buckets_day=day,
+    )
+
+
+def test_reconcile_reports_and_fixes_drift(monkeypatch, fake_session):
+    replaced = []
+
+    async def ids_after(self, after_id=None, limit=1000):
+        users = ["a", "b", "c"]
+        start = 0 if after_id is None else users.index(after_id) + 1
+        return users[start : start + limit]
+
+    async def source_stats(self, user_ids, today):
+        return {
+            user_id: {
+                "user_id": user_id,
+                "total_cards": 2,
+                "weak_cards": 0,
+                "strong_cards": 0,
+                "retention_sum": 1.0,
+                "review_buckets": [0, 3, 0, 0, 0, 0, 0],
+                "buckets_day": today,
+            }
+            for user_id in user_ids
+        }
+
+    async def get_many(self, user_ids):
+        rows = {
+            # Совпадает: корзины сохранены днем раньше
+            "a": stored("a", 2, [3, 0, 0, 0, 0, 0, 0], date(2025, 1, 9)),
+            "b": stored("b", 5, [0, 3, 0, 0, 0, 0, 0], TODAY),
+        }
+        return [rows[u] for u in user_ids if u in rows]
+
+    async def replace(self, rows):
+        replaced.extend(row["user_id"] for row in rows)
+
+    monkeypatch.setattr(UserRepository, "ids_after", ids_after)
+    monkeypatch.setattr(UserStatsRepository, "source_stats", source_stats)
+    monkeypatch.setattr(UserStatsRepository, "get_many", get_many)
+    monkeypatch.setattr(UserStatsRepository, "replace", replace)
+    monkeypatch.setattr(user_stats, "today", lambda: TODAY)
+
+    drift = asyncio.run(
+        reconcile_stats(batch_size=2, session_factory=fake_session)
+    )
+
+    assert (drift.users, drift.drifted, drift.missing) == (3, 1, 1)
+    assert drift.fields == {"total_cards": 1, "retention_sum": 1}
+    assert replaced == ["b", "c"]
+
+
+def test_apply_seeds_existing_user_without_stats(monkeypatch):
+    class Result:
+        def __init__(self, values):
+            self.values = values
+
+        def scalars(self):
+            return self
+
+        def all(self):
+            return self.values
+
+    class Session:
+        def __init__(self):
+            self.statements = []
+
+        async def execute(self, query):
+            self.statements.append(query)
+            if len(self.statements) == 1:
+                return Result(["b"])  # строка счетчиков только у b
+            return Result(["a"])
+
+    async def source_stats(self, user_ids, today):
+        assert user_ids == ["a"]
+        return {
+            "a": {
+                "user_id": "a",
+                "total_cards": 4,
+                "weak_cards": 1,
+                "strong_cards": 2,
+                "retention_sum": 2.5,
+                "review_buckets": [1, 0, 0, 0, 0, 0, 0],
+                "buckets_day": today,
+            }
+        }
+
+    monkeypatch.setattr(UserStatsRepository, "source_stats", source_stats)
+    session = Session()
+
+    applied = asyncio.run(
+        UserStatsRepository(session).apply(
+            [stats_delta("a", 0.9, count=-1), stats_delta("b", 0.9, count=-1)],
+            TODAY,
+        )
+    )
+
+    assert applied == 2
+    seed, upsert = (
+        query.compile(dialect=postgresql.dialect()).params
+        for query in session.statements[1:]
+    )
+    # a получил пересчитанные счетчики, а не -1 карточку
+    assert (seed["user_id_m0"], seed["total_cards_m0"]) == ("a", 4)
+    assert "user_id_m1" not in seed
+    assert (upsert["user_id_m0"], upsert["total_cards_m0"]) == ("b", -1)
+    assert "user_id_m1" not in upsert